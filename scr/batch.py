@@ -0,0 +1,297 @@
+"""
+Solves a directory of instances in parallel, without the Streamlit app.
+
+Each instance is a locations CSV file with the same layout as data/locations_example.csv (the depot is the row whose
+place is 'depot' or, if there is none, the first row). The matrices can be given in a file with the same name ending
+with '_matrices.npy' (binary format, see nodes.matrix_io) or '_matrices.csv' (same layout as
+data/matrices_example.csv); otherwise they are estimated from the coordinates.
+
+Example:
+    python batch.py ../instances --vehicles 3 --max-travel-time 240 --time-limit 30 --workers 4 --output ../results
+"""
+
+# Import necessary libraries
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from nodes.decomposition import solve_decomposed
+from nodes.estimator import calibrate_estimator, estimate_matrices
+from nodes.feasibility import check_feasibility, drop_penalty
+from nodes.fleet import find_min_fleet
+from nodes.jobs import PORTFOLIO, solve_portfolio
+from nodes.matrix_io import load_matrices as load_matrices_npy
+from nodes.matrix_io import read_matrices_csv
+from nodes.solver import create_data_model, solve
+from nodes.tsp import solve_tsp
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+def load_matrices(path):
+
+    """
+    Reads the distance and time travel matrices from a binary .npy file or from a CSV file with the layout of
+    data/matrices_example.csv.
+
+    Parameters
+    ----------
+    path: str
+        Path of the matrices file
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    """
+
+    if path.endswith('.npy'):
+        return load_matrices_npy(path)
+
+    return read_matrices_csv(path)
+
+
+def load_locations(path):
+
+    """
+    Reads the locations of an instance, placing the depot first.
+
+    Parameters
+    ----------
+    path: str
+        Path of the locations CSV file
+
+    Returns
+    -------
+    locations: Pandas DataFrame
+        Dataframe containing the locations, with the depot in the first row
+    """
+
+    locations = pd.read_csv(path)
+    is_depot = locations['place'].astype(str).str.lower() == 'depot'
+
+    if is_depot.any():
+        locations = pd.concat([locations[is_depot], locations[~is_depot]])
+
+    return locations.reset_index(drop=True)
+
+
+def default_calibration():
+
+    """
+    Calibrates the estimator with the example data.
+
+    Returns
+    -------
+    calibration: dict
+        Calibration of the estimator (see nodes.estimator.calibrate_estimator)
+    """
+
+    locations = pd.read_csv(os.path.join(DATA_DIR, 'locations_example.csv'))
+    dist_matrix, time_matrix = load_matrices(os.path.join(DATA_DIR, 'matrices_example.npy'))
+
+    return calibrate_estimator(locations['lat'], locations['lon'], dist_matrix, time_matrix)
+
+
+def find_instances(directory):
+
+    """
+    Lists the instances of a directory.
+
+    Parameters
+    ----------
+    directory: str
+        Directory that contains the instances
+
+    Returns
+    -------
+    instances: list
+        List of (name, locations path, matrices path or None) tuples
+    """
+
+    instances = []
+
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.csv') or file_name.endswith('_matrices.csv'):
+            continue
+        name = file_name[:-len('.csv')]
+        matrices_paths = [os.path.join(directory, name + '_matrices' + extension) for extension in ('.npy', '.csv')]
+        instances.append((name, os.path.join(directory, file_name),
+                          next((path for path in matrices_paths if os.path.exists(path)), None)))
+
+    return instances
+
+
+def solve_instance(name, locations_path, matrices_path, options, calibration):
+
+    """
+    Solves one instance (runs in a worker process).
+
+    Parameters
+    ----------
+    name: str
+        Name of the instance
+    locations_path: str
+        Path of the locations CSV file
+    matrices_path: str
+        Path of the matrices CSV file or None to estimate the matrices
+    options: dict
+        Dictionary that contains the number of vehicles, the waiting time and the maximum travel time in minutes,
+        the time limit in seconds, the decomposition options (number of clusters, use of the region column and
+        time limit of the repair pass), the number of search strategies of the portfolio, whether the deliveries
+        that cannot be served can be left out and whether the smallest fleet is searched (with the number of
+        vehicles as the largest fleet)
+    calibration: dict
+        Calibration of the estimator
+
+    Returns
+    -------
+    result: dict
+        Solution of the instance (see nodes.solver.solve) with its name, the places and the solving time
+    """
+
+    start = time.perf_counter()
+    locations = load_locations(locations_path)
+
+    if matrices_path is not None:
+        dist_matrix, time_matrix = load_matrices(matrices_path)
+    else:
+        dist_matrix, time_matrix = estimate_matrices(locations['lat'], locations['lon'], calibration)
+
+    data = create_data_model(options['vehicles'], dist_matrix, time_matrix,
+                             drop_penalty(time_matrix) if options['allow_drops'] else None)
+
+    # The instances that are obviously impossible are not solved
+    report = check_feasibility(time_matrix, options['vehicles'], options['max_travel_time'])
+
+    if not report['feasible'] and not options['allow_drops']:
+        result = {'status': 'INFEASIBLE', 'objective': None, 'routes': None, 'route_times': None,
+                  'unreachable': report['unreachable'], 'min_vehicles': report['min_vehicles']}
+    elif options['min_fleet']:
+        # The fleet sizes are tried one after the other, since the instances already run in parallel
+        result = find_min_fleet(dist_matrix, time_matrix, options['waiting_stop'], options['max_travel_time'],
+                                options['vehicles'], time_limit=options['time_limit'] or 30, max_workers=1)
+    elif options['clusters'] or options['by_region']:
+        # The clusters are solved one after the other, since the instances already run in parallel
+        regions = list(locations['region']) if options['by_region'] else None
+        result = solve_decomposed(data, options['waiting_stop'], options['max_travel_time'],
+                                  list(locations['lat']), list(locations['lon']), regions=regions,
+                                  num_clusters=options['clusters'] or options['vehicles'],
+                                  repair_time_limit=options['repair_time_limit'], max_workers=1,
+                                  time_limit=options['time_limit'])
+    elif options['portfolio']:
+        result = solve_portfolio(data, options['waiting_stop'], options['max_travel_time'],
+                                 configurations=PORTFOLIO[:options['portfolio']], time_limit=options['time_limit'] or 60)
+    elif options['vehicles'] == 1 and not options['allow_drops']:
+        result = solve_tsp(data, options['max_travel_time'], time_limit=options['time_limit'])
+    else:
+        result = solve(data, options['waiting_stop'], options['max_travel_time'], time_limit=options['time_limit'])
+
+    result['name'] = name
+    result['places'] = list(locations['place'].astype(str))
+    result['seconds'] = time.perf_counter() - start
+
+    return result
+
+
+def write_result(result, output_dir):
+
+    """
+    Writes the routes and the travel time of each route of an instance.
+
+    Parameters
+    ----------
+    result: dict
+        Solution of the instance
+    output_dir: str
+        Directory where the results are written
+    """
+
+    with open(os.path.join(output_dir, result['name'] + '_routes.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['vehicle', 'route', 'places', 'route_time'])
+        for vehicle_id, route_each in (result['routes'] or {}).items():
+            writer.writerow([vehicle_id + 1, route_each, [result['places'][node] for node in route_each],
+                             result['route_times'][vehicle_id]])
+
+
+def main():
+
+    """
+    Reads the command-line arguments, solves all the instances in a process pool and writes the results.
+    """
+
+    parser = argparse.ArgumentParser(description='Solves a directory of route optimization instances in parallel.')
+    parser.add_argument('instances', help='directory that contains the locations CSV files')
+    parser.add_argument('--vehicles', type=int, default=2, help='number of vehicles (default: 2)')
+    parser.add_argument('--waiting-stop', type=int, default=15,
+                        help='maximum waiting time in each stop in minutes (default: 15)')
+    parser.add_argument('--max-travel-time', type=int, default=150,
+                        help='maximum travel time of each vehicle in minutes (default: 150)')
+    parser.add_argument('--time-limit', type=float, default=None, help='time limit of each solve in seconds')
+    parser.add_argument('--clusters', type=int, default=0,
+                        help='divides the deliveries into this number of geographic clusters solved separately')
+    parser.add_argument('--by-region', action='store_true',
+                        help="uses the 'region' column of the locations as the clusters")
+    parser.add_argument('--repair-time-limit', type=float, default=None,
+                        help='time limit in seconds of the pass over all the deliveries after solving the clusters')
+    parser.add_argument('--portfolio', type=int, default=0,
+                        help=f'runs this number of search strategies at the same time and keeps the best routes '
+                             f'(at most {len(PORTFOLIO)})')
+    # A single vehicle could leave out all the deliveries, so the smallest fleet is searched without drops
+    drops_or_fleet = parser.add_mutually_exclusive_group()
+    drops_or_fleet.add_argument('--allow-drops', action='store_true',
+                                help='leaves out the deliveries that cannot be served instead of failing the instance')
+    drops_or_fleet.add_argument('--min-fleet', action='store_true',
+                                help='finds the smallest number of vehicles with a feasible plan, up to --vehicles')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--output', default='results', help='directory where the results are written')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    options = {'vehicles': args.vehicles, 'waiting_stop': args.waiting_stop,
+               'max_travel_time': args.max_travel_time, 'time_limit': args.time_limit, 'clusters': args.clusters,
+               'by_region': args.by_region, 'repair_time_limit': args.repair_time_limit, 'portfolio': args.portfolio,
+               'allow_drops': args.allow_drops, 'min_fleet': args.min_fleet}
+    calibration = default_calibration()
+    instances = find_instances(args.instances)
+
+    summary = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(solve_instance, name, locations_path, matrices_path, options, calibration): name
+                   for name, locations_path, matrices_path in instances}
+
+        for future in as_completed(futures):
+            # An instance that fails (Example: a malformed CSV file) is recorded and the others go on
+            try:
+                result = future.result()
+            except Exception as error:
+                message = f'{type(error).__name__}: {error}'
+                summary.append([futures[future], 'ERROR', None, None, None, None, None, message])
+                print(f'{futures[future]}: ERROR ({message})')
+                continue
+
+            write_result(result, args.output)
+            max_route_time = max(result['route_times'].values()) if result['route_times'] else None
+            summary.append([result['name'], result['status'], result['objective'], max_route_time,
+                            round(result['seconds'], 3), result.get('configuration'), result.get('num_vehicles'),
+                            None])
+            print(f"{result['name']}: {result['status']} ({result['seconds']:.1f}s)")
+            if result['status'] == 'INFEASIBLE':
+                print(f"  unreachable deliveries: {result['unreachable']}, minimum vehicles: {result['min_vehicles']}")
+
+    with open(os.path.join(args.output, 'summary.csv'), 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'status', 'objective', 'max_route_time', 'seconds', 'configuration', 'vehicles',
+                         'error'])
+        writer.writerows(sorted(summary))
+
+
+if __name__ == '__main__':
+    main()
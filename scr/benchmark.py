@@ -0,0 +1,303 @@
+"""
+Measures how the app scales with the number of deliveries and vehicles.
+
+Reproducible synthetic instances are generated around the depot of data/locations_example.csv for each size and each
+stage of the app is timed: creation of the matrices (estimated from the coordinates, so no API key is needed), creation
+of the data model, creation of the routing model, search, printing of the solution and creation of the map. The
+objective value and the peak resident memory (which includes the memory of OR-Tools) are recorded as well, and the
+results are written to a JSON file that can be compared with the results of another version. Each case runs in its
+own process, so its peak memory does not include the previous cases.
+
+Example:
+    python benchmark.py --sizes 12 50 100 250 500 1000 --vehicles 2 5 10 --time-limit 30 --output ../benchmark.json
+    python benchmark.py --sizes 12 50 100 --vehicles 2 --baseline ../benchmark.json
+"""
+
+# Import necessary libraries
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from ortools import __version__ as ortools_version
+
+from batch import DATA_DIR, default_calibration
+from nodes.estimator import EARTH_RADIUS, estimate_matrices
+from nodes.map_render import build_large_map
+from nodes.pt_route_optimization import build_map, print_solution
+from nodes.solver import ROUTING_STATUS, build_model, create_data_model, create_search_parameters, extract_solution, \
+    solve_model
+from params import Params
+
+# Peak resident memory is only available on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Stages of the app, in order
+STAGES = ('matrices', 'data_model', 'model', 'solve', 'print_solution', 'map')
+
+
+def generate_instance(number_deliveries, seed=0, radius=10000):
+
+    """
+    Generates the locations of a synthetic instance, spread uniformly in a disk around the depot of the example.
+
+    Parameters
+    ----------
+    number_deliveries: int
+        Number of deliveries
+    seed: int
+        Seed of the random generator (the same seed and size always give the same instance)
+    radius: float
+        Radius of the disk in meters
+
+    Returns
+    -------
+    depot_address: dict
+        Data about the depot's location
+    deliveries_dict: dict
+        Data about the deliveries' locations
+    """
+
+    locations = pd.read_csv(os.path.join(DATA_DIR, 'locations_example.csv'))
+    depot = locations[locations['place'] == 'depot'].iloc[0]
+
+    rng = np.random.default_rng([seed, number_deliveries])
+    distances = radius * np.sqrt(rng.random(number_deliveries))
+    angles = 2 * np.pi * rng.random(number_deliveries)
+    lats = depot['lat'] + np.degrees(distances * np.sin(angles) / EARTH_RADIUS)
+    lons = depot['lon'] + np.degrees(distances * np.cos(angles) / EARTH_RADIUS / np.cos(np.radians(depot['lat'])))
+
+    depot_address = {'name': depot['name'], 'number': str(depot['number']), 'uf': depot['uf'], 'city': depot['city'],
+                     'lat_lon': depot['lat_lon'], 'lat': depot['lat'], 'lon': depot['lon']}
+    deliveries_dict = {index + 1: {'person': f'Entrega {index + 1}', 'name': 'Rua Sintética', 'number': str(index + 1),
+                                   'uf': depot['uf'], 'city': depot['city'], 'lat_lon': f'{lat:.7f},{lon:.7f}',
+                                   'lat': lat, 'lon': lon}
+                       for index, (lat, lon) in enumerate(zip(lats, lons))}
+
+    return depot_address, deliveries_dict
+
+
+@contextmanager
+def timed(timings, stage):
+
+    """
+    Measures the wall time of a stage.
+
+    Parameters
+    ----------
+    timings: dict
+        Dictionary where the time of the stage in seconds is stored
+    stage: str
+        Name of the stage
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+def peak_memory():
+
+    """
+    Reads the peak resident memory of this process.
+
+    Returns
+    -------
+    peak_memory: int
+        Peak resident memory in bytes (None if it is not available)
+    """
+
+    if resource is None:
+        return None
+
+    # Linux reports kilobytes and macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_case(number_deliveries, number_vehicles, options, calibration):
+
+    """
+    Runs all the stages of the app on a synthetic instance (in a process of its own, see main).
+
+    Parameters
+    ----------
+    number_deliveries: int
+        Number of deliveries
+    number_vehicles: int
+        Number of vehicles
+    options: dict
+        Dictionary that contains the waiting time and the maximum travel time in minutes, the time limit in seconds
+        and the seed of the instances
+    calibration: dict
+        Calibration of the estimator
+
+    Returns
+    -------
+    case: dict
+        Size of the instance, time of each stage in seconds, status, objective value and peak resident memory in bytes
+    """
+
+    depot_address, deliveries_dict = generate_instance(number_deliveries, options['seed'])
+    lats = [depot_address['lat']] + [each_address['lat'] for each_address in deliveries_dict.values()]
+    lons = [depot_address['lon']] + [each_address['lon'] for each_address in deliveries_dict.values()]
+    timings = {}
+
+    with timed(timings, 'matrices'):
+        dist_matrix, time_matrix = estimate_matrices(lats, lons, calibration)
+
+    with timed(timings, 'data_model'):
+        data = create_data_model(number_vehicles, dist_matrix, time_matrix)
+
+    with timed(timings, 'model'):
+        manager, routing = build_model(data, options['waiting_stop'], options['max_travel_time'])
+        search_parameters = create_search_parameters(time_limit=options['time_limit'])
+
+    with timed(timings, 'solve'):
+        solution = solve_model(manager, routing, search_parameters)
+
+    case = {'deliveries': number_deliveries,
+            'vehicles': number_vehicles,
+            'status': ROUTING_STATUS.get(routing.status(), str(routing.status())),
+            'objective': solution.ObjectiveValue() if solution else None}
+
+    routes_all = None
+    if solution:
+        routes_all, route_times = extract_solution(data, manager, routing, solution)
+        with timed(timings, 'print_solution'):
+            print_solution({'routes': routes_all, 'route_times': route_times})
+
+    # Same map as the app: clustered markers and simplified lines above the threshold
+    with timed(timings, 'map'):
+        if number_deliveries > Params.large_map_threshold:
+            map_solution = build_large_map(depot_address, deliveries_dict, routes_all, Params.map_line_tolerance)
+        else:
+            map_solution = build_map(depot_address, deliveries_dict, routes_all)
+        map_solution.get_root().render()
+
+    case['peak_memory'] = peak_memory()
+
+    case['seconds'] = {stage: round(timings[stage], 6) for stage in STAGES if stage in timings}
+    case['total_seconds'] = round(sum(timings.values()), 6)
+
+    return case
+
+
+def environment():
+
+    """
+    Describes the version of the code and the machine, so that results of different runs can be compared.
+
+    Returns
+    -------
+    environment: dict
+        Commit, versions of Python and OR-Tools, machine and number of CPUs
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {'commit': commit,
+            'python': platform.python_version(),
+            'ortools': ortools_version,
+            'machine': platform.platform(),
+            'cpus': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline):
+
+    """
+    Prints the ratio between the times and the objective values of two runs for the cases they have in common.
+
+    Parameters
+    ----------
+    results: list
+        Cases of the current run
+    baseline: list
+        Cases of the previous run
+    """
+
+    previous = {(case['deliveries'], case['vehicles']): case for case in baseline}
+
+    for case in results:
+        old = previous.get((case['deliveries'], case['vehicles']))
+        if old is None:
+            continue
+        ratios = ' '.join(f"{stage}={case['seconds'][stage] / old['seconds'][stage]:.2f}x"
+                          for stage in STAGES if old['seconds'].get(stage) and stage in case['seconds'])
+        objective = f"{case['objective'] / old['objective']:.3f}x" if case['objective'] and old['objective'] else '-'
+        print(f"{case['deliveries']:>5} deliveries {case['vehicles']:>3} vehicles: objective={objective} {ratios}")
+
+
+def main():
+
+    """
+    Reads the command-line arguments, runs every combination of size and number of vehicles and writes the results.
+    """
+
+    parser = argparse.ArgumentParser(description='Measures the time and memory of each stage of the route '
+                                                 'optimization on synthetic instances.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[12, 50, 100, 250, 500, 1000],
+                        help='numbers of deliveries (default: 12 50 100 250 500 1000)')
+    parser.add_argument('--vehicles', type=int, nargs='+', default=[2, 5, 10],
+                        help='numbers of vehicles (default: 2 5 10)')
+    parser.add_argument('--waiting-stop', type=int, default=15,
+                        help='maximum waiting time in each stop in minutes (default: 15)')
+    parser.add_argument('--max-travel-time', type=int, default=1440,
+                        help='maximum travel time of each vehicle in minutes (default: 1440, so that the largest '
+                             'instances are feasible)')
+    parser.add_argument('--time-limit', type=float, default=30, help='time limit of each solve in seconds')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic instances (default: 0)')
+    parser.add_argument('--output', default='benchmark.json', help='JSON file where the results are written')
+    parser.add_argument('--baseline', default=None, help='JSON file of a previous run to compare with')
+    args = parser.parse_args()
+
+    options = {'waiting_stop': args.waiting_stop, 'max_travel_time': args.max_travel_time,
+               'time_limit': args.time_limit, 'seed': args.seed}
+    calibration = default_calibration()
+
+    # The baseline is read first, since the output may be the same file
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+
+    results = []
+    for number_deliveries in args.sizes:
+        for number_vehicles in args.vehicles:
+            # A new process for each case, so that the peak memory is the case's own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                case = executor.submit(run_case, number_deliveries, number_vehicles, options, calibration).result()
+            results.append(case)
+            peak = f"{case['peak_memory'] / 2 ** 20:.1f}MiB" if case['peak_memory'] is not None else '-'
+            print(f"{number_deliveries:>5} deliveries {number_vehicles:>3} vehicles: {case['status']} "
+                  f"objective={case['objective']} total={case['total_seconds']:.2f}s "
+                  f"solve={case['seconds']['solve']:.2f}s peak={peak}")
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({'environment': environment(), 'options': options, 'results': results}, file, indent=2)
+
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,5 +10,4 @@ if __name__ == '__main__':
     # english = st.sidebar.checkbox(label='Change the language to English')
 
     depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example = opt_setup(params)
-    route_opt(depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example,
-              params.matrices_example)
+    route_opt(depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example, params)
@@ -0,0 +1,261 @@
+# Import necessary libraries
+import io
+from itertools import islice
+
+import pandas as pd
+
+from nodes.geocoding import split_coordinates
+
+# Columns of a deliveries file (the same as data/locations_example.csv; 'place' is accepted as the person's name)
+COLUMNS = ('person', 'name', 'number', 'uf', 'city', 'lat_lon', 'lat', 'lon')
+COLUMN_ALIASES = {'place': 'person'}
+
+
+def example_key(address_dict):
+
+    """
+    Builds the key used to check if an address is the same as one of the example.
+
+    Parameters
+    ----------
+    address_dict: dict
+        Dictionary that contains the data about a location
+
+    Returns
+    -------
+    key: tuple
+        Tuple with the street, the number, the state and the city, in lower case
+    """
+
+    return (str(address_dict['name']).strip().lower(), str(address_dict['number']).strip(),
+            str(address_dict['uf']).strip().lower(), str(address_dict['city']).strip().lower())
+
+
+def build_example_index(locations):
+
+    """
+    Indexes the locations of the example, so that the default values and the example check are dictionary lookups
+    instead of scans of the dataframe.
+
+    Parameters
+    ----------
+    locations: Pandas DataFrame
+        Locations of the example (the depot in the first row)
+
+    Returns
+    -------
+    index: dict
+        Dictionary with the rows of the example as dictionaries ('rows') and the position of each address
+        ('positions', keyed by example_key)
+    """
+
+    rows = locations.to_dict('records')
+    positions = {example_key(row): position for position, row in enumerate(rows)}
+
+    return {'rows': rows, 'positions': positions}
+
+
+def read_rows(content, chunk_size=500):
+
+    """
+    Reads the rows of a CSV or XLSX file in chunks, so that large files are never held as a whole in a dataframe.
+
+    Parameters
+    ----------
+    content: bytes
+        Content of the file (XLSX files are recognized by their signature)
+    chunk_size: int
+        Number of rows of each chunk
+
+    Yields
+    ------
+    rows: list
+        List of dictionaries that map each column name to the value of the row
+    """
+
+    if content[:2] == b'PK':
+        # XLSX files are zip archives; openpyxl is only needed to import them
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            values = workbook.active.iter_rows(values_only=True)
+            header = [str(column) if column is not None else '' for column in next(values, [])]
+            while True:
+                chunk = list(islice(values, chunk_size))
+                if not chunk:
+                    break
+                yield [{column: value for column, value in zip(header, row)} for row in chunk]
+        finally:
+            workbook.close()
+    else:
+        text = io.StringIO(content.decode('utf-8-sig'))
+        for chunk in pd.read_csv(text, dtype=str, keep_default_na=False, chunksize=chunk_size,
+                                 sep=None, engine='python'):
+            yield chunk.to_dict('records')
+
+
+def clean_row(row):
+
+    """
+    Normalizes the column names and the values of a row.
+
+    Parameters
+    ----------
+    row: dict
+        Row as read from the file
+
+    Returns
+    -------
+    row: dict
+        Row with the known columns only, as stripped strings
+    """
+
+    cleaned = {}
+
+    for column, value in row.items():
+        column = str(column).strip().lower()
+        column = COLUMN_ALIASES.get(column, column)
+        if column in COLUMNS:
+            cleaned[column] = '' if value is None else str(value).strip()
+
+    return cleaned
+
+
+def valid_states(ufs):
+
+    """
+    Builds the states accepted in a deliveries file from the options of the state select box, which start with the
+    placeholder '-' and may be padded with spaces.
+
+    Parameters
+    ----------
+    ufs: tuple
+        Options of the state select box (see Params.uf)
+
+    Returns
+    -------
+    valid_ufs: tuple
+        Valid states, without spaces
+    """
+
+    return tuple(uf.strip() for uf in ufs if uf.strip() != '-')
+
+
+def validate_row(row, line, default_uf, default_city, valid_ufs):
+
+    """
+    Validates a row and converts it into the dictionary of a delivery.
+
+    Parameters
+    ----------
+    row: dict
+        Row with the normalized columns (see clean_row)
+    line: int
+        Line of the row in the file, used in the error messages
+    default_uf: str
+        State used when the row has none (the depot's)
+    default_city: str
+        City used when the row has none (the depot's)
+    valid_ufs: tuple
+        Valid states, without spaces (see valid_states)
+
+    Returns
+    -------
+    address_dict: dict
+        Dictionary that contains the data about the delivery (None if the row is not valid)
+    error: str
+        Description of the problem of the row (None if it is valid)
+    """
+
+    address_dict = {'person': row.get('person', ''),
+                    'name': row.get('name', '').title(),
+                    'number': row.get('number', ''),
+                    'uf': (row.get('uf') or default_uf).strip().upper(),
+                    'city': (row.get('city') or default_city).title()}
+
+    # Coordinates given in the file, as 'lat,lon' or in separate columns
+    lat_lon = row.get('lat_lon', '')
+    if not lat_lon and row.get('lat') and row.get('lon'):
+        lat_lon = f"{row['lat']},{row['lon']}"
+
+    if lat_lon:
+        try:
+            lat, lon = split_coordinates(lat_lon.replace(' ', ''))
+        except (IndexError, ValueError):
+            return None, f'Linha {line}: coordenadas inválidas ({lat_lon})'
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None, f'Linha {line}: coordenadas fora do intervalo ({lat_lon})'
+        address_dict['lat_lon'] = f'{lat},{lon}'
+        address_dict['lat'], address_dict['lon'] = lat, lon
+    elif not address_dict['name'] or not address_dict['number']:
+        return None, f'Linha {line}: endereço ou número ausente e sem coordenadas'
+
+    if address_dict['uf'] not in valid_ufs:
+        return None, f"Linha {line}: estado inválido ({address_dict['uf']})"
+
+    if not address_dict['person']:
+        address_dict['person'] = address_dict['name'] or address_dict['lat_lon']
+
+    return address_dict, None
+
+
+def import_deliveries(content, default_uf, default_city, valid_ufs, chunk_size=500, max_rows=5000):
+
+    """
+    Reads and validates a CSV or XLSX file of deliveries chunk by chunk.
+
+    The file has one delivery per row and the columns of data/locations_example.csv: person (or place), name, number,
+    uf, city and, optionally, lat_lon or lat and lon. Only name and number (or the coordinates) are required; the
+    state and the city default to the depot's.
+
+    Parameters
+    ----------
+    content: bytes
+        Content of the file
+    default_uf: str
+        State used when a row has none
+    default_city: str
+        City used when a row has none
+    valid_ufs: tuple
+        Valid states, without spaces (see valid_states)
+    chunk_size: int
+        Number of rows validated at a time
+    max_rows: int
+        Maximum number of rows read
+
+    Returns
+    -------
+    deliveries: list
+        List of dictionaries that contain the data about each valid delivery
+    errors: list
+        List of the descriptions of the invalid rows
+    """
+
+    deliveries = []
+    errors = []
+    line = 1  # Header
+
+    try:
+        for chunk in read_rows(content, chunk_size):
+            for row in chunk:
+                line += 1
+                if line - 1 > max_rows:
+                    errors.append(f'Apenas as primeiras {max_rows} linhas foram importadas')
+                    return deliveries, errors
+
+                row = clean_row(row)
+                if not any(row.values()) or row.get('person', '').lower() == 'depot':
+                    continue  # Empty line or the depot of a locations file
+
+                address_dict, error = validate_row(row, line, default_uf, default_city, valid_ufs)
+                if error is None:
+                    deliveries.append(address_dict)
+                else:
+                    errors.append(error)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as exc:
+        errors.append(f'Não foi possível ler o arquivo: {exc}')
+    except ImportError:
+        errors.append('É necessário instalar o pacote openpyxl para importar arquivos XLSX')
+
+    return deliveries, errors
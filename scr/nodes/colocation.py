@@ -0,0 +1,113 @@
+# Import necessary libraries
+import numpy as np
+
+from nodes.decomposition import planar_coordinates
+from nodes.estimator import EARTH_RADIUS
+
+
+def collapse_locations(lats, lons, tolerance=10):
+
+    """
+    Groups the deliveries at the same place (Example: apartments of the same building), so that each place is a
+    single location of the matrices and of the routing model. The first delivery not grouped yet is the seed of a new
+    place, which takes every delivery not grouped yet at most tolerance meters from the seed, so the deliveries of a
+    place are never farther apart than twice the tolerance (a street of close deliveries is not chained into a single
+    place). The depot is always alone in the first group.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the locations in degrees, including the depot's
+    lons: list
+        Longitudes of the locations in degrees, including the depot's
+    tolerance: float
+        Maximum distance in meters between a delivery and the seed of its place (if 0, only identical coordinates
+        are merged)
+
+    Returns
+    -------
+    groups: list
+        List of the locations of each place, in the order of their first location (the first one is [0], the depot)
+    """
+
+    points = planar_coordinates(lats, lons) * np.radians(1) * EARTH_RADIUS
+
+    # Grid cells with the tolerance as side: the deliveries close to a seed are in its cell or in the adjacent ones
+    if tolerance:
+        keys = np.floor(points / tolerance).astype(np.int64)
+        offsets = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    else:
+        keys = points
+        offsets = [(0, 0)]
+
+    cells = {}
+    for location in range(1, len(points)):
+        cells.setdefault(tuple(keys[location].tolist()), []).append(location)
+
+    grouped = np.zeros(len(points), dtype=bool)
+    grouped[0] = True
+    groups = [[0]]
+
+    for seed in range(1, len(points)):
+        if grouped[seed]:
+            continue
+
+        # Deliveries not grouped yet within the tolerance of the seed (the seed included)
+        x, y = keys[seed].tolist()
+        candidates = np.array(sorted(other for dx, dy in offsets for other in cells.get((x + dx, y + dy), ())))
+        candidates = candidates[~grouped[candidates]]
+        members = candidates[((points[candidates] - points[seed]) ** 2).sum(axis=1) <= tolerance ** 2]
+
+        grouped[members] = True
+        groups.append(members.tolist())
+
+    return groups
+
+
+def collapse_matrix(matrix, groups):
+
+    """
+    Keeps the rows and columns of the first location of each place.
+
+    Parameters
+    ----------
+    matrix: numpy.ndarray
+        Matrix of all the locations
+    groups: list
+        List of the locations of each place (see collapse_locations)
+
+    Returns
+    -------
+    matrix: numpy.ndarray
+        Matrix of the places
+    """
+
+    places = [group[0] for group in groups]
+    if len(places) == len(matrix):
+        return matrix
+
+    return np.asarray(matrix)[np.ix_(places, places)]
+
+
+def expand_result(result, groups):
+
+    """
+    Replaces each place in the routes of a solution by its deliveries, visited one after the other.
+
+    Parameters
+    ----------
+    result: dict
+        Solution of the problem of the places (see nodes.solver.solve)
+    groups: list
+        List of the locations of each place (see collapse_locations)
+
+    Returns
+    -------
+    result: dict
+        Solution with the routes of the locations (the route times do not change)
+    """
+
+    routes_all = {vehicle_id: [location for place in route_each for location in groups[place]]
+                  for vehicle_id, route_each in result['routes'].items()}
+
+    return dict(result, routes=routes_all)
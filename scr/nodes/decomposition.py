@@ -0,0 +1,575 @@
+# Import necessary libraries
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from nodes.jobs import SolveJob
+from nodes.metrics import Metrics
+from nodes.solver import create_data_model, solve, warm_start_routes
+
+
+def planar_coordinates(lats, lons):
+
+    """
+    Projects the coordinates on a plane (equirectangular projection), so that the euclidean distance between two
+    locations is proportional to the distance on the ground in a city-sized area.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the locations in degrees
+    lons: list
+        Longitudes of the locations in degrees
+
+    Returns
+    -------
+    points: numpy.ndarray
+        N x 2 array of the projected coordinates
+    """
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    return np.column_stack([lats, lons * np.cos(np.radians(lats.mean()))])
+
+
+def kmeans_clusters(points, num_clusters, iterations=50):
+
+    """
+    Groups the locations into clusters with the k-means algorithm, seeded with the farthest-point heuristic so that
+    the result does not depend on a random seed.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+        N x 2 array of the projected coordinates of the locations
+    num_clusters: int
+        Number of clusters
+    iterations: int
+        Maximum number of iterations
+
+    Returns
+    -------
+    labels: numpy.ndarray
+        Cluster of each location
+    """
+
+    num_clusters = min(num_clusters, len(points))
+
+    # The first center is the location farthest from the centroid, the next ones are the farthest from the others
+    centers = [points[((points - points.mean(axis=0)) ** 2).sum(axis=1).argmax()]]
+    for _ in range(1, num_clusters):
+        distances = ((points[:, None, :] - np.array(centers)[None, :, :]) ** 2).sum(axis=2).min(axis=1)
+        centers.append(points[distances.argmax()])
+    centers = np.array(centers)
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        if labels is not None and (new_labels == labels).all():
+            break
+        labels = new_labels
+        for cluster in range(num_clusters):
+            if (labels == cluster).any():
+                centers[cluster] = points[labels == cluster].mean(axis=0)
+
+    return labels
+
+
+def merge_clusters(points, labels, max_clusters):
+
+    """
+    Merges the smallest cluster into the one with the nearest center until there are at most max_clusters clusters.
+
+    Parameters
+    ----------
+    points: numpy.ndarray
+        N x 2 array of the projected coordinates of the locations
+    labels: numpy.ndarray
+        Cluster of each location
+    max_clusters: int
+        Maximum number of clusters
+
+    Returns
+    -------
+    labels: numpy.ndarray
+        Cluster of each location, numbered from 0
+    """
+
+    labels = np.unique(labels, return_inverse=True)[1]
+
+    while labels.max() + 1 > max_clusters:
+        sizes = np.bincount(labels)
+        centers = np.array([points[labels == cluster].mean(axis=0) for cluster in range(len(sizes))])
+        smallest = sizes.argmin()
+        distances = ((centers - centers[smallest]) ** 2).sum(axis=1)
+        distances[smallest] = np.inf
+        labels[labels == smallest] = distances.argmin()
+        labels = np.unique(labels, return_inverse=True)[1]
+
+    return labels
+
+
+def cluster_deliveries(lats, lons, num_clusters, regions=None):
+
+    """
+    Partitions the deliveries into geographic clusters.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the deliveries in degrees (without the depot)
+    lons: list
+        Longitudes of the deliveries in degrees (without the depot)
+    num_clusters: int
+        Number of clusters (maximum number if the regions are given)
+    regions: list
+        Region of each delivery (Example: the 'region' column of locations_example.csv). If None, the clusters are
+        found with k-means
+
+    Returns
+    -------
+    labels: numpy.ndarray
+        Cluster of each delivery, numbered from 0
+    """
+
+    points = planar_coordinates(lats, lons)
+
+    if regions is not None:
+        labels = np.unique(np.asarray(regions, dtype=str), return_inverse=True)[1]
+    else:
+        labels = kmeans_clusters(points, num_clusters)
+
+    return merge_clusters(points, labels, num_clusters)
+
+
+def allocate_vehicles(workloads, num_vehicles):
+
+    """
+    Shares the vehicles among the clusters in proportion to their workload (largest remainder method), giving at
+    least one vehicle to each cluster.
+
+    Parameters
+    ----------
+    workloads: list
+        Workload of each cluster (if all of them are 0, the vehicles are shared equally)
+    num_vehicles: int
+        Number of vehicles (at least the number of clusters)
+
+    Returns
+    -------
+    vehicles: list
+        Number of vehicles of each cluster
+    """
+
+    workloads = np.asarray(workloads, dtype=np.float64)
+    if workloads.sum() == 0:
+        workloads = np.ones(len(workloads))
+    shares = (num_vehicles - len(workloads)) * workloads / workloads.sum()
+    vehicles = 1 + np.floor(shares).astype(int)
+
+    # The vehicles left go to the clusters with the largest remainders
+    for cluster in np.argsort(np.floor(shares) - shares)[:num_vehicles - vehicles.sum()]:
+        vehicles[cluster] += 1
+
+    return vehicles.tolist()
+
+
+def solve_cluster(data, waiting_stop, max_travel_time, search_options):
+
+    """
+    Solves the sub-problem of a cluster (runs in a worker process).
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the sub-problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    search_options: dict
+        Keyword arguments of nodes.solver.solve
+
+    Returns
+    -------
+    result: dict
+        Solution of the sub-problem (see nodes.solver.solve)
+    """
+
+    return solve(data, waiting_stop, max_travel_time, **search_options)
+
+
+def partition_problem(data, lats, lons, regions=None, num_clusters=None, max_cluster_size=100):
+
+    """
+    Partitions the deliveries into geographic clusters, shares the vehicles among them and builds the sub-problem of
+    each cluster (the depot is in every sub-problem).
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    lats: list
+        Latitudes of the locations in degrees, including the depot's
+    lons: list
+        Longitudes of the locations in degrees, including the depot's
+    regions: list
+        Region of each location, including the depot's (if None, the clusters are found from the coordinates)
+    num_clusters: int
+        Number of clusters. If None, enough clusters to have at most max_cluster_size deliveries in each one
+    max_cluster_size: int
+        Target maximum number of deliveries of a cluster, used when num_clusters is None
+
+    Returns
+    -------
+    labels: numpy.ndarray
+        Cluster of each delivery
+    clusters: list
+        Locations of each cluster
+    vehicles: list
+        Number of vehicles of each cluster
+    sub_problems: list
+        Data of the sub-problem of each cluster
+    """
+
+    time_matrix = np.asarray(data['time_matrix'])
+    dist_matrix = np.asarray(data['distance_matrix'])
+    num_vehicles = data['num_vehicles']
+    num_deliveries = len(time_matrix) - 1
+
+    if num_clusters is None:
+        num_clusters = -(-num_deliveries // max_cluster_size)
+    num_clusters = max(1, min(num_clusters, num_vehicles, num_deliveries))
+
+    # Partition the deliveries (the depot is in every sub-problem)
+    labels = cluster_deliveries(lats[1:], lons[1:], num_clusters,
+                                regions[1:] if regions is not None else None)
+    clusters = [np.flatnonzero(labels == cluster) + 1 for cluster in range(labels.max() + 1)]
+
+    # The workload of a cluster is estimated by the round trips from the depot to its deliveries
+    workloads = [(time_matrix[0, nodes] + time_matrix[nodes, 0]).sum() for nodes in clusters]
+    vehicles = allocate_vehicles(workloads, num_vehicles)
+
+    sub_problems = []
+    for nodes, cluster_vehicles in zip(clusters, vehicles):
+        sub_nodes = np.concatenate([[0], nodes])
+        sub_problems.append(create_data_model(cluster_vehicles,
+                                              dist_matrix[np.ix_(sub_nodes, sub_nodes)],
+                                              time_matrix[np.ix_(sub_nodes, sub_nodes)],
+                                              data.get('drop_penalty')))
+
+    return labels, clusters, vehicles, sub_problems
+
+
+def stitch_routes(clusters, vehicles, sub_results, time_matrix, max_travel_time):
+
+    """
+    Stitches the routes of the clusters together, converting the positions in each cluster back to the locations.
+    The deliveries of the clusters without a solution are inserted in the other routes.
+
+    Parameters
+    ----------
+    clusters: list
+        Locations of each cluster (see partition_problem)
+    vehicles: list
+        Number of vehicles of each cluster
+    sub_results: list
+        Solution of each sub-problem (see nodes.solver.solve), with None routes if it was not solved
+    time_matrix: numpy.ndarray
+        Time travel matrix of the whole problem
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+
+    Returns
+    -------
+    routes: list
+        List with the sequence of locations of each vehicle, without the depot
+    """
+
+    time_matrix = np.asarray(time_matrix)
+    routes = []
+    for nodes, cluster_vehicles, sub_result in zip(clusters, vehicles, sub_results):
+        sub_nodes = [0] + nodes.tolist()
+        if sub_result['routes'] is None:
+            routes += [[] for _ in range(cluster_vehicles)]
+        else:
+            routes += [[sub_nodes[node] for node in route_each[1:-1]] for route_each in sub_result['routes'].values()]
+
+    keys = list(range(len(time_matrix)))
+
+    return warm_start_routes({vehicle_id: [0] + route_each + [0] for vehicle_id, route_each in enumerate(routes)},
+                             keys, keys, time_matrix, sum(vehicles), max_travel_time)
+
+
+def solve_decomposed(data, waiting_stop, max_travel_time, lats, lons, regions=None, num_clusters=None,
+                     max_cluster_size=100, repair_time_limit=None, max_workers=None, **search_options):
+
+    """
+    Solves a large problem by clusters: the deliveries are partitioned into geographic clusters, the vehicles are
+    shared among the clusters, the sub-problem of each cluster is solved in its own process and the routes are
+    stitched together. A repair pass over the whole problem can then move deliveries across the cluster boundaries,
+    starting from the stitched routes.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    lats: list
+        Latitudes of the locations in degrees, including the depot's
+    lons: list
+        Longitudes of the locations in degrees, including the depot's
+    regions: list
+        Region of each location, including the depot's (if None, the clusters are found from the coordinates)
+    num_clusters: int
+        Number of clusters. If None, enough clusters to have at most max_cluster_size deliveries in each one
+    max_cluster_size: int
+        Target maximum number of deliveries of a cluster, used when num_clusters is None
+    repair_time_limit: float
+        Time limit in seconds of the repair pass (if None, there is no repair pass)
+    max_workers: int
+        Maximum number of clusters solved at the same time (if 1, the clusters are solved in this process)
+    **search_options:
+        Keyword arguments of nodes.solver.solve used for each cluster (Example: time_limit=30)
+
+    Returns
+    -------
+    result: dict
+        Solution of the problem (see nodes.solver.solve) with the cluster of each delivery ('clusters')
+    """
+
+    time_matrix = np.asarray(data['time_matrix'])
+    labels, clusters, vehicles, sub_problems = partition_problem(data, lats, lons, regions, num_clusters,
+                                                                 max_cluster_size)
+
+    # Solve the clusters in parallel
+    if max_workers == 1 or len(sub_problems) == 1:
+        sub_results = [solve_cluster(sub_data, waiting_stop, max_travel_time, search_options)
+                       for sub_data in sub_problems]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            sub_results = list(executor.map(solve_cluster, sub_problems, [waiting_stop] * len(sub_problems),
+                                            [max_travel_time] * len(sub_problems),
+                                            [search_options] * len(sub_problems)))
+
+    # Stitch the routes (the deliveries of the clusters without a solution are inserted in the other routes)
+    routes = stitch_routes(clusters, vehicles, sub_results, time_matrix, max_travel_time)
+
+    if repair_time_limit is not None:
+        repair_options = dict(search_options, time_limit=repair_time_limit)
+        result = solve(data, waiting_stop, max_travel_time, initial_routes=routes, **repair_options)
+        if result['routes'] is not None:
+            result['clusters'] = labels.tolist()
+            return result
+
+    routes_all = {vehicle_id: [0] + route_each + [0] for vehicle_id, route_each in enumerate(routes)}
+    route_times = {vehicle_id: int(time_matrix[route_each[:-1], route_each[1:]].sum())
+                   for vehicle_id, route_each in routes_all.items()}
+    feasible = all(sub_result['routes'] is not None for sub_result in sub_results) and \
+        max(route_times.values()) <= max_travel_time * 60
+
+    # Same objective as the routing model: travel times plus the global span cost
+    result = {'status': 'ROUTING_SUCCESS' if feasible else 'ROUTING_FAIL',
+              'objective': sum(route_times.values()) + 100 * max(route_times.values()),
+              'routes': routes_all,
+              'route_times': route_times,
+              'clusters': labels.tolist()}
+
+    return result
+
+
+class DecomposedJob:
+    """
+    Solve by clusters that runs in background processes and can be followed and cancelled from the app, with the
+    same interface as nodes.jobs.SolveJob. The sub-problem of each cluster is solved by a SolveJob (see
+    solve_decomposed) and, when all of them finish, the stitched routes are handed to the job that searches over all
+    the deliveries.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    lats: list
+        Latitudes of the locations in degrees, including the depot's
+    lons: list
+        Longitudes of the locations in degrees, including the depot's
+    next_job: function
+        Function that receives the stitched routes (without the depot) and returns the started job of the search over
+        all the deliveries
+    regions: list
+        Region of each location, including the depot's (if None, the clusters are found from the coordinates)
+    num_clusters: int
+        Number of clusters. If None, enough clusters to have at most max_cluster_size deliveries in each one
+    max_cluster_size: int
+        Target maximum number of deliveries of a cluster, used when num_clusters is None
+    max_workers: int
+        Maximum number of clusters solved at the same time (if None, the number of CPUs)
+    **search_options:
+        Keyword arguments of nodes.solver.create_search_parameters used for each cluster (Example: time_limit=30)
+    """
+
+    def __init__(self, data, waiting_stop, max_travel_time, lats, lons, next_job, regions=None, num_clusters=None,
+                 max_cluster_size=100, max_workers=None, **search_options):
+
+        self.data = data
+        self.max_travel_time = max_travel_time
+        self.next_job = next_job
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.labels, self.clusters, self.vehicles, sub_problems = partition_problem(data, lats, lons, regions,
+                                                                                    num_clusters, max_cluster_size)
+        self.jobs = [SolveJob(sub_data, waiting_stop, max_travel_time, **search_options) for sub_data in sub_problems]
+        self.final_job = None  # Search over all the deliveries, started when the clusters are solved
+        self.best = None  # Best solution of the search over all the deliveries
+        self.num_solutions = 0
+        self.status = None
+        self.cancelled = False
+        self.metrics = None
+        self.started_at = None
+        self.seconds = None
+        self._regions_seconds = None
+
+    def _start_next(self):
+
+        """
+        Starts the solves of the next clusters, up to max_workers at the same time.
+        """
+
+        num_running = sum(job.running for job in self.jobs if job.started_at is not None)
+
+        for job in self.jobs:
+            if num_running >= self.max_workers:
+                break
+            if job.started_at is None:
+                job.start()
+                num_running += 1
+
+    def start(self):
+
+        """
+        Starts the solves of the first clusters.
+
+        Returns
+        -------
+        job: DecomposedJob
+            The job itself
+        """
+
+        self.started_at = time.monotonic()
+        self._start_next()
+
+        return self
+
+    @property
+    def running(self):
+
+        """
+        True while the clusters or the search over all the deliveries have not finished.
+        """
+
+        return self.status is None
+
+    def poll(self):
+
+        """
+        Reads the solutions of the clusters, starts the search over all the deliveries when they are solved and reads
+        its solutions.
+
+        Returns
+        -------
+        improved: bool
+            True if a better solution was found since the last call
+        """
+
+        if self.status is not None:
+            return False
+
+        if self.final_job is None:
+            for job in self.jobs:
+                if job.started_at is not None:
+                    job.poll()
+            self.num_solutions = sum(job.num_solutions for job in self.jobs)
+
+            if not self.cancelled:
+                self._start_next()
+            if any(job.running for job in self.jobs):
+                return False
+
+            self._regions_seconds = time.monotonic() - self.started_at
+            if self.cancelled:
+                self._finish('CANCELLED')
+                return False
+
+            # Stitch the routes of the clusters and search over all the deliveries from them
+            sub_results = [{'routes': job.best['routes'] if job.best is not None else None} for job in self.jobs]
+            routes = stitch_routes(self.clusters, self.vehicles, sub_results, self.data['time_matrix'],
+                                   self.max_travel_time)
+            self.final_job = self.next_job(routes)
+
+        improved = self.final_job.poll()
+        self.best = self.final_job.best
+        self.num_solutions = sum(job.num_solutions for job in self.jobs) + self.final_job.num_solutions
+
+        if not self.final_job.running:
+            self._finish(self.final_job.status)
+
+        return improved
+
+    def _finish(self, status):
+
+        """
+        Sets the status of the job and adds the metrics of all the solves together.
+
+        Parameters
+        ----------
+        status: str
+            Final status
+        """
+
+        self.status = status
+        self.seconds = time.monotonic() - self.started_at
+
+        metrics = Metrics()
+        if self._regions_seconds is not None:
+            metrics.observe('solve_regions', self._regions_seconds)
+        for job in self.jobs + ([self.final_job] if self.final_job is not None else []):
+            metrics.merge(job.metrics or {})
+        metrics.label('solver_status', self.status)
+        self.metrics = metrics.snapshot()
+
+    def cancel(self, grace=1.0):
+
+        """
+        Stops all the solves, keeping the best solution found so far.
+
+        Parameters
+        ----------
+        grace: float
+            Time in seconds given to each solver to stop by itself before its process is terminated
+        """
+
+        if not self.running:
+            return
+
+        self.cancelled = True
+        if self.final_job is not None:
+            self.final_job.cancel(grace)
+        else:
+            for job in self.jobs:
+                if job.started_at is not None:
+                    job.cancel(grace)
+
+        self.poll()
+        if self.status is None:
+            self._finish('CANCELLED')
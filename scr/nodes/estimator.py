@@ -0,0 +1,118 @@
+# Import necessary libraries
+import numpy as np
+
+# Mean radius of the Earth in meters
+EARTH_RADIUS = 6371008.8
+
+
+def haversine_matrix(lats, lons):
+
+    """
+    Computes the great-circle distance between every pair of locations.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the locations in degrees
+    lons: list
+        Longitudes of the locations in degrees
+
+    Returns
+    -------
+    gc_matrix: numpy.ndarray
+        N x N matrix of the great-circle distances in meters
+    """
+
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+
+    dlat = lats[:, None] - lats[None, :]
+    dlon = lons[:, None] - lons[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lats)[:, None] * np.cos(lats)[None, :] * np.sin(dlon / 2) ** 2
+
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def calibrate_estimator(lats, lons, dist_matrix, time_matrix, mask=None):
+
+    """
+    Fits the road-detour factor and the average speed by regression against real distance and time travel matrices.
+
+    The road distance is modeled as detour * great-circle distance and the time travel as
+    time_offset + road distance / speed.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the locations in degrees
+    lons: list
+        Longitudes of the locations in degrees
+    dist_matrix: list
+        Real distance matrix in meters
+    time_matrix: list
+        Real time travel matrix in seconds
+    mask: list
+        Matrix that is True for the pairs used in the regression (if None, all the pairs except the travels from a
+        location to itself)
+
+    Returns
+    -------
+    calibration: dict
+        Dictionary that contains the detour factor ('detour'), the average speed in meters per second ('speed') and
+        the fixed time of each travel in seconds ('time_offset')
+    """
+
+    gc_matrix = haversine_matrix(lats, lons)
+    dist_matrix = np.asarray(dist_matrix, dtype=np.float64)
+    time_matrix = np.asarray(time_matrix, dtype=np.float64)
+
+    # The travels from a location to itself are not used
+    if mask is None:
+        mask = ~np.eye(len(gc_matrix), dtype=bool)
+    mask = np.asarray(mask, dtype=bool)
+    gc_values = gc_matrix[mask]
+    dist_values = dist_matrix[mask]
+    time_values = time_matrix[mask]
+
+    # Road distance = detour * great-circle distance (least squares through the origin)
+    detour = float(gc_values @ dist_values / (gc_values @ gc_values))
+
+    # Time travel = time_offset + road distance / speed
+    slope, time_offset = np.polyfit(dist_values, time_values, 1)
+
+    calibration = {'detour': detour,
+                   'speed': float(1 / slope),
+                   'time_offset': float(max(time_offset, 0))}
+
+    return calibration
+
+
+def estimate_matrices(lats, lons, calibration):
+
+    """
+    Estimates the distance and time travel matrices from the coordinates of the locations, without any request.
+
+    Parameters
+    ----------
+    lats: list
+        Latitudes of the locations in degrees
+    lons: list
+        Longitudes of the locations in degrees
+    calibration: dict
+        Calibration of the estimator (see calibrate_estimator)
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Estimated distance matrix in meters (int32)
+    time_matrix: numpy.ndarray
+        Estimated time travel matrix in seconds (int32)
+    """
+
+    dist_matrix = haversine_matrix(lats, lons) * calibration['detour']
+    time_matrix = calibration['time_offset'] + dist_matrix / calibration['speed']
+
+    # The travel from a location to itself takes no time
+    np.fill_diagonal(time_matrix, 0)
+
+    return np.rint(dist_matrix).astype(np.int32), np.rint(time_matrix).astype(np.int32)
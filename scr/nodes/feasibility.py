@@ -0,0 +1,73 @@
+# Import necessary libraries
+import numpy as np
+
+
+def drop_penalty(time_matrix):
+
+    """
+    Computes a penalty for leaving a delivery out of the routes that is higher than what serving it can add to the
+    objective (its two arcs, counted in the travel times and in the global span cost), so a delivery is only left out
+    when it cannot be served.
+
+    Parameters
+    ----------
+    time_matrix: numpy.ndarray
+        Time travel matrix
+
+    Returns
+    -------
+    penalty: int
+        Penalty of each delivery left out
+    """
+
+    return 101 * 2 * int(np.max(time_matrix)) + 1
+
+
+def check_feasibility(time_matrix, number_vehicles, max_travel_time):
+
+    """
+    Finds out, without the solver, if the problem is obviously impossible: a delivery whose round trip from the depot
+    alone is longer than the maximum travel time, or more total travel time than the vehicles can do. The lower bound
+    of the total travel time counts the fastest arc into each delivery and the fastest return to the depot (or the
+    fastest arc out of each delivery and the fastest departure from the depot, if higher).
+
+    Parameters
+    ----------
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    number_vehicles: int
+        Number of vehicles
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+
+    Returns
+    -------
+    report: dict
+        Dictionary that contains the deliveries that cannot be reached within the maximum travel time
+        ('unreachable'), the lower bound of the total travel time in seconds ('lower_bound'), the minimum number of
+        vehicles ('min_vehicles') and whether the problem may be feasible ('feasible')
+    """
+
+    time_matrix = np.asarray(time_matrix, dtype=np.int64)
+    limit = max_travel_time * 60
+
+    # Deliveries too far from the depot for any vehicle
+    round_trips = time_matrix[0, 1:] + time_matrix[1:, 0]
+    unreachable = (np.flatnonzero(round_trips > limit) + 1).tolist()
+
+    # Every delivery is entered and left once and the depot is left and entered at least once
+    lower_bound = 0
+    if len(time_matrix) > 1:
+        arcs = time_matrix.copy()
+        np.fill_diagonal(arcs, np.iinfo(np.int64).max)
+        lower_bound = int(max(arcs[:, 1:].min(axis=0).sum() + arcs[1:, 0].min(),
+                              arcs[1:, :].min(axis=1).sum() + arcs[0, 1:].min()))
+
+    min_vehicles = max(1, -(-lower_bound // limit)) if limit > 0 else number_vehicles + 1
+
+    report = {'unreachable': unreachable,
+              'lower_bound': lower_bound,
+              'min_vehicles': min_vehicles,
+              'feasible': not unreachable and min_vehicles <= number_vehicles}
+
+    return report
@@ -0,0 +1,248 @@
+# Import necessary libraries
+import time
+
+from nodes.feasibility import check_feasibility
+from nodes.jobs import BackgroundTSPJob, SolveJob
+from nodes.metrics import Metrics
+from nodes.solver import create_data_model
+
+
+class FleetJob:
+    """
+    Search of the smallest number of vehicles with a feasible plan. The fleet sizes are tried from the lower bound of
+    nodes.feasibility.check_feasibility upwards, several at the same time in background processes, each with its own
+    time limit. Since a plan with fewer vehicles is also a plan with more vehicles (some stay at the depot), the
+    solves of larger fleets are cancelled as soon as a smaller one finds a plan. The solver does not prove that a
+    fleet has no plan (a time-boxed search that fails only reports ROUTING_FAIL), so the smaller fleets run until
+    their time limit and the smallest fleet is only proven when it is the lower bound.
+
+    Parameters
+    ----------
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    max_vehicles: int
+        Largest fleet tried
+    time_limit: float
+        Maximum time in seconds of the solve of each fleet size
+    max_workers: int
+        Number of fleet sizes solved at the same time
+    **search_options:
+        Keyword arguments of nodes.solver.create_search_parameters (Example: first_solution_strategy='SAVINGS')
+    """
+
+    def __init__(self, dist_matrix, time_matrix, waiting_stop, max_travel_time, max_vehicles, time_limit=30,
+                 max_workers=2, **search_options):
+
+        self.dist_matrix = dist_matrix
+        self.time_matrix = time_matrix
+        self.waiting_stop = waiting_stop
+        self.max_travel_time = max_travel_time
+        self.time_limit = time_limit
+        self.max_workers = max_workers
+        self.search_options = search_options
+
+        # Fleet sizes below the lower bound are impossible, and no delivery can be served if one is unreachable
+        report = check_feasibility(time_matrix, max_vehicles, max_travel_time)
+        self.lower_bound = report['min_vehicles']
+        self.max_vehicles = min(max_vehicles, len(time_matrix) - 1) if not report['unreachable'] else 0
+        self.next_vehicles = self.lower_bound
+
+        self.jobs = {}  # Solve of each fleet size tried
+        self.best = None  # Plan of the smallest fleet found so far, with its size ('num_vehicles')
+        self.proven = False  # True if the smallest fleet found is the lower bound, so no smaller fleet can have a plan
+        self.num_solutions = 0
+        self.status = None
+        self.cancelled = False
+        self.metrics = None
+        self.started_at = None
+        self.seconds = None
+
+    def _start_next(self):
+
+        """
+        Starts the solves of the next fleet sizes, up to max_workers at the same time.
+        """
+
+        while self.next_vehicles <= self.max_vehicles and \
+                sum(job.running for job in self.jobs.values()) < self.max_workers:
+            vehicles = self.next_vehicles
+            data = create_data_model(vehicles, self.dist_matrix, self.time_matrix)
+
+            # A single vehicle is solved without the routing model, also in a background process
+            if vehicles == 1:
+                job = BackgroundTSPJob(data, self.max_travel_time, time_limit=self.time_limit)
+            else:
+                job = SolveJob(data, self.waiting_stop, self.max_travel_time, time_limit=self.time_limit,
+                               **self.search_options)
+
+            self.jobs[vehicles] = job.start()
+            self.next_vehicles += 1
+
+    def start(self):
+
+        """
+        Starts the solves of the first fleet sizes.
+
+        Returns
+        -------
+        job: FleetJob
+            The job itself
+        """
+
+        self.started_at = time.monotonic()
+        self.poll()
+
+        return self
+
+    @property
+    def running(self):
+
+        """
+        True while the smallest fleet is not known.
+        """
+
+        return self.status is None
+
+    def poll(self):
+
+        """
+        Reads the solutions of all the solves, cancels the solves that can no longer give a smaller fleet and starts
+        the next fleet sizes.
+
+        Returns
+        -------
+        improved: bool
+            True if a better plan was found since the last call
+        """
+
+        improved = False
+
+        for job in self.jobs.values():
+            job.poll()
+        self.num_solutions = sum(job.num_solutions for job in self.jobs.values())
+
+        feasible = [vehicles for vehicles, job in self.jobs.items() if job.best is not None]
+        if feasible:
+            vehicles = min(feasible)
+            best = self.jobs[vehicles].best
+            if self.best is None or self.best['num_vehicles'] != vehicles or self.best['objective'] != best['objective']:
+                self.best = dict(best, num_vehicles=vehicles)
+                improved = True
+
+            # Larger fleets are not needed anymore
+            for other_vehicles, job in self.jobs.items():
+                if other_vehicles > vehicles:
+                    job.cancel()
+            self.next_vehicles = self.max_vehicles + 1
+        elif not self.cancelled:
+            self._start_next()
+
+        # The search ends when the smallest fleet with a plan and all the smaller ones have finished
+        limit = self.best['num_vehicles'] if self.best is not None else self.max_vehicles
+        if self.status is None and self.next_vehicles > self.max_vehicles and \
+                all(not job.running for vehicles, job in self.jobs.items() if vehicles <= limit):
+            self._finish()
+
+        return improved
+
+    def _finish(self):
+
+        """
+        Sets the status of the search and adds the metrics of all the solves together.
+        """
+
+        if self.best is not None:
+            vehicles = self.best['num_vehicles']
+            self.status = self.jobs[vehicles].status
+            self.proven = vehicles == self.lower_bound
+        else:
+            self.status = 'CANCELLED' if self.cancelled else 'ROUTING_FAIL'
+        self.seconds = time.monotonic() - self.started_at
+
+        metrics = Metrics()
+        for job in self.jobs.values():
+            metrics.merge(job.metrics or {})
+        metrics.count('fleet_sizes_tried', len(self.jobs))
+        metrics.label('solver_status', self.status)
+        self.metrics = metrics.snapshot()
+
+    def cancel(self, grace=1.0):
+
+        """
+        Stops all the solves, keeping the best plan found so far.
+
+        Parameters
+        ----------
+        grace: float
+            Time in seconds given to each solver to stop by itself before its process is terminated
+        """
+
+        if not self.running:
+            return
+
+        self.cancelled = True
+        self.next_vehicles = self.max_vehicles + 1
+        for job in self.jobs.values():
+            job.cancel(grace)
+
+        self.poll()
+        if self.status is None:
+            self._finish()
+
+
+def find_min_fleet(dist_matrix, time_matrix, waiting_stop, max_travel_time, max_vehicles, time_limit=30,
+                   max_workers=2, poll_interval=0.2, **search_options):
+
+    """
+    Finds the smallest number of vehicles with a feasible plan and waits until the search finishes.
+
+    Parameters
+    ----------
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    max_vehicles: int
+        Largest fleet tried
+    time_limit: float
+        Maximum time in seconds of the solve of each fleet size
+    max_workers: int
+        Number of fleet sizes solved at the same time
+    poll_interval: float
+        Time in seconds between two reads of the solutions
+    **search_options:
+        Keyword arguments of nodes.solver.create_search_parameters
+
+    Returns
+    -------
+    result: dict
+        Dictionary that contains the status ('status'), the objective value ('objective'), the sequence of locations
+        of each route ('routes'), the travel time of each route in seconds ('route_times'), the number of vehicles
+        ('num_vehicles'), whether the number of vehicles is the lower bound, so no smaller fleet can have a plan
+        ('proven'), and the lower bound of the number of vehicles ('lower_bound'). The objective, the routes, the
+        route times and the number of vehicles are None if no plan was found
+    """
+
+    job = FleetJob(dist_matrix, time_matrix, waiting_stop, max_travel_time, max_vehicles, time_limit, max_workers,
+                   **search_options).start()
+
+    while job.running:
+        time.sleep(poll_interval)
+        job.poll()
+
+    result = {'status': job.status, 'objective': None, 'routes': None, 'route_times': None, 'num_vehicles': None,
+              'proven': job.proven, 'lower_bound': job.lower_bound}
+    if job.best is not None:
+        result.update(job.best)
+
+    return result
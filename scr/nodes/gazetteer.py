@@ -0,0 +1,238 @@
+# Import necessary libraries
+import csv
+import os
+import pickle
+import unicodedata
+from bisect import bisect_left
+from re import sub
+
+# Common abbreviations of the street types
+ABBREVIATIONS = {'r': 'rua', 'av': 'avenida', 'al': 'alameda', 'tv': 'travessa', 'trav': 'travessa', 'pc': 'praca',
+                 'pca': 'praca', 'rod': 'rodovia', 'est': 'estrada', 'lgo': 'largo', 'vl': 'vila'}
+
+
+def normalize_text(text):
+
+    """
+    Normalizes a text so that the comparison ignores accents, case, punctuation and abbreviations of street types.
+
+    Parameters
+    ----------
+    text: str
+        Text to be normalized (Example: 'R. José Antônio')
+
+    Returns
+    -------
+    text: str
+        Normalized text (Example: 'rua jose antonio')
+    """
+
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = sub(r'[^a-z0-9]+', ' ', text.lower()).split()
+
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def build_gazetteer_index(csv_path):
+
+    """
+    Builds the index of a street gazetteer.
+
+    The gazetteer is a CSV file with one street segment per row and the columns uf, city, street, number_from,
+    number_to, lat_from, lon_from, lat_to and lon_to.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path of the gazetteer CSV file
+
+    Returns
+    -------
+    index: dict
+        Dictionary that maps each (uf, normalized city) tuple to a dictionary with the sorted normalized street names
+        ('names') and the segments of each street sorted by the first number ('segments')
+    """
+
+    index = {}
+
+    with open(csv_path, encoding='utf-8', newline='') as file:
+        for row in csv.DictReader(file):
+            city = index.setdefault((row['uf'].strip().upper(), normalize_text(row['city'])),
+                                    {'names': [], 'segments': {}})
+            segment = (int(row['number_from']), int(row['number_to']),
+                       float(row['lat_from']), float(row['lon_from']),
+                       float(row['lat_to']), float(row['lon_to']))
+            city['segments'].setdefault(normalize_text(row['street']), []).append(segment)
+
+    for city in index.values():
+        city['names'] = sorted(city['segments'])
+        for segments in city['segments'].values():
+            segments.sort()
+
+    return index
+
+
+def interpolate_number(segments, number):
+
+    """
+    Estimates the coordinates of a house number along the segments of a street.
+
+    Parameters
+    ----------
+    segments: list
+        List of (number_from, number_to, lat_from, lon_from, lat_to, lon_to) tuples sorted by number_from
+    number: int
+        House number
+
+    Returns
+    -------
+    lat: float
+        Estimated latitude
+    lon: float
+        Estimated longitude
+    """
+
+    # Segment that contains the number or, if none contains it, the closest one
+    def distance(segment):
+        return max(segment[0] - number, number - segment[1], 0)
+
+    number_from, number_to, lat_from, lon_from, lat_to, lon_to = min(segments, key=distance)
+
+    if number_to == number_from:
+        fraction = 0.5
+    else:
+        fraction = min(max((number - number_from) / (number_to - number_from), 0), 1)
+
+    return lat_from + fraction * (lat_to - lat_from), lon_from + fraction * (lon_to - lon_from)
+
+
+class GazetteerGeocoder:
+    """
+    Offline geocoder that searches the addresses in a street gazetteer.
+
+    Parameters
+    ----------
+    index: dict
+        Index of the gazetteer (see build_gazetteer_index)
+    """
+
+    def __init__(self, index):
+
+        self.index = index
+
+    @classmethod
+    def from_file(cls, csv_path):
+
+        """
+        Loads the gazetteer, using the prebuilt index saved next to the CSV file when it is up to date.
+
+        Parameters
+        ----------
+        csv_path: str
+            Path of the gazetteer CSV file
+
+        Returns
+        -------
+        geocoder: GazetteerGeocoder
+            Geocoder of the gazetteer
+        """
+
+        index_path = os.path.splitext(csv_path)[0] + '.pkl'
+
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(csv_path):
+            with open(index_path, 'rb') as file:
+                return cls(pickle.load(file))
+
+        index = build_gazetteer_index(csv_path)
+        try:
+            with open(index_path, 'wb') as file:
+                pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass  # The index is rebuilt next time if the folder is read-only
+
+        return cls(index)
+
+    def find_street(self, city, street):
+
+        """
+        Finds a street by its normalized name or by a prefix that matches a single street.
+
+        Parameters
+        ----------
+        city: dict
+            Entry of the index of the city
+        street: str
+            Normalized name of the street
+
+        Returns
+        -------
+        name: str
+            Normalized name of the street found or None
+        """
+
+        names = city['names']
+        position = bisect_left(names, street)
+
+        if position < len(names) and names[position] == street:
+            return street
+
+        # Prefix search: only accepted if it is not ambiguous
+        matches = []
+        while position < len(names) and names[position].startswith(street) and len(matches) < 2:
+            matches.append(names[position])
+            position += 1
+
+        return matches[0] if len(matches) == 1 else None
+
+    def search(self, address_dict):
+
+        """
+        Searches the coordinates of an address.
+
+        Parameters
+        ----------
+        address_dict: dict
+            Dictionary that contains the data about a location
+
+        Returns
+        -------
+        coordinates: str
+            String that contains the coordinates of the location or None if the address is not in the gazetteer
+        """
+
+        city = self.index.get((address_dict['uf'].strip().upper(), normalize_text(address_dict['city'])))
+        if city is None:
+            return None
+
+        street = normalize_text(address_dict['name'])
+        street = self.find_street(city, street) if street else None
+        if street is None:
+            return None
+
+        try:
+            number = int(sub(r'\D', '', address_dict['number']))
+        except ValueError:
+            number = 0
+
+        lat, lon = interpolate_number(city['segments'][street], number)
+
+        return f'{lat:.7f},{lon:.7f}'
+
+    def search_many(self, address_list):
+
+        """
+        Searches the coordinates of several addresses.
+
+        Parameters
+        ----------
+        address_list: list
+            List of dictionaries that contain the data about each location
+
+        Returns
+        -------
+        coordinates: list
+            List of strings that contain the coordinates of each location (None if it is not in the gazetteer)
+        """
+
+        return [self.search(address_dict) for address_dict in address_list]
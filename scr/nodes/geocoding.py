@@ -0,0 +1,405 @@
+# Import necessary libraries
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from re import findall
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from nodes.gazetteer import normalize_text
+
+# Coordinates in the Google Maps url (Example: '-20.469294,-54.6097475')
+COORDINATES_PATTERN = r'-*\d+\.+\d*,-*\d+\.+\d*'
+
+
+def maps_search_url(maps_url, address_dict):
+
+    """
+    Builds the Google Maps url that searches an address.
+
+    Parameters
+    ----------
+    maps_url: str
+        Google Maps url
+    address_dict: dict
+        Dictionary that contains the data about a location
+
+    Returns
+    -------
+    url_complete: str
+        Url that searches the address
+    """
+
+    url_complete = maps_url + address_dict['name'].replace(' ', '+').lower() + ',+' + address_dict['number'] + ',+' \
+                            + address_dict['city'].replace(' ', '+').lower() + ',+' + address_dict['uf'].lower()
+
+    return url_complete
+
+
+def split_coordinates(coordinates):
+
+    """
+    Splits a string of coordinates into the latitude and the longitude.
+
+    Parameters
+    ----------
+    coordinates: str
+        String that contains the coordinates of the location ('lat,lon')
+
+    Returns
+    -------
+    lat: float
+        Latitude of the location
+    lon: float
+        Longitude of the location
+    """
+
+    lat = float(findall(r'-*\d+\.+\d*,', coordinates)[0].replace(',', ''))
+    lon = float(findall(r',-*\d+\.+\d*', coordinates)[0].replace(',', ''))
+
+    return lat, lon
+
+
+def address_key(address_dict):
+
+    """
+    Builds a key that identifies an address regardless of accents, case and abbreviations.
+
+    Parameters
+    ----------
+    address_dict: dict
+        Dictionary that contains the data about a location
+
+    Returns
+    -------
+    key: str
+        Normalized address (Example: 'rua jose antonio|119|campo grande|ms')
+    """
+
+    return '|'.join(normalize_text(address_dict[field]) for field in ('name', 'number', 'city', 'uf'))
+
+
+class GeocodeCache:
+    """
+    On-disk cache of the coordinates of the addresses already searched, shared by all the sessions.
+
+    The least recently used addresses are evicted when the cache is full and the coordinates older than max_age are
+    searched again.
+
+    Parameters
+    ----------
+    path: str
+        Path of the SQLite database file
+    max_entries: int
+        Maximum number of addresses kept
+    max_age: float
+        Age in seconds after which the coordinates of an address are considered expired
+    """
+
+    def __init__(self, path, max_entries=20000, max_age=180 * 86400):
+
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS geocodes ('
+                               'address TEXT PRIMARY KEY, '
+                               'lat_lon TEXT NOT NULL, '
+                               'created_at REAL NOT NULL, '
+                               'last_used REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS geocodes_last_used ON geocodes (last_used)')
+
+    def _connect(self):
+
+        """
+        Opens a connection to the database (one per call, so the cache can be used from any thread).
+
+        Returns
+        -------
+        connection: sqlite3.Connection
+            Connection to the database
+        """
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, address_list):
+
+        """
+        Looks up the coordinates of several addresses.
+
+        Parameters
+        ----------
+        address_list: list
+            List of dictionaries that contain the data about each location
+
+        Returns
+        -------
+        coordinates: list
+            List of strings that contain the coordinates of each location (None if it is not in the cache)
+        """
+
+        keys = [address_key(address_dict) for address_dict in address_list]
+        unique_keys = list(set(keys))
+        now = time.time()
+        found = {}
+
+        with self._connect() as connection:
+            # SQLite limits the number of parameters of a query
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = connection.execute(f'SELECT address, lat_lon FROM geocodes '
+                                          f'WHERE created_at >= ? AND address IN ({",".join("?" * len(chunk))})',
+                                          [now - self.max_age] + chunk)
+                found.update(rows)
+
+            connection.executemany('UPDATE geocodes SET last_used = ? WHERE address = ?',
+                                   [(now, key) for key in found])
+
+        return [found.get(key) for key in keys]
+
+    def get(self, address_dict):
+
+        """
+        Looks up the coordinates of an address.
+
+        Parameters
+        ----------
+        address_dict: dict
+            Dictionary that contains the data about a location
+
+        Returns
+        -------
+        coordinates: str
+            String that contains the coordinates of the location (None if it is not in the cache)
+        """
+
+        return self.get_many([address_dict])[0]
+
+    def put_many(self, address_list, coordinates):
+
+        """
+        Stores the coordinates of several addresses and evicts the least recently used ones if the cache is full.
+
+        Parameters
+        ----------
+        address_list: list
+            List of dictionaries that contain the data about each location
+        coordinates: list
+            List of strings that contain the coordinates of each location (the None values are ignored)
+        """
+
+        now = time.time()
+        rows = [(address_key(address_dict), lat_lon, now, now)
+                for address_dict, lat_lon in zip(address_list, coordinates) if lat_lon is not None]
+
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)', rows)
+            connection.execute('DELETE FROM geocodes WHERE created_at < ?', (now - self.max_age,))
+            connection.execute('DELETE FROM geocodes WHERE address IN (SELECT address FROM geocodes '
+                               'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+
+class BrowserPool:
+    """
+    Small pool of long-lived headless Chrome browsers used to search coordinates on Google Maps.
+
+    The browsers are opened on demand and kept open between searches, so only the first searches pay for the
+    browser start-up.
+
+    Parameters
+    ----------
+    chrome_path: str
+        Path of the Chrome driver
+    size: int
+        Maximum number of browsers open at the same time
+    timeout: float
+        Maximum time in seconds waiting for Google Maps to show the coordinates of an address
+    poll_interval: float
+        Time in seconds between two checks of the current url
+    """
+
+    def __init__(self, chrome_path, size=2, timeout=15, poll_interval=0.2):
+
+        self.chrome_path = chrome_path
+        self.size = size
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._num_drivers = 0
+
+    def _open_driver(self):
+
+        """
+        Opens a new headless Chrome browser.
+
+        Returns
+        -------
+        driver: selenium.webdriver.Chrome
+            Chrome browser
+        """
+
+        chrome_options = Options()
+        chrome_options.headless = True
+
+        return webdriver.Chrome(executable_path=self.chrome_path, options=chrome_options)
+
+    @contextmanager
+    def driver(self):
+
+        """
+        Borrows a browser from the pool, opening a new one if none is idle and the pool is not full.
+
+        Yields
+        ------
+        driver: selenium.webdriver.Chrome
+            Chrome browser
+        """
+
+        try:
+            driver = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._num_drivers < self.size
+                if can_open:
+                    self._num_drivers += 1
+            driver = None if can_open else self._idle.get()
+
+        # None is a free place in the pool (new or left by a browser that failed), filled with a new browser
+        if driver is None:
+            try:
+                driver = self._open_driver()
+            except BaseException:
+                self._idle.put(None)
+                raise
+
+        try:
+            yield driver
+        except BaseException:
+            # A browser that failed in any way (Example: the connection errors of a dead chromedriver) is quit and its
+            # place is handed to the next search, so the searches waiting for a browser never wait forever
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            self._idle.put(None)
+            raise
+        else:
+            self._idle.put(driver)
+
+    def search(self, url):
+
+        """
+        Opens the url and waits until Google Maps redirects to an url that contains the coordinates.
+
+        Parameters
+        ----------
+        url: str
+            Url that searches the address
+
+        Returns
+        -------
+        coordinates: str
+            String that contains the coordinates of the location or None if they were not found in time
+        """
+
+        with self.driver() as driver:
+            driver.get(url)
+
+            deadline = time.monotonic() + self.timeout
+            while True:
+                coordinates = findall(COORDINATES_PATTERN, driver.current_url)
+                if coordinates:
+                    return coordinates[0]
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(self.poll_interval)
+
+    def search_many(self, urls):
+
+        """
+        Searches several urls concurrently, using all the browsers of the pool.
+
+        Parameters
+        ----------
+        urls: list
+            List of urls that search the addresses
+
+        Returns
+        -------
+        coordinates: list
+            List of the coordinates of each url (None if they were not found)
+        """
+
+        # A search whose browser failed is not found, and the other searches go on
+        def search_or_none(url):
+            try:
+                return self.search(url)
+            except Exception:
+                return None
+
+        if len(urls) <= 1:
+            return [search_or_none(url) for url in urls]
+
+        with ThreadPoolExecutor(max_workers=min(self.size, len(urls))) as executor:
+            coordinates = list(executor.map(search_or_none, urls))
+
+        return coordinates
+
+    def close(self):
+
+        """
+        Closes all the idle browsers.
+        """
+
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._num_drivers -= 1
+            if driver is not None:
+                driver.quit()
+
+
+def geocode_addresses(address_list, backends):
+
+    """
+    Searches the coordinates of several addresses, trying the backends in order. Each backend only receives the
+    addresses that the previous ones did not find.
+
+    Parameters
+    ----------
+    address_list: list
+        List of dictionaries that contain the data about each location
+    backends: list
+        List of functions that receive a list of addresses and return the list of their coordinates (None for the
+        addresses not found)
+
+    Returns
+    -------
+    coordinates: list
+        List of strings that contain the coordinates of each location (None if no backend found them)
+    """
+
+    coordinates = [None] * len(address_list)
+
+    for backend in backends:
+        pending = [position for position, lat_lon in enumerate(coordinates) if lat_lon is None]
+        if not pending:
+            break
+
+        for position, lat_lon in zip(pending, backend([address_list[position] for position in pending])):
+            coordinates[position] = lat_lon
+
+    return coordinates
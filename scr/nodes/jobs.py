@@ -0,0 +1,544 @@
+# Import necessary libraries
+import multiprocessing
+import queue
+import time
+
+from nodes.metrics import Metrics
+from nodes.solver import ROUTING_STATUS, build_model, create_search_parameters, extract_solution, solve_model
+from nodes.tsp import solve_tsp
+
+# Worker processes are started from scratch, since the app runs in a multi-threaded process
+_context = multiprocessing.get_context('spawn')
+
+# Search configurations tried at the same time by a portfolio: which one wins depends on the shape of the instance
+PORTFOLIO = [{'first_solution_strategy': 'PATH_CHEAPEST_ARC', 'local_search_metaheuristic': 'GUIDED_LOCAL_SEARCH'},
+             {'first_solution_strategy': 'SAVINGS', 'local_search_metaheuristic': 'GUIDED_LOCAL_SEARCH'},
+             {'first_solution_strategy': 'CHRISTOFIDES', 'local_search_metaheuristic': 'GUIDED_LOCAL_SEARCH'},
+             {'first_solution_strategy': 'PARALLEL_CHEAPEST_INSERTION',
+              'local_search_metaheuristic': 'SIMULATED_ANNEALING'},
+             {'first_solution_strategy': 'PATH_CHEAPEST_ARC', 'local_search_metaheuristic': 'TABU_SEARCH'}]
+
+
+def run_solve_job(data, waiting_stop, max_travel_time, search_options, initial_routes, solutions, cancel_event):
+
+    """
+    Solves the problem in a worker process, publishing every improving solution as soon as it is found.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    search_options: dict
+        Keyword arguments of nodes.solver.create_search_parameters
+    initial_routes: list
+        Routes the search starts from (see nodes.solver.warm_start_routes) or None
+    solutions: multiprocessing.Queue
+        Queue where the solutions ('solution', solution), the metrics of the search ('metrics', snapshot) and the
+        final status ('done', status) are published
+    cancel_event: multiprocessing.Event
+        Event set when the job is cancelled
+    """
+
+    metrics = Metrics()
+    evaluations = [0]  # Evaluations of the transit callback, counted without the metrics lock
+
+    with metrics.stage('build_model'):
+        manager, routing = build_model(data, waiting_stop, max_travel_time, evaluations)
+        search_parameters = create_search_parameters(**search_options)
+    best_objective = []
+
+    def publish_solution():
+
+        """
+        Publishes the current solution if it is better than the previous ones and stops the search if the job was
+        cancelled.
+        """
+
+        objective = routing.CostVar().Max()
+        metrics.count('solutions')
+
+        if not best_objective or objective < best_objective[-1]:
+            best_objective.append(objective)
+            routes_all, route_times = extract_solution(data, manager, routing)
+            solutions.put(('solution', {'objective': objective, 'routes': routes_all, 'route_times': route_times}))
+
+        if cancel_event.is_set():
+            routing.solver().FinishCurrentSearch()
+
+    routing.AddAtSolutionCallback(publish_solution)
+    with metrics.stage('search'):
+        solve_model(manager, routing, search_parameters, initial_routes)
+
+    status = ROUTING_STATUS.get(routing.status(), str(routing.status()))
+    metrics.count('callback_evaluations', evaluations[0])
+    metrics.count('improving_solutions', len(best_objective))
+    metrics.count('search_branches', routing.solver().Branches())
+    metrics.count('search_failures', routing.solver().Failures())
+    metrics.label('solver_status', status)
+
+    solutions.put(('metrics', metrics.snapshot()))
+    solutions.put(('done', status))
+
+
+def run_tsp_job(data, max_travel_time, initial_routes, time_limit, neighbours, solutions, cancel_event):
+
+    """
+    Solves the problem of a single vehicle with the engine of nodes.tsp in a worker process.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem (with one vehicle)
+    max_travel_time: int
+        Maximum travel time of the vehicle in minutes
+    initial_routes: list
+        Route the search starts from (see nodes.solver.warm_start_routes) or None
+    time_limit: float
+        Maximum time of the local search in seconds
+    neighbours: int
+        Number of nearest neighbours of each location tried by the moves
+    solutions: multiprocessing.Queue
+        Queue where the solution, the metrics and the final status are published (see run_solve_job)
+    cancel_event: multiprocessing.Event
+        Event set when the job is cancelled (not read: the process is terminated)
+    """
+
+    metrics = Metrics()
+
+    result = solve_tsp(data, max_travel_time, initial_routes, neighbours, time_limit, metrics=metrics)
+
+    if result['routes'] is not None:
+        solutions.put(('solution', {'objective': result['objective'], 'routes': result['routes'],
+                                    'route_times': result['route_times']}))
+    metrics.label('solver_status', result['status'])
+
+    solutions.put(('metrics', metrics.snapshot()))
+    solutions.put(('done', result['status']))
+
+
+class SolveJob:
+    """
+    Solve that runs in a background process and can be followed and cancelled from the app.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    initial_routes: list
+        Routes the search starts from (see nodes.solver.warm_start_routes). If None, the search starts from scratch
+    **search_options:
+        Keyword arguments of nodes.solver.create_search_parameters (Example: time_limit=60)
+    """
+
+    def __init__(self, data, waiting_stop, max_travel_time, initial_routes=None, **search_options):
+
+        self.data = data
+        self.best = None  # Best solution found so far
+        self.num_solutions = 0
+        self.status = None
+        self.cancelled = False
+        self.metrics = None  # Metrics of the search, published when it finishes
+        self.started_at = None
+        self.seconds = None  # Wall time from the start to the end of the job
+        self._solutions = _context.Queue()
+        self._cancel_event = _context.Event()
+        self._process = _context.Process(target=run_solve_job,
+                                         args=(data, waiting_stop, max_travel_time, search_options, initial_routes,
+                                               self._solutions, self._cancel_event),
+                                         daemon=True)
+
+    def start(self):
+
+        """
+        Starts the worker process.
+
+        Returns
+        -------
+        job: SolveJob
+            The job itself
+        """
+
+        self.started_at = time.monotonic()
+        self._process.start()
+
+        return self
+
+    @property
+    def running(self):
+
+        """
+        True while the job has not finished.
+        """
+
+        return self.status is None
+
+    def poll(self):
+
+        """
+        Reads the solutions published since the last call.
+
+        Returns
+        -------
+        improved: bool
+            True if a better solution was found since the last call
+        """
+
+        improved = False
+
+        while True:
+            try:
+                kind, value = self._solutions.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'solution':
+                self.best = value
+                self.num_solutions += 1
+                improved = True
+            elif kind == 'metrics':
+                self.metrics = value
+            else:
+                self.status = value
+
+        # The process may have been terminated or may have crashed without publishing its status
+        if self.status is None and not self._process.is_alive() and self._solutions.empty():
+            self.status = 'CANCELLED' if self.cancelled else 'ROUTING_FAIL'
+
+        if self.status is not None and self.seconds is None:
+            self.seconds = time.monotonic() - self.started_at
+
+        return improved
+
+    def cancel(self, grace=1.0):
+
+        """
+        Stops the search, keeping the best solution found so far.
+
+        Parameters
+        ----------
+        grace: float
+            Time in seconds given to the solver to stop by itself before the process is terminated
+        """
+
+        if not self.running:
+            return
+
+        self.cancelled = True
+        self._cancel_event.set()
+
+        # The solver only checks the event when it finds a solution, so the process may have to be terminated
+        self._process.join(grace)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+        self.poll()
+        if self.status is None:
+            self.status = 'CANCELLED'
+            self.seconds = time.monotonic() - self.started_at
+
+
+class PortfolioJob:
+    """
+    Several solves of the same problem with different search strategies, run at the same time in background processes
+    under the same time limit. The best solution of all of them is kept, with the configuration that found it.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    configurations: list
+        List of dictionaries with the keyword arguments of nodes.solver.create_search_parameters of each solve
+        (Example: {'first_solution_strategy': 'SAVINGS', 'local_search_metaheuristic': 'GUIDED_LOCAL_SEARCH'}).
+        If None, PORTFOLIO is used
+    initial_routes: list
+        Routes the searches start from (see nodes.solver.warm_start_routes). If None, the searches start from scratch
+    time_limit: float
+        Maximum time of the searches in seconds (the metaheuristics only stop at the time limit)
+    """
+
+    def __init__(self, data, waiting_stop, max_travel_time, configurations=None, initial_routes=None, time_limit=60):
+
+        self.data = data
+        self.configurations = configurations or PORTFOLIO
+        self.jobs = [SolveJob(data, waiting_stop, max_travel_time, initial_routes=initial_routes,
+                              time_limit=time_limit, **configuration)
+                     for configuration in self.configurations]
+        self.best = None  # Best solution found so far, with the configuration that found it ('configuration')
+        self.num_solutions = 0
+        self.status = None
+        self.cancelled = False
+        self.metrics = None  # Metrics of all the searches, added together when they finish
+        self.seconds = None
+
+    def start(self):
+
+        """
+        Starts the worker processes.
+
+        Returns
+        -------
+        job: PortfolioJob
+            The job itself
+        """
+
+        for job in self.jobs:
+            job.start()
+
+        return self
+
+    @property
+    def running(self):
+
+        """
+        True while any of the solves has not finished.
+        """
+
+        return self.status is None
+
+    def poll(self):
+
+        """
+        Reads the solutions published by all the solves since the last call.
+
+        Returns
+        -------
+        improved: bool
+            True if a better solution was found since the last call
+        """
+
+        improved = False
+
+        for configuration, job in zip(self.configurations, self.jobs):
+            if job.poll() and (self.best is None or job.best['objective'] < self.best['objective']):
+                self.best = dict(job.best, configuration=configuration)
+                improved = True
+
+        self.num_solutions = sum(job.num_solutions for job in self.jobs)
+
+        # The portfolio succeeds if any of the solves succeeded
+        if self.status is None and all(not job.running for job in self.jobs):
+            statuses = [job.status for job in self.jobs]
+            if self.cancelled:
+                self.status = 'CANCELLED'
+            else:
+                self.status = next((status for status in ('ROUTING_OPTIMAL', 'ROUTING_SUCCESS') if status in statuses),
+                                   statuses[0])
+            self.seconds = max(job.seconds for job in self.jobs)
+
+            metrics = Metrics()
+            for job in self.jobs:
+                metrics.merge(job.metrics or {})
+            metrics.label('solver_status', self.status)
+            self.metrics = metrics.snapshot()
+
+        return improved
+
+    def cancel(self, grace=1.0):
+
+        """
+        Stops all the searches, keeping the best solution found so far.
+
+        Parameters
+        ----------
+        grace: float
+            Time in seconds given to each solver to stop by itself before its process is terminated
+        """
+
+        if not self.running:
+            return
+
+        self.cancelled = True
+        for job in self.jobs:
+            job.cancel(grace)
+
+        self.poll()
+
+
+class TSPJob:
+    """
+    Solve of a single vehicle with the engine of nodes.tsp. For a few hundred locations it takes a fraction of a
+    second, so it runs in the app's process when it starts, but it has the same interface as SolveJob. The
+    perturbations of a route that is too long are capped by kick_time_limit; larger problems, whose local search
+    alone takes seconds, are solved with BackgroundTSPJob.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem (with one vehicle)
+    max_travel_time: int
+        Maximum travel time of the vehicle in minutes
+    initial_routes: list
+        Route the search starts from (see nodes.solver.warm_start_routes). If None, the nearest neighbour route is used
+    time_limit: float
+        Maximum time of the local search in seconds
+    neighbours: int
+        Number of nearest neighbours of each location tried by the moves
+    kick_time_limit: float
+        Maximum time in seconds of the perturbations of a route that is too long
+    """
+
+    def __init__(self, data, max_travel_time, initial_routes=None, time_limit=None, neighbours=20,
+                 kick_time_limit=1.0):
+
+        self.data = data
+        self.max_travel_time = max_travel_time
+        self.initial_routes = initial_routes
+        self.time_limit = time_limit
+        self.neighbours = neighbours
+        self.kick_time_limit = kick_time_limit
+        self.best = None  # Solution found
+        self.num_solutions = 0
+        self.status = None
+        self.cancelled = False
+        self.metrics = None
+        self.seconds = None
+
+    def start(self):
+
+        """
+        Solves the problem.
+
+        Returns
+        -------
+        job: TSPJob
+            The job itself
+        """
+
+        metrics = Metrics()
+        started_at = time.monotonic()
+
+        result = solve_tsp(self.data, self.max_travel_time, self.initial_routes, self.neighbours, self.time_limit,
+                           kick_time_limit=self.kick_time_limit, metrics=metrics)
+
+        self.seconds = time.monotonic() - started_at
+        self.status = result['status']
+        if result['routes'] is not None:
+            self.best = {'objective': result['objective'], 'routes': result['routes'],
+                         'route_times': result['route_times']}
+            self.num_solutions = 1
+        metrics.label('solver_status', self.status)
+        self.metrics = metrics.snapshot()
+
+        return self
+
+    @property
+    def running(self):
+
+        """
+        Always False once the job started.
+        """
+
+        return self.status is None
+
+    def poll(self):
+
+        """
+        Nothing to read: the solution is known when the job starts.
+
+        Returns
+        -------
+        improved: bool
+            Always False
+        """
+
+        return False
+
+    def cancel(self, grace=1.0):
+
+        """
+        Nothing to stop: the job finishes when it starts.
+
+        Parameters
+        ----------
+        grace: float
+            Not used
+        """
+
+
+class BackgroundTSPJob(SolveJob):
+    """
+    Solve of a single vehicle with the engine of nodes.tsp in a background process, for searches that may take up to
+    the time limit (Example: large problems in the app, or the perturbations of a route that is too long in
+    nodes.fleet.FleetJob). It can be followed and cancelled like a SolveJob.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem (with one vehicle)
+    max_travel_time: int
+        Maximum travel time of the vehicle in minutes
+    initial_routes: list
+        Route the search starts from (see nodes.solver.warm_start_routes). If None, the nearest neighbour route is used
+    time_limit: float
+        Maximum time of the local search in seconds
+    neighbours: int
+        Number of nearest neighbours of each location tried by the moves
+    """
+
+    def __init__(self, data, max_travel_time, initial_routes=None, time_limit=None, neighbours=20):
+
+        super().__init__(data, None, max_travel_time, initial_routes)
+
+        # The worker process runs the engine of nodes.tsp instead of the routing model
+        self._process = _context.Process(target=run_tsp_job,
+                                         args=(data, max_travel_time, initial_routes, time_limit, neighbours,
+                                               self._solutions, self._cancel_event),
+                                         daemon=True)
+
+
+def solve_portfolio(data, waiting_stop, max_travel_time, configurations=None, initial_routes=None, time_limit=60,
+                    poll_interval=0.5):
+
+    """
+    Runs a portfolio of solves and waits until all of them finish.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    configurations: list
+        Search configurations of the solves (if None, PORTFOLIO is used)
+    initial_routes: list
+        Routes the searches start from or None
+    time_limit: float
+        Maximum time of the searches in seconds
+    poll_interval: float
+        Time in seconds between two reads of the solutions
+
+    Returns
+    -------
+    result: dict
+        Dictionary that contains the status of the portfolio ('status'), the objective value ('objective'), the
+        sequence of locations of each route ('routes'), the travel time of each route in seconds ('route_times') and
+        the search configuration that found the solution ('configuration'). All but the status are None if no
+        solution was found
+    """
+
+    job = PortfolioJob(data, waiting_stop, max_travel_time, configurations, initial_routes, time_limit).start()
+
+    while job.running:
+        time.sleep(poll_interval)
+        job.poll()
+
+    result = {'status': job.status, 'objective': None, 'routes': None, 'route_times': None, 'configuration': None}
+    if job.best is not None:
+        result.update(job.best)
+
+    return result
@@ -0,0 +1,224 @@
+# Import necessary libraries
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import folium
+import numpy as np
+from folium import plugins
+
+# Colors of the routes
+COLORS = ['darkred', 'green', 'pink', 'orange', 'purple', 'cadetblue', 'darkgreen',
+          'darkblue', 'red', 'lightblue', 'lightgreen', 'darkpurple', 'black', 'beige', 'lightgray']
+
+# Client-side marker: a small circle with the color of the route and the name of the delivery as tooltip
+MARKER_CALLBACK = """function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+                                {radius: 5, color: row[2], fillColor: row[2], fillOpacity: 0.8, weight: 1});
+    marker.bindTooltip(row[3]);
+    return marker;
+}"""
+
+
+def map_fingerprint(depot_address, deliveries_dict, routes_all=None):
+
+    """
+    Builds a fingerprint of everything shown on the map, so that a map already rendered can be reused.
+
+    Parameters
+    ----------
+    depot_address: dict
+        Data about the depot's location
+    deliveries_dict: dict
+        Data about the deliveries' locations
+    routes_all: dict
+        Sequence of locations of each route (None if there is no solution)
+
+    Returns
+    -------
+    fingerprint: str
+        SHA-1 hash of the locations, their labels and the routes
+    """
+
+    content = [[depot_address['lat'], depot_address['lon']],
+               [[delivery, deliveries_dict[delivery]['lat'], deliveries_dict[delivery]['lon'],
+                 deliveries_dict[delivery]['person'], deliveries_dict[delivery]['name'],
+                 deliveries_dict[delivery]['number']] for delivery in deliveries_dict],
+               sorted((int(vehicle), [int(node) for node in route_each])
+                      for vehicle, route_each in (routes_all or {}).items())]
+
+    return hashlib.sha1(json.dumps(content, default=str).encode('utf-8')).hexdigest()
+
+
+def simplify_line(points, tolerance):
+
+    """
+    Simplifies a line with the Douglas-Peucker algorithm: the points closer than the tolerance to the simplified line
+    are removed.
+
+    Parameters
+    ----------
+    points: list
+        List of [lat, lon] points of the line
+    tolerance: float
+        Maximum distance in degrees between a removed point and the simplified line
+
+    Returns
+    -------
+    points: list
+        List of the points kept, including the first and the last ones
+    """
+
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 2:
+        return points.tolist()
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        # Distance of the inner points to the segment between the ends
+        segment = points[end] - points[start]
+        inner = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack += [(start, middle), (middle, end)]
+
+    return points[keep].tolist()
+
+
+def build_large_map(depot_address, deliveries_dict, routes_all=None, tolerance=0.0005):
+
+    """
+    Creates a light map for plans with many deliveries: the markers are clustered in the browser from a compact list
+    of points and each route is a single simplified GeoJSON line.
+
+    Parameters
+    ----------
+    depot_address: dict
+        Data about the depot's location
+    deliveries_dict: dict
+        Data about the deliveries' locations
+    routes_all: dict
+        Sequence of locations of each route (if None, only the locations are shown)
+    tolerance: float
+        Tolerance in degrees of the simplification of the route lines (about 50 meters by default)
+
+    Returns
+    -------
+    map_solution: folium.Map
+        Map of the locations and routes
+    """
+
+    # Create the map
+    map_solution = folium.Map(location=[depot_address['lat'], depot_address['lon']], zoom_start=11.5)
+
+    # Add a marker for depot's location
+    folium.Marker(location=[depot_address['lat'], depot_address['lon']],
+                  popup='Sua Localização',
+                  tooltip='Sua Localização').add_to(map_solution)
+
+    def point(delivery, color):
+        return [deliveries_dict[delivery]['lat'], deliveries_dict[delivery]['lon'], color,
+                f'Entrega {delivery} - {deliveries_dict[delivery]["person"]}']
+
+    if routes_all is None:
+        plugins.FastMarkerCluster([point(delivery, 'gray') for delivery in deliveries_dict],
+                                  callback=MARKER_CALLBACK).add_to(map_solution)
+        return map_solution
+
+    for vehicle in routes_all:
+        color = COLORS[vehicle % len(COLORS)]
+        layer = folium.FeatureGroup(name=f'Veículo {vehicle + 1}').add_to(map_solution)
+
+        # Markers of the route, clustered in the browser
+        plugins.FastMarkerCluster([point(delivery, color) for delivery in routes_all[vehicle][1:-1]],
+                                  callback=MARKER_CALLBACK).add_to(layer)
+
+        # Route line (GeoJSON uses [lon, lat])
+        list_coord = [[depot_address['lat'], depot_address['lon']] if delivery_index == 0 else
+                      [deliveries_dict[delivery_index]['lat'], deliveries_dict[delivery_index]['lon']]
+                      for delivery_index in routes_all[vehicle]]
+        line = {'type': 'Feature',
+                'properties': {'vehicle': vehicle + 1, 'stops': len(routes_all[vehicle]) - 2},
+                'geometry': {'type': 'LineString',
+                             'coordinates': [[lon, lat] for lat, lon in simplify_line(list_coord, tolerance)]}}
+        folium.GeoJson(line, style_function=lambda feature, color=color: {'color': color, 'weight': 2},
+                       tooltip=f'Veículo {vehicle + 1}').add_to(layer)
+
+    folium.LayerControl().add_to(map_solution)
+
+    return map_solution
+
+
+class MapCache:
+    """
+    Bounded cache of the rendered HTML of the maps, shared by all the sessions and keyed by the map fingerprint.
+
+    Parameters
+    ----------
+    max_entries: int
+        Maximum number of maps kept (the least recently used are dropped first)
+    """
+
+    def __init__(self, max_entries=32):
+
+        self.max_entries = max_entries
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint):
+
+        """
+        Returns the HTML of a map already rendered.
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the map
+
+        Returns
+        -------
+        html: str
+            HTML of the map or None if it is not in the cache
+        """
+
+        with self._lock:
+            html = self._maps.get(fingerprint)
+            if html is not None:
+                self._maps.move_to_end(fingerprint)
+
+        return html
+
+    def put(self, fingerprint, html):
+
+        """
+        Keeps the HTML of a map.
+
+        Parameters
+        ----------
+        fingerprint: str
+            Fingerprint of the map
+        html: str
+            HTML of the map
+        """
+
+        with self._lock:
+            self._maps[fingerprint] = html
+            self._maps.move_to_end(fingerprint)
+            while len(self._maps) > self.max_entries:
+                self._maps.popitem(last=False)
@@ -0,0 +1,521 @@
+# Import necessary libraries
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import client
+from urllib import parse
+
+import numpy as np
+
+# Distance Matrix API endpoint
+DISTANCE_MATRIX_URL = 'https://maps.googleapis.com/maps/api/distancematrix/json'
+
+# Distance Matrix API limits per request
+MAX_ELEMENTS = 100
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+
+# HTTP and API statuses that are worth retrying
+RETRY_HTTP_STATUS = (429, 500, 502, 503, 504)
+RETRY_API_STATUS = ('OVER_QUERY_LIMIT', 'UNKNOWN_ERROR')
+
+
+class MatrixRequestError(RuntimeError):
+    """
+    Raised when the Distance Matrix API refuses a request or keeps failing after all the retries.
+    """
+
+
+def build_matrices(response):
+
+    """
+    Converts the Distance Matrix response into the distance matrix and the time travel matrix
+
+    Parameters
+    ----------
+    response: dict
+        Dictionary that contains the Distance Matrix response
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix (int32 array of the distances between the origin and destination addresses)
+    time_matrix: numpy.ndarray
+        Time travel matrix (int32 array of the time travel between the origin and destination addresses)
+    """
+
+    dist_matrix = np.array([[element['distance']['value'] for element in origin_address['elements']]
+                            for origin_address in response['rows']], dtype=np.int32)
+
+    time_matrix = np.array([[element['duration']['value'] for element in origin_address['elements']]
+                            for origin_address in response['rows']], dtype=np.int32)
+
+    return dist_matrix, time_matrix
+
+
+def split_evenly(size, num_chunks):
+
+    """
+    Splits a range into chunks whose sizes differ by at most one.
+
+    Parameters
+    ----------
+    size: int
+        Size of the range
+    num_chunks: int
+        Number of chunks
+
+    Returns
+    -------
+    bounds: list
+        List of (start, end) tuples of the chunks
+    """
+
+    q, r = divmod(size, num_chunks)  # The first r chunks get one extra item
+    bounds = []
+    start = 0
+
+    for index in range(num_chunks):
+        end = start + q + (1 if index < r else 0)
+        bounds.append((start, end))
+        start = end
+
+    return bounds
+
+
+def plan_blocks(num_origins, num_destinations, max_elements=MAX_ELEMENTS, max_origins=MAX_ORIGINS,
+                max_destinations=MAX_DESTINATIONS):
+
+    """
+    Splits an origins x destinations matrix into blocks that respect the limits of a Distance Matrix request, using
+    as few requests as possible.
+
+    Parameters
+    ----------
+    num_origins: int
+        Number of origin addresses (rows)
+    num_destinations: int
+        Number of destination addresses (columns)
+    max_elements: int
+        Maximum number of elements (origins x destinations) per request
+    max_origins: int
+        Maximum number of origins per request
+    max_destinations: int
+        Maximum number of destinations per request
+
+    Returns
+    -------
+    blocks: list
+        List of (row_start, row_end, col_start, col_end) tuples
+    """
+
+    if num_origins == 0 or num_destinations == 0:
+        return []
+
+    best = None
+
+    # Try every number of rows per block and take the widest block that fits
+    for rows in range(1, min(num_origins, max_origins, max_elements) + 1):
+        cols = min(num_destinations, max_destinations, max_elements // rows)
+        num_row_blocks = -(-num_origins // rows)
+        num_col_blocks = -(-num_destinations // cols)
+        num_requests = num_row_blocks * num_col_blocks
+
+        if best is None or num_requests < best[0]:
+            best = (num_requests, num_row_blocks, num_col_blocks)
+
+    _, num_row_blocks, num_col_blocks = best
+
+    # Balance the block sizes, so the last blocks are not almost empty
+    blocks = [(row_start, row_end, col_start, col_end)
+              for row_start, row_end in split_evenly(num_origins, num_row_blocks)
+              for col_start, col_end in split_evenly(num_destinations, num_col_blocks)]
+
+    return blocks
+
+
+class MatrixFetcher:
+    """
+    Sends requests to the Distance Matrix API concurrently.
+
+    Each worker thread keeps its own keep-alive connection, so the number of open connections is bounded by the
+    number of workers. Requests that hit the rate limit or a server error are retried with exponential backoff.
+
+    Parameters
+    ----------
+    api_key: str
+        String that contains the Distance Matrix API key
+    url: str
+        Endpoint of the Distance Matrix API (a local stand-in server can be used for testing)
+    max_workers: int
+        Maximum number of requests sent at the same time
+    max_retries: int
+        Maximum number of retries of each request
+    backoff: float
+        Waiting time in seconds before the first retry, doubled at each new retry
+    timeout: float
+        Timeout in seconds of each request
+    metrics: nodes.metrics.Metrics
+        Metrics where the requests, the elements and the retries are counted (if None, they are not counted)
+    """
+
+    def __init__(self, api_key, url=DISTANCE_MATRIX_URL, max_workers=4, max_retries=5, backoff=0.5, timeout=30,
+                 metrics=None):
+
+        self.api_key = api_key
+        self.url = parse.urlsplit(url)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.metrics = metrics
+        self._local = threading.local()
+        self._connections = []
+
+    def _connection(self, renew=False):
+
+        """
+        Returns the keep-alive connection of the current thread, opening it if necessary.
+
+        Parameters
+        ----------
+        renew: bool
+            If True, closes the current connection and opens a new one
+
+        Returns
+        -------
+        connection: http.client.HTTPConnection
+            Connection to the Distance Matrix API
+        """
+
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is not None and renew:
+            connection.close()
+            connection = None
+
+        if connection is None:
+            if self.url.scheme == 'https':
+                connection = client.HTTPSConnection(self.url.netloc, timeout=self.timeout)
+            else:
+                connection = client.HTTPConnection(self.url.netloc, timeout=self.timeout)
+            self._local.connection = connection
+            self._connections.append(connection)
+
+        return connection
+
+    def close(self):
+
+        """
+        Closes all the connections opened by the workers.
+        """
+
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._local = threading.local()
+
+    def _path(self, origin_addresses, dest_addresses):
+
+        """
+        Builds the path and the query string of a request.
+
+        Parameters
+        ----------
+        origin_addresses: list
+            List that contains the coordinates of origin locations
+        dest_addresses: list
+            List that contains the coordinates of destination locations
+
+        Returns
+        -------
+        path: str
+            Path and query string of the request
+        """
+
+        query = parse.urlencode({'units': 'metric',
+                                 'origins': '|'.join(origin_addresses),
+                                 'destinations': '|'.join(dest_addresses),
+                                 'key': self.api_key}, safe=',|')
+
+        return (self.url.path or '/') + '?' + query
+
+    def _wait(self, attempt, retry_after=None):
+
+        """
+        Sleeps before a retry.
+
+        Parameters
+        ----------
+        attempt: int
+            Number of the current retry, starting at 0
+        retry_after: str
+            Value of the Retry-After header sent by the server, if any
+        """
+
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff * 2 ** attempt
+            delay += random.uniform(0, delay)  # Jitter, so the workers do not retry at the same time
+
+        time.sleep(delay)
+
+    def request(self, origin_addresses, dest_addresses):
+
+        """
+        Sends one request, retrying it if necessary, and parses the response once.
+
+        Parameters
+        ----------
+        origin_addresses: list
+            List that contains the coordinates of origin locations
+        dest_addresses: list
+            List that contains the coordinates of destination locations
+
+        Returns
+        -------
+        dist_matrix: numpy.ndarray
+            Distance matrix of the block
+        time_matrix: numpy.ndarray
+            Time travel matrix of the block
+        """
+
+        path = self._path(origin_addresses, dest_addresses)
+        error = None
+        retry_after = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                if self.metrics is not None:
+                    self.metrics.count('api_retries')
+                self._wait(attempt - 1, retry_after)
+            retry_after = None
+
+            try:
+                connection = self._connection()
+                connection.request('GET', path, headers={'Connection': 'keep-alive'})
+                http_response = connection.getresponse()
+                body = http_response.read()
+            except (client.HTTPException, OSError) as exc:
+                # The server may close an idle keep-alive connection, so a new one is opened
+                self._connection(renew=True)
+                error = exc
+                continue
+
+            if http_response.status in RETRY_HTTP_STATUS:
+                retry_after = http_response.getheader('Retry-After')
+                error = MatrixRequestError(f'HTTP {http_response.status}')
+                continue
+            if http_response.status != 200:
+                raise MatrixRequestError(f'HTTP {http_response.status}: {body[:200]!r}')
+
+            response = json.loads(body)
+            status = response.get('status', 'OK')
+
+            if status in RETRY_API_STATUS:
+                error = MatrixRequestError(status)
+                continue
+            if status != 'OK':
+                raise MatrixRequestError(f"{status}: {response.get('error_message', '')}")
+
+            return build_matrices(response)
+
+        raise MatrixRequestError(f'Request failed after {self.max_retries} retries: {error}')
+
+    def fetch(self, requests):
+
+        """
+        Sends all the requests concurrently.
+
+        Parameters
+        ----------
+        requests: list
+            List of (origin_addresses, dest_addresses) tuples
+
+        Returns
+        -------
+        results: list
+            List of (dist_matrix, time_matrix) tuples, in the same order as the requests
+        """
+
+        if self.metrics is not None:
+            self.metrics.count('api_requests', len(requests))
+            self.metrics.count('api_elements', sum(len(origins) * len(destinations)
+                                                   for origins, destinations in requests))
+
+        try:
+            if len(requests) <= 1:
+                results = [self.request(origins, destinations) for origins, destinations in requests]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(requests))) as executor:
+                    results = list(executor.map(lambda block: self.request(*block), requests))
+        finally:
+            self.close()
+
+        return results
+
+
+def fetch_matrix(fetcher, origin_addresses, dest_addresses):
+
+    """
+    Requests the whole origins x destinations matrix in blocks and assembles the blocks.
+
+    Parameters
+    ----------
+    fetcher: MatrixFetcher
+        Fetcher used to send the requests
+    origin_addresses: list
+        List that contains the coordinates of origin locations
+    dest_addresses: list
+        List that contains the coordinates of destination locations
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix (int32 array of the distances between the origin and destination addresses)
+    time_matrix: numpy.ndarray
+        Time travel matrix (int32 array of the time travel between the origin and destination addresses)
+    """
+
+    blocks = plan_blocks(len(origin_addresses), len(dest_addresses))
+    requests = [(origin_addresses[row_start:row_end], dest_addresses[col_start:col_end])
+                for row_start, row_end, col_start, col_end in blocks]
+
+    dist_matrix = np.zeros((len(origin_addresses), len(dest_addresses)), dtype=np.int32)
+    time_matrix = np.zeros((len(origin_addresses), len(dest_addresses)), dtype=np.int32)
+
+    # Copy each block to its position in the full matrices
+    for (row_start, row_end, col_start, col_end), (dist_block, time_block) in zip(blocks, fetcher.fetch(requests)):
+        dist_matrix[row_start:row_end, col_start:col_end] = dist_block
+        time_matrix[row_start:row_end, col_start:col_end] = time_block
+
+    return dist_matrix, time_matrix
+
+
+def pack_origins(missing, max_elements=MAX_ELEMENTS, max_origins=MAX_ORIGINS, max_destinations=MAX_DESTINATIONS):
+
+    """
+    Plans the requests of the given origin x destination pairs. Origins that miss the same destinations are grouped
+    together and a group that fills a request by itself is tiled with plan_blocks. The other groups (Example: every
+    origin of a nearest-neighbour request misses its own destinations) are packed into requests over the union of
+    their destinations, up to the limits of a request, adding first the groups that share the most destinations.
+
+    Parameters
+    ----------
+    missing: dict
+        Dictionary that maps each origin position to the set of destination positions to be requested
+    max_elements: int
+        Maximum number of elements (origins x destinations) per request
+    max_origins: int
+        Maximum number of origins per request
+    max_destinations: int
+        Maximum number of destinations per request
+
+    Returns
+    -------
+    blocks: list
+        List of (origin positions, destination positions) tuples of each request
+    """
+
+    # Group the origins by the destinations they miss
+    groups = {}
+    for row, cols in sorted(missing.items()):
+        if cols:
+            groups.setdefault(tuple(sorted(cols)), []).append(row)
+
+    blocks = []
+    small = []  # Groups that fit in a request with others
+
+    for cols, rows in groups.items():
+        if len(rows) * len(cols) >= max_elements or len(rows) > max_origins or len(cols) > max_destinations:
+            for row_start, row_end, col_start, col_end in plan_blocks(len(rows), len(cols), max_elements,
+                                                                      max_origins, max_destinations):
+                blocks.append((rows[row_start:row_end], list(cols[col_start:col_end])))
+        else:
+            small.append((rows, set(cols)))
+
+    # Groups that share destinations with the request being packed are added first, the one that adds the fewest
+    # new destinations at a time
+    by_col = {}
+    for group, (_, cols) in enumerate(small):
+        for col in cols:
+            by_col.setdefault(col, []).append(group)
+
+    packed = [False] * len(small)
+    for first in range(len(small)):
+        if packed[first]:
+            continue
+        packed[first] = True
+        rows_packed, cols_packed = list(small[first][0]), set(small[first][1])
+
+        while True:
+            candidates = {group for col in cols_packed for group in by_col[col] if not packed[group]}
+            best = None
+            for group in candidates:
+                rows, cols = small[group]
+                num_rows = len(rows_packed) + len(rows)
+                num_cols = len(cols_packed | cols)
+                if num_rows <= max_origins and num_cols <= max_destinations and num_rows * num_cols <= max_elements:
+                    if best is None or (num_cols, group) < best:
+                        best = (num_cols, group)
+
+            # Without a group that shares destinations, the next group in order is tried
+            if best is None:
+                group = next((group for group in range(first + 1, len(small)) if not packed[group]), None)
+                if group is None:
+                    break
+                num_rows = len(rows_packed) + len(small[group][0])
+                num_cols = len(cols_packed | small[group][1])
+                if num_rows > max_origins or num_cols > max_destinations or num_rows * num_cols > max_elements:
+                    break
+                best = (num_cols, group)
+
+            group = best[1]
+            packed[group] = True
+            rows_packed += small[group][0]
+            cols_packed |= small[group][1]
+
+        blocks.append((rows_packed, sorted(cols_packed)))
+
+    return blocks
+
+
+def fetch_pairs(fetcher, origin_addresses, dest_addresses, missing):
+
+    """
+    Requests only the given origin x destination pairs, packed into as few block requests as possible (see
+    pack_origins). The cells of a block that were not asked for are discarded.
+
+    Parameters
+    ----------
+    fetcher: MatrixFetcher
+        Fetcher used to send the requests
+    origin_addresses: list
+        List that contains the coordinates of origin locations
+    dest_addresses: list
+        List that contains the coordinates of destination locations
+    missing: dict
+        Dictionary that maps each origin position to the set of destination positions to be requested
+
+    Returns
+    -------
+    pairs: dict
+        Dictionary that maps each (origin position, destination position) tuple to a (distance, time) tuple
+    """
+
+    blocks = pack_origins(missing)
+    requests = [([origin_addresses[row] for row in block_rows], [dest_addresses[col] for col in block_cols])
+                for block_rows, block_cols in blocks]
+
+    pairs = {}
+
+    for (block_rows, block_cols), (dist_block, time_block) in zip(blocks, fetcher.fetch(requests)):
+        for row, dist_row, time_row in zip(block_rows, dist_block.tolist(), time_block.tolist()):
+            for col, dist_value, time_value in zip(block_cols, dist_row, time_row):
+                if col in missing[row]:
+                    pairs[(row, col)] = (dist_value, time_value)
+
+    return pairs
@@ -0,0 +1,110 @@
+# Import necessary libraries
+import ast
+
+import numpy as np
+import pandas as pd
+
+
+def as_matrix(matrix):
+
+    """
+    Converts a matrix to a contiguous int32 array, without copying it if it already is one (memory-mapped arrays
+    stay memory-mapped).
+
+    Parameters
+    ----------
+    matrix: list
+        Matrix (list that contains list of the values between the origin and destination addresses) or array
+
+    Returns
+    -------
+    matrix: numpy.ndarray
+        Contiguous int32 array
+    """
+
+    return np.ascontiguousarray(matrix, dtype=np.int32)
+
+
+def save_matrices(path, dist_matrix, time_matrix):
+
+    """
+    Saves the distance and time travel matrices in a binary .npy file (one 2 x N x N int32 array).
+
+    Parameters
+    ----------
+    path: str
+        Path of the .npy file
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    """
+
+    np.save(path, np.stack([as_matrix(dist_matrix), as_matrix(time_matrix)]))
+
+
+def load_matrices(path, mmap=True):
+
+    """
+    Loads the distance and time travel matrices saved by save_matrices.
+
+    Parameters
+    ----------
+    path: str
+        Path of the .npy file
+    mmap: bool
+        If True, the file is memory-mapped read-only: it loads instantly and the processes that load the same file
+        share its pages
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    """
+
+    matrices = np.load(path, mmap_mode='r' if mmap else None)
+
+    return matrices[0], matrices[1]
+
+
+def read_matrices_csv(path):
+
+    """
+    Reads the distance and time travel matrices from a CSV file with the layout of data/matrices_example.csv (one
+    stringified row of each matrix per line).
+
+    Parameters
+    ----------
+    path: str
+        Path of the matrices CSV file
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    """
+
+    matrices = pd.read_csv(path)
+
+    return as_matrix(list(matrices['dist_matrix'].apply(ast.literal_eval))), \
+        as_matrix(list(matrices['time_matrix'].apply(ast.literal_eval)))
+
+
+def convert_matrices_csv(csv_path, npy_path):
+
+    """
+    Converts a matrices CSV file to the binary format.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path of the matrices CSV file
+    npy_path: str
+        Path of the .npy file
+    """
+
+    save_matrices(npy_path, *read_matrices_csv(csv_path))
@@ -0,0 +1,328 @@
+# Import necessary libraries
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from nodes.estimator import calibrate_estimator, estimate_matrices, haversine_matrix
+from nodes.matrix_fetch import fetch_pairs
+
+
+def location_key(address, precision=5):
+
+    """
+    Rounds the coordinates of a location, so that the same place always has the same key.
+
+    Parameters
+    ----------
+    address: str
+        String that contains the coordinates of the location ('lat,lon')
+    precision: int
+        Number of decimal places kept (5 decimal places are about 1 meter)
+
+    Returns
+    -------
+    key: str
+        Rounded coordinates of the location
+    """
+
+    lat, lon = (float(value) for value in address.split(','))
+
+    return f'{lat:.{precision}f},{lon:.{precision}f}'
+
+
+class TravelTimeStore:
+    """
+    On-disk store of the distance and time travel between pairs of locations.
+
+    Parameters
+    ----------
+    path: str
+        Path of the SQLite database file
+    max_age: float
+        Age in seconds after which a stored pair is considered expired
+    precision: int
+        Number of decimal places of the coordinates used as keys
+    """
+
+    def __init__(self, path, max_age=30 * 86400, precision=5):
+
+        self.path = path
+        self.max_age = max_age
+        self.precision = precision
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS pairs ('
+                               'origin TEXT NOT NULL, '
+                               'destination TEXT NOT NULL, '
+                               'distance INTEGER NOT NULL, '
+                               'duration INTEGER NOT NULL, '
+                               'fetched_at REAL NOT NULL, '
+                               'PRIMARY KEY (origin, destination))')
+
+        # The pairs that expired since the store was last used are not kept
+        self.purge()
+
+    def _connect(self):
+
+        """
+        Opens a connection to the database (one per call, so the store can be used from any thread).
+
+        Returns
+        -------
+        connection: sqlite3.Connection
+            Connection to the database
+        """
+
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_many(self, origins, destinations):
+
+        """
+        Looks up all the stored pairs between the given origins and destinations that have not expired.
+
+        Parameters
+        ----------
+        origins: list
+            List of origin keys
+        destinations: list
+            List of destination keys
+
+        Returns
+        -------
+        pairs: dict
+            Dictionary that maps each (origin key, destination key) tuple to a (distance, time) tuple
+        """
+
+        origins = list(set(origins))
+        destinations = set(destinations)
+        oldest = time.time() - self.max_age
+        pairs = {}
+
+        with self._connect() as connection:
+            # SQLite limits the number of parameters of a query
+            for start in range(0, len(origins), 500):
+                chunk = origins[start:start + 500]
+                rows = connection.execute(f'SELECT origin, destination, distance, duration FROM pairs '
+                                          f'WHERE fetched_at >= ? AND origin IN ({",".join("?" * len(chunk))})',
+                                          [oldest] + chunk)
+                for origin, destination, distance, duration in rows:
+                    if destination in destinations:
+                        pairs[(origin, destination)] = (distance, duration)
+
+        return pairs
+
+    def put_many(self, pairs):
+
+        """
+        Stores pairs, replacing the old values if they already exist, and deletes the expired pairs.
+
+        Parameters
+        ----------
+        pairs: dict
+            Dictionary that maps each (origin key, destination key) tuple to a (distance, time) tuple
+        """
+
+        fetched_at = time.time()
+
+        with self._connect() as connection:
+            connection.executemany('INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?)',
+                                   [(origin, destination, distance, duration, fetched_at)
+                                    for (origin, destination), (distance, duration) in pairs.items()])
+
+        self.purge()
+
+    def purge(self):
+
+        """
+        Deletes the expired pairs.
+        """
+
+        with self._connect() as connection:
+            connection.execute('DELETE FROM pairs WHERE fetched_at < ?', (time.time() - self.max_age,))
+
+
+def request_pairs(fetcher, store, keys, required=None):
+
+    """
+    Looks up the pairs in the store and requests to the Distance Matrix API only the ones that are missing.
+
+    Parameters
+    ----------
+    fetcher: MatrixFetcher
+        Fetcher used to send the requests
+    store: TravelTimeStore
+        Store of the pairs already known (if None, all the pairs are requested)
+    keys: list
+        List of unique location keys
+    required: dict
+        Dictionary that maps each origin position to the set of destination positions needed (if None, all the
+        pairs are needed)
+
+    Returns
+    -------
+    known: dict
+        Dictionary that maps each (origin key, destination key) tuple to a (distance, time) tuple
+    """
+
+    if required is None:
+        required = {row: range(len(keys)) for row in range(len(keys))}
+
+    known = store.get_many(keys, keys) if store is not None else {}
+
+    # Pairs that are not in the store (the travel from a location to itself is always zero)
+    missing = {}
+    for row, cols in required.items():
+        missing[row] = {col for col in cols if col != row and (keys[row], keys[col]) not in known}
+
+    if fetcher.metrics is not None:
+        num_required = sum(len([col for col in cols if col != row]) for row, cols in required.items())
+        fetcher.metrics.count('matrix_store_hits', num_required - sum(len(cols) for cols in missing.values()))
+
+    # Requesting the travel from a location to itself lets new locations share the same blocks
+    with_self = {}
+    for row, cols in missing.items():
+        if cols:
+            with_self.setdefault(frozenset(cols | {row}), []).append(row)
+    for rows in with_self.values():
+        if len(rows) > 1:
+            for row in rows:
+                missing[row].add(row)
+
+    if any(missing.values()):
+        fetched = fetch_pairs(fetcher, keys, keys, missing)
+        fetched = {(keys[row], keys[col]): values for (row, col), values in fetched.items()}
+        if store is not None:
+            store.put_many(fetched)
+        known.update(fetched)
+
+    return known
+
+
+def create_matrices_from_store(fetcher, store, addresses):
+
+    """
+    Creates the distance and time travel matrices, requesting to the Distance Matrix API only the pairs that are not
+    in the store yet.
+
+    Parameters
+    ----------
+    fetcher: MatrixFetcher
+        Fetcher used to send the requests
+    store: TravelTimeStore
+        Store of the pairs already known
+    addresses: list
+        List that contains the coordinates of the locations, including the depot's
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix (int32 array of the distances between the origin and destination addresses)
+    time_matrix: numpy.ndarray
+        Time travel matrix (int32 array of the time travel between the origin and destination addresses)
+    """
+
+    # Repeated locations are requested only once
+    keys = [location_key(address, store.precision) for address in addresses]
+    unique_keys = list(dict.fromkeys(keys))
+    positions = {key: position for position, key in enumerate(unique_keys)}
+
+    known = request_pairs(fetcher, store, unique_keys)
+
+    # The travel from a location to itself is zero
+    dist_unique = np.zeros((len(unique_keys), len(unique_keys)), dtype=np.int32)
+    time_unique = np.zeros((len(unique_keys), len(unique_keys)), dtype=np.int32)
+    for (origin, destination), (distance, duration) in known.items():
+        if origin != destination:
+            dist_unique[positions[origin], positions[destination]] = distance
+            time_unique[positions[origin], positions[destination]] = duration
+
+    # Expand the repeated locations
+    index = np.array([positions[key] for key in keys])
+
+    return dist_unique[np.ix_(index, index)], time_unique[np.ix_(index, index)]
+
+
+def create_sparse_matrices(fetcher, store, addresses, neighbours, calibration):
+
+    """
+    Creates the distance and time travel matrices requesting to the Distance Matrix API only the travels between each
+    location and its nearest neighbours (by straight-line distance) and the travels from and to the depot.
+
+    The other pairs are estimated from the coordinates, with the estimator calibrated on the pairs requested.
+
+    Parameters
+    ----------
+    fetcher: MatrixFetcher
+        Fetcher used to send the requests
+    store: TravelTimeStore
+        Store of the pairs already known (if None, all the pairs needed are requested)
+    addresses: list
+        List that contains the coordinates of the locations, including the depot's (first)
+    neighbours: int
+        Number of nearest neighbours requested for each location
+    calibration: dict
+        Calibration used if there are too few real pairs to calibrate the estimator (see calibrate_estimator)
+
+    Returns
+    -------
+    dist_matrix: numpy.ndarray
+        Distance matrix (int32 array of the distances between the origin and destination addresses)
+    time_matrix: numpy.ndarray
+        Time travel matrix (int32 array of the time travel between the origin and destination addresses)
+    estimated: numpy.ndarray
+        Boolean matrix that is True for the pairs that were estimated
+    """
+
+    # Repeated locations are requested only once
+    keys = [location_key(address) if store is None else location_key(address, store.precision)
+            for address in addresses]
+    unique_keys = list(dict.fromkeys(keys))
+    positions = {key: position for position, key in enumerate(unique_keys)}
+    lats, lons = np.array([[float(value) for value in key.split(',')] for key in unique_keys]).T
+
+    # Nearest neighbours of each location by straight-line distance
+    num_keys = len(unique_keys)
+    gc_matrix = haversine_matrix(lats, lons)
+    np.fill_diagonal(gc_matrix, np.inf)
+    neighbours = min(neighbours, num_keys - 1)
+    nearest = np.argpartition(gc_matrix, neighbours - 1, axis=1)[:, :neighbours] if neighbours > 0 else \
+        np.zeros((num_keys, 0), dtype=int)
+
+    # Depot legs and nearest neighbours
+    depot = positions[keys[0]]
+    required = {row: set(nearest[row].tolist()) | {depot} for row in range(num_keys)}
+    required[depot] = set(range(num_keys))
+
+    known = request_pairs(fetcher, store, unique_keys, required)
+
+    # Calibrate the estimator with the real pairs of this instance
+    real = np.zeros((num_keys, num_keys), dtype=bool)
+    dist_real = np.zeros((num_keys, num_keys))
+    time_real = np.zeros((num_keys, num_keys))
+    for (origin, destination), (distance, duration) in known.items():
+        row, col = positions[origin], positions[destination]
+        real[row, col] = row != col
+        dist_real[row, col] = distance
+        time_real[row, col] = duration
+
+    if real.sum() >= 10:
+        calibration = calibrate_estimator(lats, lons, dist_real, time_real, mask=real)
+
+    dist_estimated, time_estimated = estimate_matrices(lats, lons, calibration)
+    dist_unique = np.where(real, dist_real, dist_estimated)
+    time_unique = np.where(real, time_real, time_estimated)
+    np.fill_diagonal(dist_unique, 0)
+    np.fill_diagonal(time_unique, 0)
+
+    # Expand the repeated locations
+    index = np.array([positions[key] for key in keys])
+    dist_matrix = dist_unique[np.ix_(index, index)].astype(np.int32)
+    time_matrix = time_unique[np.ix_(index, index)].astype(np.int32)
+    estimated = ~real[np.ix_(index, index)] & (index[:, None] != index[None, :])
+
+    return dist_matrix, time_matrix, estimated
@@ -0,0 +1,246 @@
+# Import necessary libraries
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from re import sub
+
+
+class Metrics:
+    """
+    Wall time of each stage and counters of the work done (geocoding searches, requests to the API, cache hits,
+    solutions found...).
+
+    A session's metrics can have the metrics of the whole process as parent: everything recorded in the session is
+    recorded in the parent too. If log_path is given, every record is also appended to a JSON lines file.
+
+    Parameters
+    ----------
+    parent: Metrics
+        Metrics that also receive every record (if None, the records are only kept here)
+    log_path: str
+        Path of the JSON lines file where the records are appended (if None, the records are not written)
+    """
+
+    def __init__(self, parent=None, log_path=None):
+
+        self.parent = parent
+        self.log_path = log_path
+        self.stages = {}  # Calls, total seconds and seconds of the last call of each stage
+        self.counters = {}
+        self.labels = {}  # Last value of each label (Example: {'solver_status': 'ROUTING_SUCCESS'})
+        self._lock = threading.Lock()
+
+        if log_path is not None and os.path.dirname(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    def _log(self, record):
+
+        """
+        Appends a record to the JSON lines file.
+
+        Parameters
+        ----------
+        record: dict
+            Record to be written
+        """
+
+        if self.log_path is None:
+            return
+
+        record = dict(record, time=round(time.time(), 3))
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record) + '\n')
+        except OSError:
+            pass  # The metrics never stop the app
+
+    @contextmanager
+    def stage(self, name):
+
+        """
+        Measures the wall time of a stage.
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage (Example: 'create_matrices')
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds, calls=1):
+
+        """
+        Records the wall time of a stage.
+
+        Parameters
+        ----------
+        name: str
+            Name of the stage
+        seconds: float
+            Wall time in seconds
+        calls: int
+            Number of calls of the stage the time refers to
+        """
+
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'last': 0.0})
+            stage['calls'] += calls
+            stage['seconds'] += seconds
+            stage['last'] = seconds
+
+        self._log({'stage': name, 'seconds': round(seconds, 6)})
+        if self.parent is not None:
+            self.parent.observe(name, seconds, calls)
+
+    def count(self, name, value=1):
+
+        """
+        Increments a counter.
+
+        Parameters
+        ----------
+        name: str
+            Name of the counter (Example: 'api_requests')
+        value: int
+            Increment
+        """
+
+        if not value:
+            return
+
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        self._log({'counter': name, 'value': value})
+        if self.parent is not None:
+            self.parent.count(name, value)
+
+    def label(self, name, value):
+
+        """
+        Sets the value of a label.
+
+        Parameters
+        ----------
+        name: str
+            Name of the label (Example: 'solver_status')
+        value: str
+            Value of the label
+        """
+
+        with self._lock:
+            self.labels[name] = value
+
+        self._log({'label': name, 'value': value})
+        if self.parent is not None:
+            self.parent.label(name, value)
+
+    def merge(self, snapshot):
+
+        """
+        Adds the records of another Metrics (for example, the metrics of a worker process).
+
+        Parameters
+        ----------
+        snapshot: dict
+            Snapshot of the other Metrics (see snapshot)
+        """
+
+        for name, stage in snapshot.get('stages', {}).items():
+            self.observe(name, stage['seconds'], stage['calls'])
+        for name, value in snapshot.get('counters', {}).items():
+            self.count(name, value)
+        for name, value in snapshot.get('labels', {}).items():
+            self.label(name, value)
+
+    def snapshot(self):
+
+        """
+        Copies the current records.
+
+        Returns
+        -------
+        snapshot: dict
+            Dictionary that contains the stages ('stages'), the counters ('counters') and the labels ('labels')
+        """
+
+        with self._lock:
+            return {'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                    'counters': dict(self.counters),
+                    'labels': dict(self.labels)}
+
+
+def prometheus_text(snapshot, prefix='optrotas'):
+
+    """
+    Formats the records in the Prometheus text exposition format.
+
+    Parameters
+    ----------
+    snapshot: dict
+        Snapshot of a Metrics (see Metrics.snapshot)
+    prefix: str
+        Prefix of the names of the metrics
+
+    Returns
+    -------
+    text: str
+        Records in the Prometheus text format
+    """
+
+    def metric_name(name):
+        return sub(r'[^a-zA-Z0-9_]', '_', f'{prefix}_{name}')
+
+    lines = []
+
+    for suffix, kind, field in (('stage_calls_total', 'counter', 'calls'),
+                                ('stage_seconds_total', 'counter', 'seconds'),
+                                ('stage_last_seconds', 'gauge', 'last')):
+        lines.append(f'# TYPE {metric_name(suffix)} {kind}')
+        for name, stage in sorted(snapshot['stages'].items()):
+            lines.append(f'{metric_name(suffix)}{{stage="{name}"}} {stage[field]}')
+
+    for name, value in sorted(snapshot['counters'].items()):
+        lines.append(f'# TYPE {metric_name(name + "_total")} counter')
+        lines.append(f'{metric_name(name + "_total")} {value}')
+
+    for name, value in sorted(snapshot['labels'].items()):
+        lines.append(f'# TYPE {metric_name(name)} gauge')
+        lines.append(f'{metric_name(name)}{{value="{value}"}} 1')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, snapshot, prefix='optrotas'):
+
+    """
+    Writes the records to a Prometheus text file (for the node exporter's textfile collector), replacing it
+    atomically so it is never read half-written.
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+    snapshot: dict
+        Snapshot of a Metrics (see Metrics.snapshot)
+    prefix: str
+        Prefix of the names of the metrics
+    """
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            file.write(prometheus_text(snapshot, prefix))
+        os.replace(temporary_path, path)
+    except OSError:
+        pass  # The metrics never stop the app
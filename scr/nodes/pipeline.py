@@ -0,0 +1,147 @@
+# Import necessary libraries
+import hashlib
+
+import numpy as np
+
+
+def _update_hash(digest, value):
+
+    """
+    Adds a value to a hash, recursively for dictionaries, lists and tuples.
+
+    Parameters
+    ----------
+    digest: hashlib object
+        Hash being computed
+    value: object
+        Value added (arrays are hashed by their type, shape and content, other values by their representation)
+    """
+
+    if isinstance(value, np.ndarray):
+        digest.update(f'array:{value.dtype.str}:{value.shape};'.encode('utf-8'))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(f'dict:{len(value)};'.encode('utf-8'))
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}:{len(value)};'.encode('utf-8'))
+        for item in value:
+            _update_hash(digest, item)
+    else:
+        text = repr(value)
+        digest.update(f'{type(value).__name__}:{len(text)}:{text};'.encode('utf-8'))
+
+
+def content_hash(*values):
+
+    """
+    Builds a hash of the content of the inputs of a stage: equal inputs always give the same hash, in any session.
+
+    Parameters
+    ----------
+    *values:
+        Inputs of the stage (numbers, strings, dictionaries, lists, tuples, arrays or the hash of a previous stage)
+
+    Returns
+    -------
+    key: str
+        SHA-1 hash of the inputs
+    """
+
+    digest = hashlib.sha1()
+    _update_hash(digest, values)
+
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Last result of each stage of the app (coordinates, matrices, model...) and the hash of the inputs that produced
+    it, so that a rerun only computes again the stages whose inputs changed. The key of a stage includes the key of
+    the stage it depends on, so a change propagates to the next stages.
+
+    Parameters
+    ----------
+    metrics: Metrics
+        Metrics where the stages reused and computed are counted (optional)
+    """
+
+    def __init__(self, metrics=None):
+
+        self.metrics = metrics
+        self._stages = {}
+
+    def get(self, stage, key):
+
+        """
+        Returns the result of a stage if its inputs did not change.
+
+        Parameters
+        ----------
+        stage: str
+            Name of the stage
+        key: str
+            Hash of the current inputs of the stage (if None, the inputs are unknown and nothing is reused)
+
+        Returns
+        -------
+        value: object
+            Result of the stage or None if it was not computed for these inputs
+        """
+
+        stored_key, value = self._stages.get(stage, (None, None))
+
+        return value if key is not None and stored_key == key else None
+
+    def put(self, stage, key, value):
+
+        """
+        Keeps the result of a stage, replacing the previous one.
+
+        Parameters
+        ----------
+        stage: str
+            Name of the stage
+        key: str
+            Hash of the inputs of the stage
+        value: object
+            Result of the stage
+        """
+
+        self._stages[stage] = (key, value)
+
+    def run(self, stage, key, function, *args, **kwargs):
+
+        """
+        Returns the result of a stage, computing it only if its inputs changed.
+
+        Parameters
+        ----------
+        stage: str
+            Name of the stage
+        key: str
+            Hash of the current inputs of the stage
+        function: function
+            Function that computes the result of the stage
+        *args, **kwargs:
+            Arguments of the function
+
+        Returns
+        -------
+        value: object
+            Result of the stage
+        """
+
+        value = self.get(stage, key)
+
+        if value is None:
+            if self.metrics is not None:
+                self.metrics.count(f'stage_{stage}_computed')
+            value = function(*args, **kwargs)
+            self.put(stage, key, value)
+        elif self.metrics is not None:
+            self.metrics.count(f'stage_{stage}_reused')
+
+        return value
@@ -1,11 +1,154 @@
 # Import required libraries
-from re import findall
-from time import sleep
+import os
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
 import streamlit as st
 
+from nodes.bulk_import import example_key, import_deliveries, valid_states
+from nodes.gazetteer import GazetteerGeocoder
+from nodes.geocoding import BrowserPool, GeocodeCache, address_key, geocode_addresses, maps_search_url, \
+    split_coordinates
+from nodes.pipeline import content_hash
+from nodes.session import get_session_metrics, get_session_stages, get_session_state
+
+
+@st.cache(allow_output_mutation=True)
+def get_browser_pool(chrome_path, size, timeout):
+
+    """
+    Creates the pool of browsers once per process, so the browsers stay open between the reruns of the app.
+
+    Parameters
+    ----------
+    chrome_path: str
+        Path of the Chrome driver
+    size: int
+        Maximum number of browsers open at the same time
+    timeout: float
+        Maximum time in seconds waiting for the coordinates of an address
+
+    Returns
+    -------
+    pool: BrowserPool
+        Pool of headless browsers
+    """
+
+    return BrowserPool(chrome_path, size=size, timeout=timeout)
+
+
+@st.cache(allow_output_mutation=True)
+def get_gazetteer(gazetteer_path):
+
+    """
+    Loads the street gazetteer once per process.
+
+    Parameters
+    ----------
+    gazetteer_path: str
+        Path of the gazetteer CSV file
+
+    Returns
+    -------
+    gazetteer: GazetteerGeocoder
+        Offline geocoder or None if there is no gazetteer file
+    """
+
+    if not os.path.exists(gazetteer_path):
+        return None
+
+    return GazetteerGeocoder.from_file(gazetteer_path)
+
+
+@st.cache(allow_output_mutation=True)
+def get_geocode_cache(path, max_entries, max_age):
+
+    """
+    Opens the cache of coordinates once per process.
+
+    Parameters
+    ----------
+    path: str
+        Path of the cache file
+    max_entries: int
+        Maximum number of addresses kept
+    max_age: float
+        Age in seconds after which the coordinates of an address are searched again
+
+    Returns
+    -------
+    cache: GeocodeCache
+        Cache of the coordinates shared by all the sessions
+    """
+
+    return GeocodeCache(path, max_entries=max_entries, max_age=max_age)
+
+
+def fill_coordinates(address_dict, lat_lon):
+
+    """
+    Adds the coordinates to the dictionary of an address.
+
+    Parameters
+    ----------
+    address_dict: dict
+        Dictionary that contains the data about a location
+    lat_lon: str
+        String that contains the coordinates of the location
+    """
+
+    address_dict['lat_lon'] = lat_lon
+    address_dict['lat'], address_dict['lon'] = split_coordinates(lat_lon)
+
+
+def search_cached_coordinates_many(params, address_list):
+
+    """
+    Fills the coordinates of the addresses found in any previous session, with a single lookup in the cache.
+
+    Parameters
+    ----------
+    params: class
+        Required parameters
+    address_list: list
+        List of dictionaries that contain the data about each location
+    """
+
+    cache = get_geocode_cache(params.geocode_cache_path, params.geocode_cache_max_entries,
+                              params.geocode_cache_max_age)
+
+    for address_dict, lat_lon in zip(address_list, cache.get_many(address_list)):
+        if lat_lon is not None:
+            fill_coordinates(address_dict, lat_lon)
+
+
+@st.cache(suppress_st_warning=True)
+def read_deliveries_file(content, default_uf, default_city, valid_ufs, max_rows):
+
+    """
+    Reads and validates an uploaded file of deliveries once per content (see nodes.bulk_import.import_deliveries).
+
+    Parameters
+    ----------
+    content: bytes
+        Content of the file
+    default_uf: str
+        State used when a row has none
+    default_city: str
+        City used when a row has none
+    valid_ufs: tuple
+        Valid states
+    max_rows: int
+        Maximum number of rows read
+
+    Returns
+    -------
+    deliveries: list
+        List of dictionaries that contain the data about each valid delivery
+    errors: list
+        List of the descriptions of the invalid rows
+    """
+
+    return import_deliveries(content, default_uf, default_city, valid_ufs, max_rows=max_rows)
+
 
 def search_coordinates(params, address_dict):
 
@@ -25,37 +168,73 @@ def search_coordinates(params, address_dict):
         String that contains the coordinates of the location
     """
 
-    # Required variables
-    url = params.maps_url
-    address_name = address_dict['name']
-    address_number = address_dict['number']
-    address_uf = address_dict['uf']
-    address_city = address_dict['city']
-    url_complete = url + address_name.replace(' ', '+').lower() + ',+' + address_number + ',+' \
-                       + address_city.replace(' ', '+').lower() + ',+' + address_uf.lower()
+    return search_coordinates_many(params, [address_dict])[0]
+
 
-    # Open the Chrome browser
-    chrome_options = Options()
-    chrome_options.headless = True
-    driver = webdriver.Chrome(executable_path=params.chrome_path, options=chrome_options)
+def search_coordinates_many(params, address_list, metrics=None):
 
-    # Navigate to webpage
-    driver.get(url_complete)
+    """
+    Searches the coordinates of several addresses and adds them to the dictionaries of the addresses.
+
+    The addresses are searched first in the cache of coordinates, then in the offline street gazetteer, if there is
+    one, and only the addresses not found there are searched on Google Maps, all at the same time. The coordinates
+    found are kept in the cache.
 
-    # Wait 3 seconds
-    sleep(4)
+    Parameters
+    ----------
+    params: class
+        Required parameters
+    address_list: list
+        List of dictionaries that contain the data about each location
+    metrics: nodes.metrics.Metrics
+        Metrics where the searches and the addresses found by each backend are counted
 
-    # Save the current url in a variable (which contains the coordinates)
-    updated_url = driver.current_url
+    Returns
+    -------
+    coordinates: list
+        List of strings that contain the coordinates of each location (None if they were not found)
+    """
 
-    # Close the browser
-    driver.close()
+    cache = get_geocode_cache(params.geocode_cache_path, params.geocode_cache_max_entries,
+                              params.geocode_cache_max_age)
+    backends = [('cache', cache.get_many)]
 
-    # Get the coordinates in a string
-    coordinates = findall("-*\d+\.+\d*,-*\d+\.+\d*", updated_url)[0]
+    gazetteer = get_gazetteer(params.gazetteer_path)
+    if gazetteer is not None:
+        backends.append(('gazetteer', gazetteer.search_many))
+
+    def search_browser(addresses):
+        pool = get_browser_pool(params.chrome_path, params.browser_pool_size, params.geocode_timeout)
+        return pool.search_many([maps_search_url(params.maps_url, address_dict) for address_dict in addresses])
+
+    backends.append(('browser', search_browser))
+
+    def counted(name, backend):
+        def search(addresses):
+            with metrics.stage(f'geocode_{name}'):
+                coordinates = backend(addresses)
+            metrics.count(f'geocode_{name}_searches', len(addresses))
+            metrics.count(f'geocode_{name}_hits', sum(lat_lon is not None for lat_lon in coordinates))
+            return coordinates
+        return search
+
+    if metrics is not None:
+        metrics.count('geocode_calls')
+        metrics.count('geocode_addresses', len(address_list))
+        backends = [counted(name, backend) for name, backend in backends]
+    else:
+        backends = [backend for _, backend in backends]
+
+    coordinates = geocode_addresses(address_list, backends)
+    cache.put_many(address_list, coordinates)
+
+    for address_dict, lat_lon in zip(address_list, coordinates):
+        if lat_lon is not None:
+            fill_coordinates(address_dict, lat_lon)
 
     # Print the massage on the screen
-    st.sidebar.markdown('**Localização recebida**')
+    found = sum(lat_lon is not None for lat_lon in coordinates)
+    st.sidebar.markdown(f'**Localizações recebidas: {found} de {len(coordinates)}**')
 
     return coordinates
 
@@ -81,22 +260,17 @@ class InputAddresses:
             Returns True if data of the depot's location is from the example dataframe
         """
 
+        # Default values from the example (the depot is the first location)
+        depot_example = params.example_index['rows'][0]
+
         address_dict = {'name': st.sidebar.text_input(label="Digite o endereço da sua localização",
-                                                      value=params.locations_example.loc[
-                                                          params.locations_example['place'] == 'depot',
-                                                          'name'][0]).strip(),
+                                                      value=depot_example['name']).strip(),
                         'number': st.sidebar.text_input(label="Digite o número da sua localização",
-                                                        value=params.locations_example.loc[
-                                                            params.locations_example['place'] == 'depot',
-                                                            'number'][0]).strip(),
+                                                        value=str(depot_example['number'])).strip(),
                         'uf': st.sidebar.text_input(label="Digite a sigla do estado da sua localização",
-                                                    value=params.locations_example.loc[
-                                                        params.locations_example['place'] == 'depot',
-                                                        'uf'][0]).strip(),
+                                                    value=depot_example['uf']).strip(),
                         'city': st.sidebar.text_input(label="Digite a cidade da sua localização",
-                                                      value=params.locations_example.loc[
-                                                          params.locations_example['place'] == 'depot',
-                                                          'city'][0]).strip()}
+                                                      value=depot_example['city']).strip()}
 
         # Standardize the strings
         address_dict['name'] = address_dict['name'].title()
@@ -113,31 +287,17 @@ class InputAddresses:
         else:
             st.sidebar.markdown(f"Sua localização é **{depot_address_complete}**.")
 
-        if (address_dict['name'].lower() == params.locations_example.loc[params.locations_example.index == 0,
-                                                                         'name'][0].lower()) and \
-                (address_dict['number'] == str(params.locations_example.loc[params.locations_example.index == 0,
-                                                                            'number'][0])) and \
-                (address_dict['uf'].lower() == params.locations_example.loc[params.locations_example.index == 0,
-                                                                            'uf'][0].lower()) and \
-                (address_dict['city'].lower() == params.locations_example.loc[params.locations_example.index == 0,
-                                                                              'city'][0].lower()):
+        if params.example_index['positions'].get(example_key(address_dict)) == 0:
 
             # If the example is being used
             example = True
-            address_dict['lat_lon'] = params.locations_example.loc[params.locations_example.index == 0, 'lat_lon'][0]
-            address_dict['lat'] = params.locations_example.loc[params.locations_example.index == 0, 'lat'][0]
-            address_dict['lon'] = params.locations_example.loc[params.locations_example.index == 0, 'lon'][0]
+            address_dict['lat_lon'] = depot_example['lat_lon']
+            address_dict['lat'] = depot_example['lat']
+            address_dict['lon'] = depot_example['lon']
             # st.markdown(f'Coordenadas: {address_dict["lat"]}, {address_dict["lon"]}')
         else:
-            # Search the coordinates on Google Maps using Selenium
+            # The coordinates are filled later, together with the other addresses (see opt_setup)
             example = False
-            get_depot_coordinate = st.sidebar.checkbox(f'Enviar sua localização')
-
-            if get_depot_coordinate:
-                address_dict['lat_lon'] = search_coordinates(params, address_dict)
-                address_dict['lat'] = float(findall('-*\d+\.+\d*,', address_dict['lat_lon'])[0].replace(',', ''))
-                address_dict['lon'] = float(findall(',-*\d+\.+\d*', address_dict['lat_lon'])[0].replace(',', ''))
-                # st.markdown(f'Coordenadas: {address_dict["lat"]}, {address_dict["lon"]}')
 
         return address_dict, example
 
@@ -169,19 +329,14 @@ class InputAddresses:
         address_dict = {}
 
         # If the number of deliveries is smaller than 13 (since the example has only 12 locations)
-        if index < params.locations_example.shape[0]:
+        if index < len(params.example_index['rows']):
+            row_example = params.example_index['rows'][index]
             address_dict['person'] = st.sidebar.text_input(label=f"Digite o nome da pessoa da Entrega {index}",
-                                                           value=params.locations_example.loc[
-                                                               params.locations_example.index == index,
-                                                               'place'][index].title()).strip()
+                                                           value=row_example['place'].title()).strip()
             address_dict['name'] = st.sidebar.text_input(label=f"Digite o endereço da Entrega {index}",
-                                                         value=params.locations_example.loc[
-                                                             params.locations_example.index == index,
-                                                             'name'][index]).strip()
+                                                         value=row_example['name']).strip()
             address_dict['number'] = st.sidebar.text_input(label=f"Digite o número da da Entrega {index}",
-                                                           value=params.locations_example.loc[
-                                                               params.locations_example.index == index,
-                                                               'number'][index]).strip()
+                                                           value=str(row_example['number'])).strip()
         else:
             address_dict['person'] = st.sidebar.text_input(label=f"Digite o nome da pessoa da Entrega {index}").strip()
             address_dict['name'] = st.sidebar.text_input(label=f"Digite o endereço da Entrega {index}").strip()
@@ -214,31 +369,17 @@ class InputAddresses:
 
         # If the number of deliveries is smaller than 13 (since the example has only 12 locations) and
         # the example is being used
-        if index < params.locations_example.shape[0] and \
-                (address_dict['name'].lower() == params.locations_example.loc[params.locations_example.index == index,
-                                                                              'name'][index].lower()) and \
-                (address_dict['number'] == str(params.locations_example.loc[params.locations_example.index == index,
-                                                                            'number'][index])) and \
-                (address_dict['uf'].lower() == params.locations_example.loc[params.locations_example.index == index,
-                                                                            'uf'][index].lower()) and \
-                (address_dict['city'].lower() == params.locations_example.loc[params.locations_example.index == index,
-                                                                              'city'][index].lower()):
+        if params.example_index['positions'].get(example_key(address_dict)) == index:
 
             example = True
-            address_dict['lat_lon'] = params.locations_example.loc[params.locations_example.index == index,
-                                                                   'lat_lon'][index]
-            address_dict['lat'] = params.locations_example.loc[params.locations_example.index == index, 'lat'][index]
-            address_dict['lon'] = params.locations_example.loc[params.locations_example.index == index, 'lon'][index]
+            row_example = params.example_index['rows'][index]
+            address_dict['lat_lon'] = row_example['lat_lon']
+            address_dict['lat'] = row_example['lat']
+            address_dict['lon'] = row_example['lon']
             # st.markdown(f'Coordenadas: {address_dict["lat"]}, {address_dict["lon"]}')
         else:
-            # Search the coordinates on Google Maps using Selenium
+            # The coordinates are filled later, together with the other addresses (see opt_setup)
             example = False
-            get_depot_coordinate = st.sidebar.checkbox(f'Enviar localização da Entrega {index}')
-            if get_depot_coordinate:
-                address_dict['lat_lon'] = search_coordinates(params, address_dict)
-                address_dict['lat'] = float(findall('-*\d+\.+\d*,', address_dict['lat_lon'])[0].replace(',', ''))
-                address_dict['lon'] = float(findall(',-*\d+\.+\d*', address_dict['lat_lon'])[0].replace(',', ''))
-                # st.markdown(f'Coordenadas: {address_dict["lat"]}, {address_dict["lon"]}')
 
         return address_dict, example
 
@@ -278,16 +419,78 @@ def opt_setup(params):
     # DELIVERIES
     st.sidebar.header('Entregas')
 
-    number_deliveries = st.sidebar.number_input(label='Número de entregas', min_value=2, step=1, value=12)
-
-    # Create a dictionary with the addresses of the delivery locations
-    deliveries_dict = {}
-    deliveries_example = {}
-
-    for delivery_index in range(number_deliveries):
-        deliveries_dict[delivery_index + 1], deliveries_example[delivery_index + 1] = input_address.deliveries(
-            (delivery_index + 1), params, depot_address)
-
-    deliveries_example = False not in deliveries_example.values()
+    # Many deliveries can be imported from a file instead of typed one by one
+    uploaded_file = st.sidebar.file_uploader(label='Importar entregas (CSV ou XLSX)', type=['csv', 'xlsx'])
+
+    if uploaded_file is not None:
+        deliveries, errors = read_deliveries_file(uploaded_file.getvalue(), depot_address['uf'],
+                                                  depot_address['city'], valid_states(params.uf),
+                                                  params.max_import_rows)
+
+        # The dictionaries are copied, so the coordinates found are not kept in the cached result
+        deliveries_dict = {delivery_index + 1: dict(address_dict)
+                           for delivery_index, address_dict in enumerate(deliveries)}
+        number_deliveries = len(deliveries_dict)
+        deliveries_example = False
+
+        st.sidebar.markdown(f'**Entregas importadas: {number_deliveries}**')
+        if errors:
+            st.sidebar.markdown(f'**Linhas ignoradas: {len(errors)}**')
+            st.sidebar.text('\n'.join(errors[:20]))
+
+    else:
+        number_deliveries = st.sidebar.number_input(label='Número de entregas', min_value=2, step=1, value=12)
+
+        # Create a dictionary with the addresses of the delivery locations
+        deliveries_dict = {}
+        deliveries_example = {}
+
+        for delivery_index in range(number_deliveries):
+            deliveries_dict[delivery_index + 1], deliveries_example[delivery_index + 1] = input_address.deliveries(
+                (delivery_index + 1), params, depot_address)
+
+        deliveries_example = False not in deliveries_example.values()
+
+    # Coordinates stage: the coordinates already found in this session for the same addresses are reused without
+    # looking them up again
+    address_list = [depot_address] + list(deliveries_dict.values())
+    coordinates_key = content_hash([[address_dict.get(column) for column in ('name', 'number', 'uf', 'city', 'lat_lon')]
+                                    for address_dict in address_list])
+    stages = get_session_stages(params.metrics_log_path)
+    coordinates = stages.get('coordinates', coordinates_key)
+
+    if coordinates is not None:
+        for address_dict, lat_lon in zip(address_list, coordinates):
+            if lat_lon is not None and 'lat_lon' not in address_dict:
+                fill_coordinates(address_dict, lat_lon)
+    else:
+        # Coordinates found in previous sessions
+        search_cached_coordinates_many(params, [address_dict for address_dict in address_list
+                                                if 'lat_lon' not in address_dict])
+
+    # Search the coordinates of all the addresses that are not from the example at once
+    pending = [address_dict for address_dict in address_list if 'lat_lon' not in address_dict]
+
+    if pending:
+        get_coordinates = st.sidebar.checkbox('Enviar localizações')
+
+        if get_coordinates:
+            # The addresses not found in this session are only searched again when asked, not on every rerun (the app
+            # reruns every second while an optimization runs)
+            misses = get_session_state().setdefault('geocode_misses', set())
+            not_found = [address_dict for address_dict in pending if address_key(address_dict) in misses]
+            if not_found:
+                st.sidebar.markdown(f'Localizações não encontradas: **{len(not_found)}**')
+                if st.sidebar.button('Buscar novamente as localizações não encontradas'):
+                    misses.difference_update(address_key(address_dict) for address_dict in not_found)
+
+            searched = [address_dict for address_dict in pending if address_key(address_dict) not in misses]
+            if searched:
+                metrics = get_session_metrics(params.metrics_log_path)
+                with metrics.stage('search_coordinates'):
+                    search_coordinates_many(params, searched, metrics)
+                misses.update(address_key(address_dict) for address_dict in searched if 'lat_lon' not in address_dict)
+
+    stages.put('coordinates', coordinates_key, [address_dict.get('lat_lon') for address_dict in address_list])
 
     return depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example
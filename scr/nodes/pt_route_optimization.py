@@ -1,13 +1,25 @@
 # Import necessary libraries
-import json
-from urllib import request
+from time import sleep
 
 import folium
 import streamlit as st
+import streamlit.components.v1 as components
 from folium import plugins
-from ortools.constraint_solver import pywrapcp
-from ortools.constraint_solver import routing_enums_pb2
-from streamlit_folium import folium_static
+
+from nodes.colocation import collapse_locations, collapse_matrix, expand_result
+from nodes.decomposition import DecomposedJob
+from nodes.estimator import estimate_matrices
+from nodes.feasibility import check_feasibility, drop_penalty
+from nodes.fleet import FleetJob
+from nodes.jobs import PORTFOLIO, BackgroundTSPJob, PortfolioJob, SolveJob, TSPJob
+from nodes.map_render import build_large_map, map_fingerprint
+from nodes.matrix_fetch import MatrixFetcher, fetch_matrix
+from nodes.matrix_store import TravelTimeStore, create_matrices_from_store, create_sparse_matrices
+from nodes.metrics import write_prometheus
+from nodes.pipeline import content_hash
+from nodes.session import get_map_cache, get_process_metrics, get_session_metrics, get_session_stages, \
+    get_session_state
+from nodes.solver import create_data_model, node_keys, warm_start_routes
 
 
 def pretty_time_delta(seconds):
@@ -43,7 +55,7 @@ def pretty_time_delta(seconds):
     return time
 
 
-def create_data(api_key, addresses):
+def create_data(api_key, addresses, store_path=None, store_max_age=None, neighbours=None, calibration=None):
 
     """
     Creates a dictionary that contains the API key and the coordinates of the locations
@@ -54,6 +66,15 @@ def create_data(api_key, addresses):
         String that contains the Distance Matrix API key
     addresses: list
         List that contains the coordinates of the locations, including the depot's
+    store_path: str
+        Path of the store of the pairs already requested (if None, all the pairs are requested)
+    store_max_age: float
+        Age in seconds after which a stored pair is requested again
+    neighbours: int
+        If given, only the travels to the nearest neighbours of each location and from and to the depot are
+        requested, and the other pairs are estimated
+    calibration: dict
+        Calibration of the estimator used for the pairs that are not requested
     Returns
     -------
     data: dict
@@ -61,102 +82,15 @@ def create_data(api_key, addresses):
     """
 
     data = {'api_key': api_key,
-            'addresses': addresses}  # Locations - [lat, lon]
+            'addresses': addresses,  # Locations - [lat, lon]
+            'store_path': store_path,
+            'store_max_age': store_max_age,
+            'neighbours': neighbours,
+            'calibration': calibration}
 
     return data
 
 
-def request_info(origin_addresses, dest_addresses, api_key):
-
-    """
-    Build and send request of the given origin and destination addresses for the Distance Matrix
-
-    Parameters
-    ----------
-    origin_addresses: list
-        List that contains the coordinates of origin locations
-    dest_addresses: list
-        List that contains the coordinates of destination locations
-    api_key: str
-        String that contains the Distance Matrix API key
-
-    Returns
-    -------
-    response: dict
-        Dictionary that contains the Distance Matrix response
-    """
-
-    url_beginning = 'https://maps.googleapis.com/maps/api/distancematrix/json?units=metric'
-
-    def build_str_addresses(addresses):
-
-        """
-        Builds a pipe-separated string of addresses
-
-        Parameters
-        ----------
-        addresses: list
-            List that contains the coordinates of locations
-
-        Returns
-        -------
-        address_str: str
-            Pipe-separated string of the coordinates of the addresses
-        """
-
-        address_str = ''
-
-        for index in range(len(addresses) - 1):
-            address_str += addresses[index] + '|'
-        address_str += addresses[-1]
-        return address_str
-
-    # Strings for origins and destinations
-    origins_str = build_str_addresses(origin_addresses)
-    destinations_str = build_str_addresses(dest_addresses)
-
-    url_complete = url_beginning + '&origins=' + origins_str + '&destinations=' + destinations_str + '&key=' + api_key
-
-    result = request.urlopen(url_complete).read()
-    response = json.loads(result)
-
-    return response
-
-
-def build_matrices(response):
-
-    """
-    Converts the Distance Matrix response into the distance matrix and the time travel matrix
-
-    Parameters
-    ----------
-    response: dict
-        Dictionary that contains the Distance Matrix response
-
-    Returns
-    -------
-    dist_matrix: list
-        Distance matrix (list that contains list of the distances between the origin and destination addresses)
-    time_matrix: list
-        Time travel matrix (list that contains list of the time travel between the origin and destination addresses)
-    """
-
-    dist_matrix = []
-    time_matrix = []
-
-    for origin_address in response['rows']:
-        dist_list = [origin_address['elements'][dest_address]['distance']['value']
-                     for dest_address in range(len(origin_address['elements']))]
-
-        time_list = [origin_address['elements'][dest_address]['duration']['value']
-                     for dest_address in range(len(origin_address['elements']))]
-
-        dist_matrix.append(dist_list)
-        time_matrix.append(time_list)
-
-    return dist_matrix, time_matrix
-
-
 @st.cache(suppress_st_warning=True)
 def create_matrices(data):
 
@@ -170,126 +104,146 @@ def create_matrices(data):
 
     Returns
     -------
-    dist_matrix: list
-        Distance matrix (list that contains list of the distances between the origin and destination addresses)
-    time_matrix: list
-        Time travel matrix (list that contains list of the time travel between the origin and destination addresses)
+    dist_matrix: numpy.ndarray
+        Distance matrix (int32 array of the distances between the origin and destination addresses)
+    time_matrix: numpy.ndarray
+        Time travel matrix (int32 array of the time travel between the origin and destination addresses)
+    estimated: numpy.ndarray
+        Matrix that is True for the pairs that were estimated instead of requested (None if all were requested)
     """
 
     addresses = data["addresses"]
     api_key = data["api_key"]
 
-    # Distance Matrix API only accepts 100 elements per request
-    max_elements = 100
-    num_addresses = len(addresses)  # Example: 11
-    # Maximum number of rows that can be computes per request
-    max_rows = max_elements // num_addresses
-    q, r = divmod(num_addresses, max_rows)  # num_addresses = q * max_rows + r (Example: q = 1 and r = 2)
-    dest_addresses = addresses
-
-    distance_matrix = []
-    time_matrix = []
-
-    # Send q requests, returning max_rows rows per request
-    for index in range(q):
-        origin_addresses = addresses[index * max_rows:(index + 1) * max_rows]
-        response = request_info(origin_addresses=origin_addresses, dest_addresses=dest_addresses, api_key=api_key)
-        distance_matrix += build_matrices(response)[0]
-        time_matrix += build_matrices(response)[1]
-
-    # Get the remaining remaining r rows, if necessary
-    if r > 0:
-        origin_addresses = addresses[q * max_rows:q * max_rows + r]
-        response = request_info(origin_addresses=origin_addresses, dest_addresses=dest_addresses, api_key=api_key)
-        distance_matrix += build_matrices(response)[0]
-        time_matrix += build_matrices(response)[1]
+    # Split the matrix into origin x destination blocks that respect the request limits and send them concurrently
+    fetcher = MatrixFetcher(api_key=api_key, metrics=get_session_metrics())
+    estimated = None
+
+    if data.get('neighbours'):
+        # Only the nearest neighbours and the depot legs are requested
+        store = TravelTimeStore(data['store_path'], max_age=data['store_max_age']) if data.get('store_path') else None
+        distance_matrix, time_matrix, estimated = create_sparse_matrices(fetcher, store, addresses,
+                                                                         data['neighbours'], data['calibration'])
+    elif data.get('store_path'):
+        # Only the pairs that are not in the store are requested
+        store = TravelTimeStore(data['store_path'], max_age=data['store_max_age'])
+        distance_matrix, time_matrix = create_matrices_from_store(fetcher, store, addresses)
+    else:
+        distance_matrix, time_matrix = fetch_matrix(fetcher, addresses, addresses)
 
-    return distance_matrix, time_matrix
+    return distance_matrix, time_matrix, estimated
 
 
-def create_data_model(number_vehicles, dist_matrix, time_matrix):
+def print_solution(result):
 
     """
-    Stores the data for the problem
+    Prints the answer on the screen.
 
     Parameters
     ----------
-    number_vehicles: int
-        Number of vehicles
-    dist_matrix: list
-        Distance matrix
-    time_matrix: list
-        Time travel matrix
+    result: dict
+        Dictionary that contains the solution of the problem (see nodes.solver.solve)
 
     Returns
     -------
-    data: dict
-        Dictionary that contains the data for the problem
+    routes_all: dict
+       Dictionary containing the sequence of locations of all routes
     """
 
-    data = {'distance_matrix': dist_matrix,
-            'time_matrix': time_matrix,
-            'num_vehicles': number_vehicles,
-            'depot': 0}
+    # st.write(f'Objective: {result["objective"]} seconds')
+    routes_all = result['routes']
+    max_route_time = 0
+    for vehicle_id, route_each in routes_all.items():
+        st.markdown(f'Rota para o **veículo {vehicle_id + 1}**')
+        plan_output = ' ->'.join(f' {node}' for node in route_each)
+        route_time = result['route_times'][vehicle_id]
+        st.markdown(f'**{plan_output}**')
+        st.markdown(f'Tempo da rota: **{pretty_time_delta(route_time)}**')
+        max_route_time = max(route_time, max_route_time)
+    st.markdown(f'**Tempo Máximo de todas as rotas: {pretty_time_delta(max_route_time)}**')
 
-    return data
+    return routes_all
 
 
-def print_solution(data, manager, routing, solution):
+def build_map(depot_address, deliveries_dict, routes_all=None):
 
     """
-    Prints the answer on the screen.
+    Creates the map with the locations and, if there is a solution, the route of each vehicle.
 
     Parameters
     ----------
-    data: dict
-        Dictionary that contains the data for the problem
-    manager:
-        Routing Index Manager
-    routing:
-        Routing Model
-    solution:
-        Solution of the problem
+    depot_address: dict
+        Data about the depot's location
+    deliveries_dict: dict
+        Data about the deliveries' locations
+    routes_all: dict
+        Sequence of locations of each route (if None, only the locations are shown)
 
     Returns
     -------
-    routes_all: list
-       List containing the sequence of locations of all routes
+    map_solution: folium.Map
+        Map of the locations and routes
     """
 
-    # st.write(f'Objective: {solution.ObjectiveValue()} seconds')
-    total_time = 0
-    routes_all = {}
-    for vehicle_id in range(data['num_vehicles']):
-        index = routing.Start(vehicle_id)
-        st.markdown(f'Rota para o **veículo {vehicle_id + 1}**')
-        route_each = []
-        plan_output = ''
-        route_time = 0
-        max_route_time = 0
-        i = 0
-        while not routing.IsEnd(index):
-            plan_output += f' {manager.IndexToNode(index)} ->'
-            route_each.append(manager.IndexToNode(index))
-            previous_index = index
-            index = solution.Value(routing.NextVar(index))
-            route_time += routing.GetArcCostForVehicle(
-                previous_index, index, vehicle_id)
-            i += 1
-        route_each.append(0)
-        plan_output += f' {manager.IndexToNode(index)}'
-        routes_all[vehicle_id] = route_each
-        st.markdown(f'**{plan_output}**')
-        st.markdown(f'Tempo da rota: **{pretty_time_delta(route_time)}**')
-        total_time += route_time
-        max_route_time = max(route_time, max_route_time)
-    # st.markdown(f'**Total Time of all routes: {total_time} seconds**')
-    st.markdown(f'**Tempo Máximo de todas as rotas: {pretty_time_delta(max_route_time)}**')
+    # List of colors
+    colors = ['darkred', 'green', 'pink', 'orange', 'purple', 'cadetblue', 'darkgreen',
+              'darkblue', 'red', 'lightblue', 'lightgreen', 'darkpurple', 'black', 'beige', 'lightgray']
 
-    return routes_all
+    # Create the map
+    map_solution = folium.Map(location=[depot_address['lat'], depot_address['lon']], zoom_start=11.5)
+
+    # Add a marker for depot's location
+    folium.Marker(location=[depot_address['lat'], depot_address['lon']],
+                  popup='Sua Localização',
+                  tooltip=f'Sua Localização', ).add_to(map_solution)
+
+    # Add a marker for deliveries' location
+    if routes_all is None:
+        for delivery in deliveries_dict:
+            folium.Marker(location=[deliveries_dict[delivery]['lat'], deliveries_dict[delivery]['lon']],
+                          icon=folium.Icon(color='lightgray', icon=None),
+                          popup=f'''{deliveries_dict[delivery]["person"]}
+{deliveries_dict[delivery]["name"]}, n°{deliveries_dict[delivery]["number"]}''',
+                          tooltip=f'Entrega {delivery} - {deliveries_dict[delivery]["person"]}').add_to(
+                map_solution)
+    else:
+        # st.write('Solution found')
+        for vehicle in routes_all:
+            color = colors[vehicle % len(colors)]
+
+            # Group the markers according to the vehicle
+            for delivery_index in routes_all[vehicle][1:-1]:
+                folium.Marker(
+                    location=[deliveries_dict[delivery_index]['lat'], deliveries_dict[delivery_index]['lon']],
+                    icon=folium.Icon(color=color, icon=None),
+                    popup=f'''{deliveries_dict[delivery_index]["person"]}
+{deliveries_dict[delivery_index]["name"]}, n°{deliveries_dict[delivery_index]["number"]}''',
+                    tooltip=f'Entrega {delivery_index} - {deliveries_dict[delivery_index]["person"]}').add_to(
+                    map_solution)
 
+            list_coord = []
+            for delivery_index in routes_all[vehicle]:
+                if delivery_index == 0:
+                    list_coord.append([depot_address['lat'], depot_address['lon']])
+                else:
+                    list_coord.append(
+                        [deliveries_dict[delivery_index]['lat'], deliveries_dict[delivery_index]['lon']])
 
-def route_opt(depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example, matrices_example):
+            sequence = folium.PolyLine(locations=list_coord,
+                                       weight=1, color=color, opacity=0).add_to(map_solution)
+
+            attr = {'fill': color}
+
+            plugins.PolyLineTextPath(sequence,
+                                     '\u25BA',
+                                     repeat=True,
+                                     offset=6,
+                                     attributes=attr).add_to(map_solution)
+
+    return map_solution
+
+
+def route_opt(depot_address, number_deliveries, deliveries_dict, depot_example, deliveries_example, params):
 
     """
     Function to run in the main section and show the results, including the best route for each vehicle and a map.
@@ -306,8 +260,8 @@ def route_opt(depot_address, number_deliveries, deliveries_dict, depot_example,
         Returns True if the data of the depot's location is from the example dataframe
     deliveries_example: bool
         Returns True if the data of the location is from the example dataframe
-    matrices_example: Pandas DataFrame
-        Dataframe containing the example of the distance and time travel matrices
+    params: class
+        Required parameters
 
     Returns
     -------
@@ -343,11 +297,15 @@ def route_opt(depot_address, number_deliveries, deliveries_dict, depot_example,
                     unsafe_allow_html=True)
         st.markdown('<ol><li>Preencha os campos da seção <b>Otimização de rotas</b> abaixo.</li>'
                     '<li>Quando estiver tudo pronto, clique em <b>Iniciar otimização</b>.</li>'
-                    '</ol>', unsafe_allow_html=True)
+                    '</ol>'
+                    '<p>Também é possível usar outros endereços sem a chave escolhendo a fonte <b>Estimativa em linha '
+                    'reta</b>, que calcula as distâncias e os tempos a partir das coordenadas.</p>',
+                    unsafe_allow_html=True)
         st.markdown('<h4 align="center">Para quem <u>possui</u> a chave</h4>', unsafe_allow_html=True)
         st.markdown('<ol><li>Preencha os campos da seção <b>Configurações</b> na barra lateral.</li>'
                     '<li>Após alterado qualquer informação de endereço, clique na caixa de seleção <b>Enviar '
-                    'localização</b> que aparecerá assim que a modificação for feita.</li>'
+                    'localizações</b> que aparecerá no final da barra lateral assim que a modificação for feita. '
+                    'Todas as localizações pendentes são buscadas ao mesmo tempo.</li>'
                     '<li>Preencha os campos na seção <b>Otimização de rotas</b> abaixo.</li>'
                     '<li>Clique na caixa de seleção <b>Enviar dados para otimização</b>.'
                     '<li>Insira a <b>chave da API de Matriz de Distância</b>.'
@@ -369,160 +327,286 @@ def route_opt(depot_address, number_deliveries, deliveries_dict, depot_example,
                                    value=15)
     max_travel_time = st.number_input(label='Tempo máximo de uma viagem em minutos', min_value=1, step=1, value=150)
 
+    metrics = get_session_metrics(params.metrics_log_path)
+
+    # Each stage is only computed again when the hash of its inputs changes (see nodes.pipeline)
+    stages = get_session_stages(params.metrics_log_path)
+    matrices_key = None
+
+    # Deliveries at the same place are merged into a single stop: the matrices and the routing model only have one
+    # location for each place and the routes are expanded back to the deliveries
+    address_list = [depot_address] + list(deliveries_dict.values())
+    if all('lat_lon' in address_dict for address_dict in address_list):
+        groups = collapse_locations([address_dict['lat'] for address_dict in address_list],
+                                    [address_dict['lon'] for address_dict in address_list],
+                                    params.colocation_tolerance)
+        if len(groups) < len(address_list):
+            st.markdown(f'Entregas no mesmo local: **{number_deliveries}** entregas em **{len(groups) - 1}** paradas')
+    else:
+        groups = [[location] for location in range(len(address_list))]
+    places = [address_list[group[0]] for group in groups]
+
     if depot_example and deliveries_example and number_deliveries == 12:
         # st.write('It IS the example.')
         # Create the matrices
-        dist_matrix = [row for row in matrices_example['dist_matrix']]
-        time_matrix = [row for row in matrices_example['time_matrix']]
+        dist_matrix = collapse_matrix(params.dist_matrix_example, groups)
+        time_matrix = collapse_matrix(params.time_matrix_example, groups)
+        matrices_key = content_hash(params.matrices_example_path, groups)
     else:
         # st.write('It is NOT the example.')
+        matrix_source = st.radio(label='Fonte das matrizes de distância e tempo',
+                                 options=('API de Matriz de Distância',
+                                          'API apenas para as entregas mais próximas',
+                                          'Estimativa em linha reta (sem chave)'))
+
         get_matrices = st.checkbox(f'Enviar dados para otimização')
 
-        if get_matrices:
+        if get_matrices and matrix_source == 'Estimativa em linha reta (sem chave)':
+
+            # Estimate the matrices from the coordinates, calibrated with the example
+            lats = [each_place['lat'] for each_place in places]
+            lons = [each_place['lon'] for each_place in places]
+            matrices_key = content_hash(matrix_source, lats, lons, params.estimator_calibration)
+            with metrics.stage('estimate_matrices'):
+                dist_matrix, time_matrix = stages.run('matrices', matrices_key, estimate_matrices, lats, lons,
+                                                      params.estimator_calibration)
+
+        elif get_matrices:
 
             api_key = st.text_input(label='Chave da API de Matriz de Distância', type='password').strip()
 
-            # Create a list with all addresses
-            deliveries_addresses = [each_address['lat_lon']
-                                    for each_address in deliveries_dict.values()]
-            all_addresses = [depot_address['lat_lon']] + deliveries_addresses
+            # Number of nearest deliveries requested for each location (the other travels are estimated)
+            if matrix_source == 'API apenas para as entregas mais próximas':
+                neighbours = st.number_input(label='Número de entregas mais próximas consultadas', min_value=1,
+                                             step=1, value=params.sparse_neighbours)
+            else:
+                neighbours = None
+
+            # Create a list with the addresses of all the places
+            all_addresses = [each_place['lat_lon'] for each_place in places]
 
             # Create the matrices for the optimization
-            data = create_data(api_key=api_key, addresses=all_addresses)
-            dist_matrix, time_matrix = create_matrices(data)
+            data = create_data(api_key=api_key, addresses=all_addresses, store_path=params.matrix_store_path,
+                               store_max_age=params.matrix_store_max_age, neighbours=neighbours,
+                               calibration=params.estimator_calibration)
+            matrices_key = content_hash(matrix_source, all_addresses, neighbours)
+            with metrics.stage('create_matrices'):
+                dist_matrix, time_matrix, estimated = stages.run('matrices', matrices_key, create_matrices, data)
+
+            if estimated is not None:
+                num_estimated = int(estimated.sum())
+                st.markdown(f'Pares estimados: **{num_estimated}** de {len(estimated) * (len(estimated) - 1)}')
+
+    # Time limit of the optimization (the best routes found so far are shown while it runs)
+    time_limit = st.number_input(label='Tempo limite da otimização em segundos', min_value=1, step=1,
+                                 value=params.solve_time_limit)
+
+    state = get_session_state()
+
+    # Re-plan from the routes of the last optimization of this session
+    if state.get('last_plan') is not None:
+        warm_start = st.checkbox(label='Partir do plano anterior', value=True)
+    else:
+        warm_start = False
+
+    # Large problems can be solved by regions first, then improved as a whole
+    decompose = st.checkbox(label='Dividir as entregas em regiões')
+    if decompose:
+        num_clusters = st.number_input(label='Número de regiões', min_value=1, max_value=int(number_vehicles), step=1,
+                                       value=int(min(number_vehicles, -(-number_deliveries //
+                                                                          params.max_cluster_size))))
+
+    # Several search strategies can run at the same time, keeping the best routes of all of them
+    portfolio = st.checkbox(label='Testar várias estratégias em paralelo')
+    if portfolio:
+        num_strategies = st.number_input(label='Número de estratégias', min_value=2, max_value=len(PORTFOLIO), step=1,
+                                         value=max(2, min(params.portfolio_size, len(PORTFOLIO))))
+
+    # The smallest fleet with a feasible plan can be searched, using the number of vehicles as the largest fleet
+    find_fleet = st.checkbox(label='Encontrar o menor número de veículos')
+
+    # The deliveries that cannot be served can be left out instead of leaving the whole problem without a solution
+    # (not with the search of the smallest fleet, where a single vehicle could leave out all of them)
+    if not find_fleet:
+        allow_drops = st.checkbox(label='Permitir entregas não atendidas')
+    else:
+        allow_drops = False
+
+    # The solution depends on the matrices and on the constraints (not on how long or how it is searched)
+    if matrices_key is not None:
+        solution_key = content_hash(matrices_key, groups, number_vehicles, waiting_stop, max_travel_time, allow_drops,
+                                    find_fleet)
+    else:
+        solution_key = None
+
+    # Problems that are obviously impossible are found before the solver searches until the time limit
+    report = None
+    if solution_key is not None:
+        report = stages.run('feasibility', solution_key, check_feasibility, time_matrix, number_vehicles,
+                            max_travel_time)
+        if report['unreachable']:
+            unreachable = [f'{location} ({deliveries_dict[location]["person"]})'
+                           for place in report['unreachable'] for location in groups[place]]
+            st.markdown(f'Entregas cuja ida e volta passa do tempo máximo da viagem: **{", ".join(unreachable)}**')
+        if report['min_vehicles'] > number_vehicles:
+            st.markdown(f'São necessários pelo menos **{report["min_vehicles"]}** veículos para o tempo máximo da '
+                        f'viagem (tempo total mínimo: {pretty_time_delta(report["lower_bound"])}).')
 
     begin_opt = st.button('Iniciar otimização')
-    solution_found = False
+
+    if begin_opt and report is not None and not report['feasible'] and not allow_drops:
+        st.markdown('A otimização não foi iniciada, pois não há solução possível. Aumente o tempo máximo da viagem ou o '
+                    'número de veículos, ou permita entregas não atendidas.')
+        begin_opt = False
 
     if begin_opt:
 
+        # A new optimization replaces the one that is running
+        if state.get('job') is not None:
+            state['job'].cancel()
+
         # Instantiate the data problem
-        data = create_data_model(number_vehicles, dist_matrix, time_matrix)
+        data = stages.run('model', solution_key, create_data_model, number_vehicles, dist_matrix, time_matrix,
+                          drop_penalty(time_matrix) if allow_drops else None)
 
-        # Create the routing index manager
-        manager = pywrapcp.RoutingIndexManager(len(data['time_matrix']),
-                                               data['num_vehicles'], data['depot'])
+        # Keys that identify the places, so the next optimization can start from these routes
+        keys = node_keys([each_place['lat_lon'] for each_place in places])
 
-        # Create Routing Model
-        routing = pywrapcp.RoutingModel(manager)
+        # Drop the deleted locations from the last routes and insert the new ones
+        initial_routes = None
+        if warm_start:
+            initial_routes = warm_start_routes(state['last_plan']['routes'], state['last_plan']['keys'], keys,
+                                               time_matrix, number_vehicles, max_travel_time)
 
-        # Create and register a transit callback
-        def time_callback(from_index, to_index):
+        def start_job(initial_routes):
 
             """
-            Returns the distance between two nodes.
+            Builds the model and starts the solve of the problem in background processes (a single vehicle is solved
+            without the routing model, right away for small problems).
 
             Parameters
             ----------
-            from_index: int
-                Index of the origin address
-            to_index:int
-                Index of the destination address
+            initial_routes: list
+                Routes the search starts from (see nodes.solver.warm_start_routes) or None
 
             Returns
             -------
-            data['time_matrix'][from_node][to_node]: int
-                Time travel of the route from the origin address to the destination address
+            job:
+                Started job, with the interface of nodes.jobs.SolveJob
             """
 
-            # Convert from routing variable Index to distance matrix NodeIndex.
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return data['time_matrix'][from_node][to_node]
-
-        transit_callback_index = routing.RegisterTransitCallback(time_callback)
-
-        # Define cost of each arc.
-        routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
-
-        # Add Time constraint.
-        dimension_name = 'Time'
-        routing.AddDimension(
-            transit_callback_index,
-            waiting_stop * 60,  # Maximum waiting time in each stop
-            max_travel_time * 60,  # Vehicle maximum travel time
-            True,  # start cumul to zero
-            dimension_name)
-        time_dimension = routing.GetDimensionOrDie(dimension_name)
-        time_dimension.SetGlobalSpanCostCoefficient(100)
-
-        # Setting first solution heuristic.
-        search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-        search_parameters.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-
-        # Solve the problem.
-        solution = routing.SolveWithParameters(search_parameters)
-
-        # Print solution on console.
-        if solution:
-            routes_all = print_solution(data, manager, routing, solution)
-            solution_found = True
+            if number_vehicles == 1 and not portfolio and not allow_drops:
+                if len(time_matrix) - 1 > params.tsp_background_threshold:
+                    return BackgroundTSPJob(data, max_travel_time, initial_routes=initial_routes,
+                                            time_limit=time_limit, neighbours=params.tsp_neighbours).start()
+                return TSPJob(data, max_travel_time, initial_routes=initial_routes, time_limit=time_limit,
+                              neighbours=params.tsp_neighbours).start()
+            if portfolio:
+                return PortfolioJob(data, waiting_stop, max_travel_time, configurations=PORTFOLIO[:num_strategies],
+                                    initial_routes=initial_routes, time_limit=time_limit).start()
+            return SolveJob(data, waiting_stop, max_travel_time, initial_routes=initial_routes,
+                            time_limit=time_limit).start()
+
+        if find_fleet:
+            state['job'] = FleetJob(dist_matrix, time_matrix, waiting_stop, max_travel_time, number_vehicles,
+                                    time_limit=time_limit, max_workers=params.portfolio_size).start()
+        elif decompose:
+            # Solve each region in its own process and start the search over all the deliveries from the stitched
+            # routes, all in the background
+            lats = [each_place['lat'] for each_place in places]
+            lons = [each_place['lon'] for each_place in places]
+            state['job'] = DecomposedJob(data, waiting_stop, max_travel_time, lats, lons, start_job,
+                                         num_clusters=num_clusters, time_limit=time_limit).start()
         else:
-            st.write('No solution was found.')
-            solution_found = False
+            state['job'] = start_job(initial_routes)
+        state['job_keys'] = keys
+        state['job_groups'] = groups
+        state['job_solution_key'] = solution_key
 
-    # Map
+    job = state.get('job')
+    solution_found = False
 
-    # List of colors
-    colors = ['darkred', 'green', 'pink', 'orange', 'purple', 'cadetblue', 'darkgreen',
-              'darkblue', 'red', 'lightblue', 'lightgreen', 'darkpurple', 'black', 'beige', 'lightgray']
+    # The routes of the last optimization are kept between the reruns while its inputs do not change
+    job_current = job is not None and state.get('job_solution_key') == solution_key
+    if job is not None and not job_current:
+        st.markdown('Os dados mudaram desde a última otimização. Clique em **Iniciar otimização** para atualizar as '
+                    'rotas.')
+
+    if job is not None:
+
+        # Read the solutions found since the last rerun
+        job.poll()
+
+        # Record the metrics of the search once, when it finishes
+        if not job.running and state.get('recorded_job') is not job:
+            metrics.observe('solve', job.seconds)
+            metrics.merge(job.metrics or {})
+            metrics.label('solver_status', job.status)
+            state['recorded_job'] = job
+
+        if job.running:
+            st.markdown(f'Otimização em andamento: **{job.num_solutions}** soluções encontradas.')
+            if st.button('Cancelar otimização'):
+                job.cancel()
 
+        # Print the best solution found so far
+        if job_current and job.best is not None:
+            routes_all = print_solution(expand_result(job.best, state['job_groups']))
+            solution_found = True
+            served = {location for route_each in routes_all.values() for location in route_each}
+            dropped = [f'{location} ({deliveries_dict[location]["person"]})' for location in deliveries_dict
+                       if location not in served]
+            if dropped:
+                st.markdown(f'Entregas não atendidas: **{", ".join(dropped)}**')
+            if job.best.get('num_vehicles') is not None:
+                proven = ' (mínimo comprovado pelo limite inferior)' if not job.running and job.proven else ''
+                st.markdown(f"Menor número de veículos encontrado: **{job.best['num_vehicles']}**{proven}")
+            state['last_plan'] = {'keys': state['job_keys'], 'routes': job.best['routes']}
+            if job.best.get('configuration') is not None:
+                st.markdown(f"Melhor estratégia: **{job.best['configuration']['first_solution_strategy']}** + "
+                            f"**{job.best['configuration']['local_search_metaheuristic']}**")
+        elif job_current and not job.running:
+            st.write('No solution was found.')
+
+    # Map
     try:
-        # Create the map
-        map_solution = folium.Map(location=[depot_address['lat'], depot_address['lon']], zoom_start=11.5)
-
-        # Add a marker for depot's location
-        folium.Marker(location=[depot_address['lat'], depot_address['lon']],
-                      popup='Sua Localização',
-                      tooltip=f'Sua Localização', ).add_to(map_solution)
-
-        # Add a marker for deliveries' location
-        if not solution_found:
-            for delivery in deliveries_dict:
-                folium.Marker(location=[deliveries_dict[delivery]['lat'], deliveries_dict[delivery]['lon']],
-                              icon=folium.Icon(color='lightgray', icon=None),
-                              popup=f'''{deliveries_dict[delivery]["person"]}
-{deliveries_dict[delivery]["name"]}, n°{deliveries_dict[delivery]["number"]}''',
-                              tooltip=f'Entrega {delivery} - {deliveries_dict[delivery]["person"]}').add_to(
-                    map_solution)
-        else:
-            # st.write('Solution found')
-            for vehicle in routes_all:
-
-                # Group the markers according to the vehicle
-                for delivery_index in routes_all[vehicle][1:-1]:
-                    folium.Marker(
-                        location=[deliveries_dict[delivery_index]['lat'], deliveries_dict[delivery_index]['lon']],
-                        icon=folium.Icon(color=colors[vehicle], icon=None),
-                        popup=f'''{deliveries_dict[delivery_index]["person"]}
-{deliveries_dict[delivery_index]["name"]}, n°{deliveries_dict[delivery_index]["number"]}''',
-                        tooltip=f'Entrega {delivery_index} - {deliveries_dict[delivery_index]["person"]}').add_to(
-                        map_solution)
-
-                list_coord = []
-                for delivery_index in routes_all[vehicle]:
-                    if delivery_index == 0:
-                        list_coord.append([depot_address['lat'], depot_address['lon']])
-                    else:
-                        list_coord.append(
-                            [deliveries_dict[delivery_index]['lat'], deliveries_dict[delivery_index]['lon']])
-
-                sequence = folium.PolyLine(locations=list_coord,
-                                           weight=1, color=colors[vehicle], opacity=0).add_to(map_solution)
-
-                attr = {'fill': colors[vehicle]}
-
-                plugins.PolyLineTextPath(sequence,
-                                         '\u25BA',
-                                         repeat=True,
-                                         offset=6,
-                                         attributes=attr).add_to(map_solution)
-        # Show the map
-        folium_static(map_solution)
-
-    except SyntaxError:
-        # If the location has no coordinates
-        # Show the map
-        folium_static(map_solution)
+        with metrics.stage('map'):
+            routes_map = routes_all if solution_found else None
+
+            # Large plans are drawn with clustered markers and one line per vehicle
+            large_map = len(deliveries_dict) > params.large_map_threshold
+            fingerprint = ('large:' if large_map else 'full:') + \
+                map_fingerprint(depot_address, deliveries_dict, routes_map)
+
+            # The map is only rendered again when the locations or the routes change
+            map_cache = get_map_cache(params.map_cache_size)
+            html = map_cache.get(fingerprint)
+            if html is None:
+                metrics.count('map_renders')
+                if large_map:
+                    map_solution = build_large_map(depot_address, deliveries_dict, routes_map,
+                                                   params.map_line_tolerance)
+                else:
+                    map_solution = build_map(depot_address, deliveries_dict, routes_map)
+                html = map_solution.get_root().render()
+                map_cache.put(fingerprint, html)
+            else:
+                metrics.count('map_cache_hits')
+
+            # Show the map
+            components.html(html, width=700, height=500)
+
     except KeyError:
+        # If the location has no coordinates
         pass
+
+    # Debug panel with the time of each stage and the counters of this session
+    if st.checkbox(label='Mostrar métricas de desempenho'):
+        st.json(metrics.snapshot())
+
+    write_prometheus(params.metrics_prometheus_path, get_process_metrics().snapshot())
+
+    # Follow the optimization while it runs
+    if job is not None and job.running:
+        sleep(params.job_poll_interval)
+        st.experimental_rerun()
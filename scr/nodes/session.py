@@ -0,0 +1,135 @@
+# Import necessary libraries
+from collections import OrderedDict
+
+from streamlit.report_thread import get_report_ctx
+
+from nodes.map_render import MapCache
+from nodes.metrics import Metrics
+from nodes.pipeline import StageCache
+
+# State of each browser session (the least recently used sessions are forgotten first and their jobs cancelled)
+MAX_SESSIONS = 500
+_session_states = OrderedDict()
+
+# Metrics of the whole process (the metrics of every session are added to them)
+_process_metrics = []
+
+# Rendered maps, shared by all the sessions
+_map_cache = []
+
+
+def get_session_state():
+
+    """
+    Returns the dictionary kept between the reruns of the app for the current browser session.
+
+    Returns
+    -------
+    state: dict
+        State of the current session
+    """
+
+    session_id = get_report_ctx().session_id
+
+    if session_id not in _session_states:
+        _session_states[session_id] = {}
+        while len(_session_states) > MAX_SESSIONS:
+            _, state = _session_states.popitem(last=False)
+            for value in state.values():
+                if hasattr(value, 'cancel'):
+                    value.cancel()
+    _session_states.move_to_end(session_id)
+
+    return _session_states[session_id]
+
+
+def get_process_metrics(log_path=None):
+
+    """
+    Returns the metrics of the whole process, creating them in the first call.
+
+    Parameters
+    ----------
+    log_path: str
+        Path of the JSON lines file where the records are appended (only used in the first call)
+
+    Returns
+    -------
+    metrics: Metrics
+        Metrics of the process
+    """
+
+    if not _process_metrics:
+        _process_metrics.append(Metrics(log_path=log_path))
+
+    return _process_metrics[0]
+
+
+def get_session_metrics(log_path=None):
+
+    """
+    Returns the metrics of the current browser session, which are also added to the metrics of the process.
+
+    Parameters
+    ----------
+    log_path: str
+        Path of the JSON lines file where the records of the process are appended (only used in the first call)
+
+    Returns
+    -------
+    metrics: Metrics
+        Metrics of the session
+    """
+
+    state = get_session_state()
+
+    if 'metrics' not in state:
+        state['metrics'] = Metrics(parent=get_process_metrics(log_path))
+
+    return state['metrics']
+
+
+def get_session_stages(log_path=None):
+
+    """
+    Returns the results of the stages of the app computed in the current browser session.
+
+    Parameters
+    ----------
+    log_path: str
+        Path of the JSON lines file where the records of the process are appended (only used in the first call)
+
+    Returns
+    -------
+    stages: StageCache
+        Results of the stages of the session
+    """
+
+    state = get_session_state()
+
+    if 'stages' not in state:
+        state['stages'] = StageCache(get_session_metrics(log_path))
+
+    return state['stages']
+
+
+def get_map_cache(max_entries=32):
+
+    """
+    Returns the cache of the rendered maps of the whole process, creating it in the first call.
+
+    Parameters
+    ----------
+    max_entries: int
+        Maximum number of maps kept (only used in the first call)
+
+    Returns
+    -------
+    cache: MapCache
+        Cache of the rendered maps
+    """
+
+    if not _map_cache:
+        _map_cache.append(MapCache(max_entries))
+
+    return _map_cache[0]
@@ -0,0 +1,464 @@
+# Import necessary libraries
+import numpy as np
+from ortools.constraint_solver import pywrapcp
+from ortools.constraint_solver import routing_enums_pb2
+
+from nodes.matrix_io import as_matrix
+
+# Names of the statuses returned by RoutingModel.status()
+ROUTING_STATUS = {0: 'ROUTING_NOT_SOLVED', 1: 'ROUTING_SUCCESS', 2: 'ROUTING_FAIL', 3: 'ROUTING_FAIL_TIMEOUT',
+                  4: 'ROUTING_INVALID', 5: 'ROUTING_INFEASIBLE', 6: 'ROUTING_OPTIMAL'}
+
+
+def create_data_model(number_vehicles, dist_matrix, time_matrix, drop_penalty=None):
+
+    """
+    Stores the data for the problem
+
+    Parameters
+    ----------
+    number_vehicles: int
+        Number of vehicles
+    dist_matrix: numpy.ndarray
+        Distance matrix (kept as a contiguous int32 array)
+    time_matrix: numpy.ndarray
+        Time travel matrix (kept as a contiguous int32 array)
+    drop_penalty: int
+        Penalty of each delivery left out of the routes (see nodes.feasibility.drop_penalty). If None, every
+        delivery must be served
+
+    Returns
+    -------
+    data: dict
+        Dictionary that contains the data for the problem
+    """
+
+    data = {'distance_matrix': as_matrix(dist_matrix),
+            'time_matrix': as_matrix(time_matrix),
+            'num_vehicles': number_vehicles,
+            'depot': 0,
+            'drop_penalty': drop_penalty}
+
+    return data
+
+
+def index_aligned_matrix(manager, routing, matrix):
+
+    """
+    Reorders a node-based matrix so that it can be read directly with the routing variable indices.
+
+    Parameters
+    ----------
+    manager:
+        Routing Index Manager
+    routing:
+        Routing Model
+    matrix: numpy.ndarray
+        Matrix indexed by node
+
+    Returns
+    -------
+    aligned_matrix: list
+        Matrix indexed by the routing variable indices, including the start and end indices of every vehicle (list of
+        lists, which the callback reads faster than an array)
+    """
+
+    # Start and end indices of the vehicles are duplicates of the depot node
+    num_indices = routing.Size() + routing.vehicles()
+    index_to_node = np.array([manager.IndexToNode(index) for index in range(num_indices)])
+
+    aligned_matrix = np.asarray(matrix)[np.ix_(index_to_node, index_to_node)].tolist()
+
+    return aligned_matrix
+
+
+def register_transit_matrix(manager, routing, matrix, evaluations=None):
+
+    """
+    Registers a matrix as a transit evaluator of the routing model.
+
+    The pinned OR-Tools (8.0.8283, see requirements.txt) has no transit matrices, so the matrix is registered as a
+    Python callback that reads a precomputed index-aligned matrix, without any conversion from index to node. The
+    native evaluator is only a forward-compatibility shim: with an OR-Tools release that has
+    RoutingModel.RegisterTransitMatrix (recent 9.x releases), the whole matrix is handed to the routing model once
+    and the arcs are evaluated without calling Python.
+
+    Parameters
+    ----------
+    manager:
+        Routing Index Manager
+    routing:
+        Routing Model
+    matrix: numpy.ndarray
+        Matrix indexed by node
+    evaluations: list
+        One-item list where the evaluations of the Python callback are counted (the native evaluator is not counted).
+        If None, they are not counted
+
+    Returns
+    -------
+    transit_callback_index: int
+        Index of the registered transit evaluator
+    """
+
+    # Native evaluator (forward-compatibility shim: not available in the pinned OR-Tools 8.0.8283)
+    if hasattr(routing, 'RegisterTransitMatrix'):
+        return routing.RegisterTransitMatrix(np.asarray(matrix).tolist())
+
+    # Python callback without any conversion from index to node (the path used with the pinned OR-Tools)
+    aligned_matrix = index_aligned_matrix(manager, routing, matrix)
+
+    def transit_callback(from_index, to_index):
+
+        """
+        Returns the value of the arc between two routing variable indices.
+
+        Parameters
+        ----------
+        from_index: int
+            Index of the origin address
+        to_index: int
+            Index of the destination address
+
+        Returns
+        -------
+        aligned_matrix[from_index][to_index]: int
+            Value of the arc from the origin address to the destination address
+        """
+
+        return aligned_matrix[from_index][to_index]
+
+    if evaluations is not None:
+        def counted_transit_callback(from_index, to_index):
+
+            """
+            Returns the value of the arc between two routing variable indices and counts the evaluation.
+
+            Parameters
+            ----------
+            from_index: int
+                Index of the origin address
+            to_index: int
+                Index of the destination address
+
+            Returns
+            -------
+            aligned_matrix[from_index][to_index]: int
+                Value of the arc from the origin address to the destination address
+            """
+
+            evaluations[0] += 1
+            return aligned_matrix[from_index][to_index]
+
+        return routing.RegisterTransitCallback(counted_transit_callback)
+
+    return routing.RegisterTransitCallback(transit_callback)
+
+
+def build_model(data, waiting_stop, max_travel_time, evaluations=None):
+
+    """
+    Creates the routing model with the time travel as the cost of each arc and the time constraint.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    evaluations: list
+        One-item list where the evaluations of the transit callback are counted (if None, they are not counted)
+
+    Returns
+    -------
+    manager:
+        Routing Index Manager
+    routing:
+        Routing Model
+    """
+
+    # Create the routing index manager
+    manager = pywrapcp.RoutingIndexManager(len(data['time_matrix']),
+                                           data['num_vehicles'], data['depot'])
+
+    # Create Routing Model
+    routing = pywrapcp.RoutingModel(manager)
+
+    # Register the time matrix as the transit evaluator
+    transit_callback_index = register_transit_matrix(manager, routing, data['time_matrix'], evaluations)
+
+    # Define cost of each arc.
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
+
+    # Add Time constraint.
+    dimension_name = 'Time'
+    routing.AddDimension(
+        transit_callback_index,
+        waiting_stop * 60,  # Maximum waiting time in each stop
+        max_travel_time * 60,  # Vehicle maximum travel time
+        True,  # start cumul to zero
+        dimension_name)
+    time_dimension = routing.GetDimensionOrDie(dimension_name)
+    time_dimension.SetGlobalSpanCostCoefficient(100)
+
+    # Allow the deliveries that cannot be served to be left out, at a penalty
+    if data.get('drop_penalty') is not None:
+        for node in range(1, len(data['time_matrix'])):
+            routing.AddDisjunction([manager.NodeToIndex(node)], data['drop_penalty'])
+
+    return manager, routing
+
+
+def create_search_parameters(first_solution_strategy='PATH_CHEAPEST_ARC', local_search_metaheuristic=None,
+                             time_limit=None):
+
+    """
+    Creates the search parameters of the solver.
+
+    Parameters
+    ----------
+    first_solution_strategy: str
+        Name of the first solution strategy (Example: 'PATH_CHEAPEST_ARC', 'SAVINGS', 'CHRISTOFIDES')
+    local_search_metaheuristic: str
+        Name of the local search metaheuristic (Example: 'GUIDED_LOCAL_SEARCH'). If None, the default is used
+    time_limit: float
+        Maximum time of the search in seconds. If None, the search stops when no better solution is found
+
+    Returns
+    -------
+    search_parameters:
+        Search parameters of the solver
+    """
+
+    search_parameters = pywrapcp.DefaultRoutingSearchParameters()
+    search_parameters.first_solution_strategy = getattr(routing_enums_pb2.FirstSolutionStrategy,
+                                                        first_solution_strategy)
+
+    if local_search_metaheuristic is not None:
+        search_parameters.local_search_metaheuristic = getattr(routing_enums_pb2.LocalSearchMetaheuristic,
+                                                               local_search_metaheuristic)
+
+    if time_limit is not None:
+        search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+
+    return search_parameters
+
+
+def extract_solution(data, manager, routing, solution=None):
+
+    """
+    Reads the routes of a solution.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    manager:
+        Routing Index Manager
+    routing:
+        Routing Model
+    solution:
+        Solution of the problem. If None, the current values of the variables are read (inside a solution callback)
+
+    Returns
+    -------
+    routes_all: dict
+        Dictionary that maps each vehicle to the sequence of locations of its route (starting and ending at the depot)
+    route_times: dict
+        Dictionary that maps each vehicle to the travel time of its route in seconds
+    """
+
+    routes_all = {}
+    route_times = {}
+
+    for vehicle_id in range(data['num_vehicles']):
+        index = routing.Start(vehicle_id)
+        route_each = []
+        route_time = 0
+        while not routing.IsEnd(index):
+            route_each.append(manager.IndexToNode(index))
+            previous_index = index
+            if solution is None:
+                index = routing.NextVar(index).Value()
+            else:
+                index = solution.Value(routing.NextVar(index))
+            route_time += routing.GetArcCostForVehicle(previous_index, index, vehicle_id)
+        route_each.append(manager.IndexToNode(index))
+        routes_all[vehicle_id] = route_each
+        route_times[vehicle_id] = route_time
+
+    return routes_all, route_times
+
+
+def node_keys(addresses):
+
+    """
+    Builds a key for each location that does not depend on its position, so that the routes of a previous plan can
+    be matched with the locations of a new one.
+
+    Parameters
+    ----------
+    addresses: list
+        List that contains the coordinates of the locations, including the depot's
+
+    Returns
+    -------
+    keys: list
+        List of (coordinates, occurrence) tuples (the occurrence tells apart repeated coordinates)
+    """
+
+    occurrences = {}
+    keys = []
+
+    for address in addresses:
+        occurrences[address] = occurrences.get(address, 0) + 1
+        keys.append((address, occurrences[address]))
+
+    return keys
+
+
+def warm_start_routes(previous_routes, previous_keys, keys, time_matrix, num_vehicles, max_travel_time):
+
+    """
+    Adapts the routes of a previous plan to the current locations: the deleted locations are dropped and the new
+    ones are inserted where they increase the travel time the least.
+
+    Parameters
+    ----------
+    previous_routes: dict
+        Sequence of locations of each route of the previous plan (starting and ending at the depot)
+    previous_keys: list
+        Keys of the locations of the previous plan (see node_keys)
+    keys: list
+        Keys of the current locations
+    time_matrix: numpy.ndarray
+        Time travel matrix of the current locations
+    num_vehicles: int
+        Number of vehicles
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+
+    Returns
+    -------
+    routes: list
+        List with the sequence of locations of each vehicle, without the depot
+    """
+
+    positions = {key: node for node, key in enumerate(keys)}
+    time_matrix = np.asarray(time_matrix)
+
+    # Keep the locations that still exist, in the same order
+    routes = [[positions[previous_keys[node]] for node in route_each[1:-1] if previous_keys[node] in positions]
+              for route_each in previous_routes.values()]
+    routes += [[] for _ in range(num_vehicles - len(routes))]
+
+    # If there are fewer vehicles now, the stops of the extra routes are inserted again
+    visited = {node for route_each in routes[:num_vehicles] for node in route_each}
+    routes = routes[:num_vehicles]
+    new_nodes = [node for node in range(1, len(keys)) if node not in visited]
+
+    route_times = [time_matrix[[0] + route_each, route_each + [0]].sum() for route_each in routes]
+
+    # Cheapest insertion of the new locations
+    for node in new_nodes:
+        best = None
+        for vehicle_id, route_each in enumerate(routes):
+            previous_nodes = np.array([0] + route_each)
+            next_nodes = np.array(route_each + [0])
+            deltas = time_matrix[previous_nodes, node] + time_matrix[node, next_nodes] - \
+                time_matrix[previous_nodes, next_nodes]
+            position = int(deltas.argmin())
+            feasible = route_times[vehicle_id] + deltas[position] <= max_travel_time * 60
+            candidate = (not feasible, deltas[position], vehicle_id, position)
+            if best is None or candidate < best:
+                best = candidate
+        _, delta, vehicle_id, position = best
+        routes[vehicle_id].insert(position, node)
+        route_times[vehicle_id] += delta
+
+    return [[int(node) for node in route_each] for route_each in routes]
+
+
+def solve_model(manager, routing, search_parameters, initial_routes=None):
+
+    """
+    Solves the model, starting from the initial routes if they are given and feasible.
+
+    Parameters
+    ----------
+    manager:
+        Routing Index Manager
+    routing:
+        Routing Model
+    search_parameters:
+        Search parameters of the solver
+    initial_routes: list
+        List with the sequence of locations of each vehicle, without the depot (see warm_start_routes)
+
+    Returns
+    -------
+    solution:
+        Solution of the problem or None
+    """
+
+    if initial_routes is not None:
+        routing.CloseModelWithParameters(search_parameters)
+        initial_indices = [[manager.NodeToIndex(node) for node in route_each] for route_each in initial_routes]
+        initial_solution = routing.ReadAssignmentFromRoutes(initial_indices, True)
+
+        # If the initial routes are not feasible, the search starts from scratch
+        if initial_solution is not None:
+            return routing.SolveFromAssignmentWithParameters(initial_solution, search_parameters)
+
+    return routing.SolveWithParameters(search_parameters)
+
+
+def solve(data, waiting_stop, max_travel_time, first_solution_strategy='PATH_CHEAPEST_ARC',
+          local_search_metaheuristic=None, time_limit=None, initial_routes=None):
+
+    """
+    Builds the model and solves the problem, without any user interface.
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem
+    waiting_stop: int
+        Maximum waiting time in each stop in minutes
+    max_travel_time: int
+        Maximum travel time of each vehicle in minutes
+    first_solution_strategy: str
+        Name of the first solution strategy
+    local_search_metaheuristic: str
+        Name of the local search metaheuristic (if None, the default is used)
+    time_limit: float
+        Maximum time of the search in seconds (if None, there is no limit)
+    initial_routes: list
+        Routes the search starts from (see warm_start_routes). If None, the first solution strategy is used
+
+    Returns
+    -------
+    result: dict
+        Dictionary that contains the status of the solver ('status'), the objective value ('objective'), the
+        sequence of locations of each route ('routes') and the travel time of each route in seconds ('route_times').
+        The last three are None if no solution was found
+    """
+
+    manager, routing = build_model(data, waiting_stop, max_travel_time)
+    search_parameters = create_search_parameters(first_solution_strategy, local_search_metaheuristic, time_limit)
+
+    # Solve the problem.
+    solution = solve_model(manager, routing, search_parameters, initial_routes)
+
+    result = {'status': ROUTING_STATUS.get(routing.status(), str(routing.status())),
+              'objective': None,
+              'routes': None,
+              'route_times': None}
+
+    if solution:
+        result['objective'] = solution.ObjectiveValue()
+        result['routes'], result['route_times'] = extract_solution(data, manager, routing, solution)
+
+    return result
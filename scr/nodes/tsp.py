@@ -0,0 +1,357 @@
+# Import necessary libraries
+import time
+
+import numpy as np
+
+
+def neighbour_mask(time_matrix, neighbours):
+
+    """
+    Marks the pairs of locations where at least one is among the nearest neighbours of the other, which are the only
+    new arcs tried by the local search.
+
+    Parameters
+    ----------
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    neighbours: int
+        Number of nearest neighbours of each location
+
+    Returns
+    -------
+    mask: numpy.ndarray
+        N x N boolean array
+    """
+
+    num_locations = len(time_matrix)
+    if neighbours >= num_locations - 1:
+        return np.ones((num_locations, num_locations), dtype=bool)
+
+    costs = time_matrix.astype(np.float64)
+    np.fill_diagonal(costs, np.inf)
+    nearest = np.argpartition(costs, neighbours, axis=1)[:, :neighbours]
+
+    mask = np.zeros((num_locations, num_locations), dtype=bool)
+    mask[np.arange(num_locations)[:, None], nearest] = True
+
+    return mask | mask.T
+
+
+def nearest_neighbour_route(time_matrix):
+
+    """
+    Builds a route that always goes to the nearest location not visited yet.
+
+    Parameters
+    ----------
+    time_matrix: numpy.ndarray
+        Time travel matrix
+
+    Returns
+    -------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    """
+
+    visited = np.zeros(len(time_matrix), dtype=bool)
+    visited[0] = True
+    route = [0]
+
+    for _ in range(len(time_matrix) - 1):
+        costs = np.where(visited, np.inf, time_matrix[route[-1]])
+        location = int(costs.argmin())
+        visited[location] = True
+        route.append(location)
+
+    return route + [0]
+
+
+def route_time(route, time_matrix):
+
+    """
+    Computes the travel time of a route.
+
+    Parameters
+    ----------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    time_matrix: numpy.ndarray
+        Time travel matrix
+
+    Returns
+    -------
+    time: int
+        Travel time of the route in seconds
+    """
+
+    route = np.asarray(route)
+
+    return int(time_matrix[route[:-1], route[1:]].sum())
+
+
+def best_two_opt_move(route, time_matrix, mask):
+
+    """
+    Finds the best 2-opt move of a route: the reversal of the segment route[i + 1:j + 1]. The matrix may be
+    asymmetric, so the arcs inside the segment are priced in the reverse direction (with prefix sums).
+
+    Parameters
+    ----------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    time_matrix: numpy.ndarray
+        Time travel matrix (int64)
+    mask: numpy.ndarray
+        Pairs of locations that can be joined by a new arc (see neighbour_mask)
+
+    Returns
+    -------
+    delta: int
+        Change of the travel time (0 if there is no improving move)
+    i: int
+        Position before the segment
+    j: int
+        Last position of the segment
+    """
+
+    route = np.asarray(route)
+    forward = np.concatenate([[0], np.cumsum(time_matrix[route[:-1], route[1:]])])
+    backward = np.concatenate([[0], np.cumsum(time_matrix[route[1:], route[:-1]])])
+
+    i = np.arange(len(route) - 1)[:, None]
+    j = np.arange(len(route) - 1)[None, :]
+    start, end = route[:-1], route[1:]
+
+    # New arcs (route[i], route[j]) and (route[i + 1], route[j + 1]), and the segment in the reverse direction
+    delta = time_matrix[start[:, None], start[None, :]] + time_matrix[end[:, None], end[None, :]] + \
+        backward[j] - backward[i + 1] - forward[j + 1] + forward[i]
+    valid = (j >= i + 2) & mask[start[:, None], start[None, :]]
+    delta = np.where(valid, delta, 0)
+
+    i, j = np.unravel_index(delta.argmin(), delta.shape)
+
+    return int(delta[i, j]), int(i), int(j)
+
+
+def best_or_opt_move(route, time_matrix, mask, max_length=3):
+
+    """
+    Finds the best Or-opt move of a route: a segment of up to max_length locations is moved between two other
+    consecutive locations, in the same or in the reverse direction.
+
+    Parameters
+    ----------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    time_matrix: numpy.ndarray
+        Time travel matrix (int64)
+    mask: numpy.ndarray
+        Pairs of locations that can be joined by a new arc (see neighbour_mask)
+    max_length: int
+        Maximum number of locations of the segment
+
+    Returns
+    -------
+    delta: int
+        Change of the travel time (0 if there is no improving move)
+    move: tuple
+        First position and length of the segment, position after which it is inserted and whether it is reversed
+        (None if there is no improving move)
+    """
+
+    route = np.asarray(route)
+    best_delta, best_move = 0, None
+    positions = np.arange(len(route) - 1)
+    arcs = time_matrix[route[:-1], route[1:]]
+    forward = np.concatenate([[0], np.cumsum(arcs)])
+    backward = np.concatenate([[0], np.cumsum(time_matrix[route[1:], route[:-1]])])
+
+    for length in range(1, max_length + 1):
+        starts = np.arange(1, len(route) - length)
+        if len(starts) == 0:
+            break
+        first, last = route[starts], route[starts + length - 1]
+        before, after = route[starts - 1], route[starts + length]
+
+        # Time saved by removing the segment and time added by inserting it after each position
+        removal = time_matrix[before, after] - time_matrix[before, first] - time_matrix[last, after]
+        insertion = time_matrix[route[:-1][None, :], first[:, None]] + \
+            time_matrix[last[:, None], route[1:][None, :]] - arcs[None, :]
+
+        # Reversed, the segment is entered by its last location and its own arcs are travelled backwards
+        reversal = (backward[starts + length - 1] - backward[starts]) - (forward[starts + length - 1] - forward[starts])
+        insertion_reversed = time_matrix[route[:-1][None, :], last[:, None]] + \
+            time_matrix[first[:, None], route[1:][None, :]] - arcs[None, :] + reversal[:, None]
+
+        outside = (positions[None, :] < starts[:, None] - 1) | (positions[None, :] > starts[:, None] + length - 1)
+        for reverse, delta, valid in ((False, removal[:, None] + insertion,
+                                       outside & mask[route[:-1][None, :], first[:, None]]),
+                                      (True, removal[:, None] + insertion_reversed,
+                                       outside & mask[route[:-1][None, :], last[:, None]])):
+            delta = np.where(valid, delta, 0)
+            segment, position = np.unravel_index(delta.argmin(), delta.shape)
+            if delta[segment, position] < best_delta:
+                best_delta = int(delta[segment, position])
+                best_move = (int(starts[segment]), length, int(position), reverse)
+
+    return best_delta, best_move
+
+
+def perturb_route(route, rng):
+
+    """
+    Perturbs a route with a double bridge: its deliveries are cut into four segments and the two middle ones are
+    swapped, a change that 2-opt and Or-opt cannot undo in one move.
+
+    Parameters
+    ----------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    rng: numpy.random.Generator
+        Random number generator
+
+    Returns
+    -------
+    route: list
+        Perturbed sequence of locations
+    """
+
+    first, second, third = np.sort(rng.choice(np.arange(1, len(route) - 1), 3, replace=False)).tolist()
+
+    return route[:first] + route[second:third] + route[first:second] + route[third:]
+
+
+def improve_route(route, time_matrix, neighbours=20, time_limit=None):
+
+    """
+    Improves a route with 2-opt and Or-opt moves until no move improves it (or the time limit is reached).
+
+    Parameters
+    ----------
+    route: list
+        Sequence of locations, starting and ending at the depot
+    time_matrix: numpy.ndarray
+        Time travel matrix
+    neighbours: int
+        Number of nearest neighbours of each location tried by the moves
+    time_limit: float
+        Maximum time in seconds (if None, there is no limit)
+
+    Returns
+    -------
+    route: list
+        Improved sequence of locations
+    moves: int
+        Number of moves applied
+    """
+
+    time_matrix = np.asarray(time_matrix, dtype=np.int64)
+    mask = neighbour_mask(time_matrix, neighbours)
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    route = list(route)
+    moves = 0
+
+    while deadline is None or time.monotonic() < deadline:
+        delta, i, j = best_two_opt_move(route, time_matrix, mask)
+        if delta < 0:
+            route[i + 1:j + 1] = route[i + 1:j + 1][::-1]
+            moves += 1
+            continue
+
+        delta, move = best_or_opt_move(route, time_matrix, mask)
+        if delta < 0:
+            start, length, position, reverse = move
+            segment = route[start:start + length][::-1] if reverse else route[start:start + length]
+            rest = route[:start] + route[start + length:]
+            if position > start:
+                position -= length
+            route = rest[:position + 1] + segment + rest[position + 1:]
+            moves += 1
+            continue
+
+        break
+
+    return route, moves
+
+
+def solve_tsp(data, max_travel_time, initial_routes=None, neighbours=20, time_limit=None, kicks=200,
+              kick_time_limit=None, metrics=None):
+
+    """
+    Solves the problem of a single vehicle without the routing model: a nearest neighbour route (or the initial
+    route) is improved with 2-opt and Or-opt moves computed with NumPy directly on the time matrix. If the route is
+    still longer than the maximum travel time, the search goes on from perturbed copies of the best route until one
+    fits (iterated local search).
+
+    Parameters
+    ----------
+    data: dict
+        Dictionary that contains the data for the problem (with one vehicle)
+    max_travel_time: int
+        Maximum travel time of the vehicle in minutes
+    initial_routes: list
+        Route the search starts from, without the depot (see nodes.solver.warm_start_routes). If None or if it does
+        not visit every location once, the nearest neighbour route is used
+    neighbours: int
+        Number of nearest neighbours of each location tried by the moves
+    time_limit: float
+        Maximum time of the local search in seconds (if None, there is no limit)
+    kicks: int
+        Maximum number of perturbations tried when the route is too long
+    kick_time_limit: float
+        Maximum time of the perturbations in seconds (if None, only the time limit of the local search applies)
+    metrics: nodes.metrics.Metrics
+        Metrics where the stages and the moves are recorded (optional)
+
+    Returns
+    -------
+    result: dict
+        Solution with the same keys as nodes.solver.solve. The routes, the route times and the objective are None if
+        the route is longer than the maximum travel time
+    """
+
+    time_matrix = np.asarray(data['time_matrix'], dtype=np.int64)
+    num_locations = len(time_matrix)
+
+    # Construction
+    start = time.perf_counter()
+    if initial_routes is not None and sorted(initial_routes[0]) == list(range(1, num_locations)):
+        route = [0] + list(initial_routes[0]) + [0]
+    else:
+        route = nearest_neighbour_route(time_matrix)
+    if metrics is not None:
+        metrics.observe('construction', time.perf_counter() - start)
+
+    # Local search
+    start = time.perf_counter()
+    route, moves = improve_route(route, time_matrix, neighbours, time_limit)
+    total_time = route_time(route, time_matrix)
+
+    # Perturbations of the best route, only while it is too long
+    rng = np.random.default_rng(0)
+    kicks_start = time.perf_counter()
+    for _ in range(kicks if num_locations > 4 else 0):
+        elapsed = time.perf_counter() - start
+        if total_time <= max_travel_time * 60 or (time_limit is not None and elapsed >= time_limit) or \
+                (kick_time_limit is not None and time.perf_counter() - kicks_start >= kick_time_limit):
+            break
+        candidate, candidate_moves = improve_route(perturb_route(route, rng), time_matrix, neighbours,
+                                                   None if time_limit is None else time_limit - elapsed)
+        moves += candidate_moves
+        if route_time(candidate, time_matrix) < total_time:
+            route, total_time = candidate, route_time(candidate, time_matrix)
+
+    if metrics is not None:
+        metrics.observe('local_search', time.perf_counter() - start)
+        metrics.count('local_search_moves', moves)
+    result = {'status': 'ROUTING_SUCCESS', 'objective': None, 'routes': None, 'route_times': None}
+
+    if total_time > max_travel_time * 60:
+        result['status'] = 'ROUTING_FAIL'
+    else:
+        # Same objective as the routing model: travel time plus the global span cost
+        result['objective'] = total_time + 100 * total_time
+        result['routes'] = {0: route}
+        result['route_times'] = {0: total_time}
+
+    return result
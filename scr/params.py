@@ -1,7 +1,48 @@
-import ast
+import os
+import threading
 
 import pandas as pd
 
+from nodes.bulk_import import build_example_index
+from nodes.estimator import calibrate_estimator
+from nodes.matrix_io import load_matrices
+
+# Folder of the example data shipped with the app
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+
+class lazy_attribute:
+    """
+    Class attribute computed on first access and then kept for the whole process: the descriptor replaces itself
+    with the value, so importing the module does no work and the next accesses cost nothing.
+
+    Parameters
+    ----------
+    function: function
+        Function that receives the class and returns the value of the attribute
+    """
+
+    _lock = threading.RLock()  # Reentrant: a lazy attribute can read other lazy attributes
+
+    def __init__(self, function):
+
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __set_name__(self, owner, name):
+
+        self.name = name
+
+    def __get__(self, instance, owner):
+
+        with self._lock:
+            value = owner.__dict__[self.name]
+            if value is self:
+                value = self.function(owner)
+                setattr(owner, self.name, value)
+
+        return value
+
 
 class Params:
     """
@@ -16,15 +57,120 @@ class Params:
     uf = ('-', 'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', ' ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA', 'PB', 'PR', 'PE',
           'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO')
 
-    # Example
-    locations_example = pd.read_csv('https://raw.githubusercontent.com/gabrielanakasato/route-optimization/main/data/locations_example.csv')
-    matrices_example = pd.read_csv('https://raw.githubusercontent.com/gabrielanakasato/route-optimization/main/data/matrices_example.csv')
+    # Example, read from the data folder on first access (no network needed)
+    locations_example_path = os.path.join(DATA_DIR, 'locations_example.csv')
+    matrices_example_path = os.path.join(DATA_DIR, 'matrices_example.npy')
+
+    @lazy_attribute
+    def locations_example(cls):
+
+        """
+        Locations of the example.
+        """
+
+        return pd.read_csv(cls.locations_example_path)
+
+    # Rows of the example and position of each address, used for the default values and to detect the example
+    @lazy_attribute
+    def example_index(cls):
+
+        """
+        Index of the example (see nodes.bulk_import.build_example_index).
+        """
+
+        return build_example_index(cls.locations_example)
+
+    # Matrices of the example as int32 arrays, memory-mapped from the binary file (see nodes.matrix_io)
+    @lazy_attribute
+    def dist_matrix_example(cls):
 
-    matrices_example['dist_matrix'] = matrices_example['dist_matrix'].apply(ast.literal_eval)  # Convert string to list
-    matrices_example['time_matrix'] = matrices_example['time_matrix'].apply(ast.literal_eval)  # Convert string to list
+        """
+        Distance matrix of the example.
+        """
+
+        return load_matrices(cls.matrices_example_path)[0]
+
+    @lazy_attribute
+    def time_matrix_example(cls):
+
+        """
+        Time travel matrix of the example.
+        """
+
+        return load_matrices(cls.matrices_example_path)[1]
+
+    # Road-detour factor and average speed used to estimate the matrices without the API, fitted to the example
+    @lazy_attribute
+    def estimator_calibration(cls):
+
+        """
+        Calibration of the estimator.
+        """
+
+        return calibrate_estimator(cls.locations_example['lat'], cls.locations_example['lon'],
+                                   cls.dist_matrix_example, cls.time_matrix_example)
 
     # Path of the Chrome driver
     chrome_path = './chromedriver.exe'
 
     # Google Maps url
     maps_url = 'https://www.google.com.br/maps/place/'
+
+    # Street gazetteer used to search the coordinates offline before using the browser (optional)
+    # Columns: uf, city, street, number_from, number_to, lat_from, lon_from, lat_to, lon_to
+    gazetteer_path = os.path.join(DATA_DIR, 'gazetteer.csv')
+
+    # Browsers kept open to search the coordinates and maximum time in seconds waiting for each address
+    browser_pool_size = 3
+    geocode_timeout = 15
+
+    # Folder of the files kept between sessions
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache')
+
+    # Cache of the coordinates of the addresses already searched
+    geocode_cache_path = os.path.join(cache_dir, 'geocodes.sqlite')
+    geocode_cache_max_entries = 20000
+    geocode_cache_max_age = 180 * 86400
+
+    # Store of the distance and time travel between locations (pairs older than 30 days are requested again)
+    matrix_store_path = os.path.join(cache_dir, 'travel_times.sqlite')
+    matrix_store_max_age = 30 * 86400
+
+    # Default time limit of the optimization in seconds and interval in seconds between the updates of the page
+    # while the optimization runs
+    solve_time_limit = 60
+    job_poll_interval = 1
+
+    # Nearest neighbours of each location tried by the moves of the single vehicle engine (see nodes.tsp)
+    tsp_neighbours = 20
+
+    # Above this number of places the single vehicle engine runs in a background process, where it can be cancelled
+    # (its local search takes about 0.1 second for 300 places and seconds from 800)
+    tsp_background_threshold = 300
+
+    # Nearest neighbours requested for each location when only the closest deliveries are requested to the API
+    sparse_neighbours = 10
+
+    # Number of search strategies run at the same time when several strategies are tested (one process each)
+    portfolio_size = min(os.cpu_count() or 1, 4)
+
+    # Metrics of the stages of the app: every record is appended to a JSON lines file and the totals of the process are
+    # written to a Prometheus text file after each update of the page
+    metrics_log_path = os.path.join(cache_dir, 'metrics.jsonl')
+    metrics_prometheus_path = os.path.join(cache_dir, 'metrics.prom')
+
+    # Maximum number of deliveries imported from a file
+    max_import_rows = 5000
+
+    # Deliveries at most this distance in meters from the first delivery of a stop are merged into that stop before
+    # the matrices are created
+    colocation_tolerance = 10
+
+    # Suggested maximum number of deliveries of each region when the deliveries are divided into regions
+    max_cluster_size = 100
+
+    # Deliveries above which the map clusters the markers and draws one simplified line per vehicle, tolerance in
+    # degrees of the simplification and number of rendered maps kept in memory
+    large_map_threshold = 200
+    map_line_tolerance = 0.0005
+    map_cache_size = 32
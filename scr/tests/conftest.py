@@ -0,0 +1,6 @@
+# Import necessary libraries
+import os
+import sys
+
+# The modules of the app are imported as in scr (Example: from nodes.solver import solve)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
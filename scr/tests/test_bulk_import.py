@@ -0,0 +1,22 @@
+# Import necessary libraries
+from nodes.bulk_import import import_deliveries, valid_states
+from params import Params
+
+
+def test_valid_states_strip_the_select_box_options():
+
+    valid_ufs = valid_states(Params.uf)
+
+    assert 'ES' in valid_ufs
+    assert '-' not in valid_ufs
+    assert all(uf == uf.strip() for uf in valid_ufs)
+
+
+def test_import_es_row():
+
+    content = 'person,name,number,uf,city\nAna,Rua Sete,10,ES,Vitória\nBia,Rua Oito,20,-,Vitória\n'.encode('utf-8')
+
+    deliveries, errors = import_deliveries(content, 'MS', 'Campo Grande', valid_states(Params.uf))
+
+    assert [address_dict['uf'] for address_dict in deliveries] == ['ES']
+    assert errors == ['Linha 3: estado inválido (-)']
@@ -0,0 +1,58 @@
+# Import necessary libraries
+import numpy as np
+
+from nodes.colocation import collapse_locations, collapse_matrix, expand_result
+from nodes.estimator import EARTH_RADIUS
+
+# Depot of the example
+LAT, LON = -20.4693, -54.6097
+
+
+def offset_coordinates(north, east):
+
+    """
+    Coordinates of points at given distances in meters north and east of the depot.
+    """
+
+    lats = LAT + np.degrees(np.asarray(north, dtype=np.float64) / EARTH_RADIUS)
+    lons = LON + np.degrees(np.asarray(east, dtype=np.float64) / EARTH_RADIUS / np.cos(np.radians(LAT)))
+
+    return lats.tolist(), lons.tolist()
+
+
+def test_close_deliveries_across_a_cell_edge_are_merged():
+
+    lats, lons = offset_coordinates([0, 100, 100], [0, 9.8, 10.3])
+
+    assert collapse_locations(lats, lons, 10) == [[0], [1, 2]]
+
+
+def test_chain_of_close_deliveries_is_not_a_single_place():
+
+    # House numbers every 8 meters along a street, 500 meters from the depot
+    lats, lons = offset_coordinates([0] + [500] * 20, [0] + [8 * house for house in range(20)])
+
+    groups = collapse_locations(lats, lons, 10)
+
+    assert groups[0] == [0]
+    assert len(groups) > 2
+    for group in groups[1:]:
+        assert max(lons[location] for location in group) - min(lons[location] for location in group) <= \
+            np.degrees(20 / EARTH_RADIUS / np.cos(np.radians(LAT)))
+
+
+def test_depot_is_never_merged():
+
+    lats, lons = offset_coordinates([0, 0, 1], [0, 0, 1])
+
+    assert collapse_locations(lats, lons, 10) == [[0], [1, 2]]
+
+
+def test_collapse_and_expand():
+
+    groups = [[0], [1, 3], [2]]
+    matrix = np.arange(16).reshape(4, 4)
+
+    assert collapse_matrix(matrix, groups).tolist() == [[0, 1, 2], [4, 5, 6], [8, 9, 10]]
+    result = expand_result({'routes': {0: [0, 2, 1, 0]}, 'route_times': {0: 10}}, groups)
+    assert result['routes'] == {0: [0, 2, 1, 3, 0]}
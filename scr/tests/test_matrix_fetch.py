@@ -0,0 +1,60 @@
+# Import necessary libraries
+import numpy as np
+
+from nodes.matrix_fetch import MAX_DESTINATIONS, MAX_ELEMENTS, MAX_ORIGINS, fetch_pairs, plan_blocks
+
+
+class StandInFetcher:
+    """
+    Answers the requests without the API, with the distance 1000 * origin + destination and the time 1 + the
+    distance, and keeps the requests.
+    """
+
+    def __init__(self):
+
+        self.requests = []
+
+    def fetch(self, requests):
+
+        self.requests.extend(requests)
+
+        return [(np.array([[1000 * int(origin) + int(destination) for destination in destinations]
+                           for origin in origins], dtype=np.int32),
+                 np.array([[1000 * int(origin) + int(destination) + 1 for destination in destinations]
+                           for origin in origins], dtype=np.int32))
+                for origins, destinations in requests]
+
+
+def check_pairs(fetcher, pairs, missing):
+
+    assert set(pairs) == {(row, col) for row, cols in missing.items() for col in cols}
+    for (row, col), (distance, time) in pairs.items():
+        assert (distance, time) == (1000 * row + col, 1000 * row + col + 1)
+    for origins, destinations in fetcher.requests:
+        assert len(origins) <= MAX_ORIGINS and len(destinations) <= MAX_DESTINATIONS
+        assert len(origins) * len(destinations) <= MAX_ELEMENTS
+
+
+def test_nearest_neighbour_pairs_are_packed():
+
+    # Each origin misses its own 5 nearest destinations (the next locations of a route)
+    addresses = [str(position) for position in range(100)]
+    missing = {row: {(row + step) % 100 for step in range(1, 6)} for row in range(100)}
+    fetcher = StandInFetcher()
+
+    pairs = fetch_pairs(fetcher, addresses, addresses, missing)
+
+    check_pairs(fetcher, pairs, missing)
+    assert len(fetcher.requests) <= 15  # One request per origin would be 100
+
+
+def test_full_matrix_is_tiled():
+
+    addresses = [str(position) for position in range(30)]
+    missing = {row: set(range(30)) for row in range(30)}
+    fetcher = StandInFetcher()
+
+    pairs = fetch_pairs(fetcher, addresses, addresses, missing)
+
+    check_pairs(fetcher, pairs, missing)
+    assert len(fetcher.requests) == len(plan_blocks(30, 30))
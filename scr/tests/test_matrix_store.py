@@ -0,0 +1,34 @@
+# Import necessary libraries
+import sqlite3
+
+from nodes.matrix_store import TravelTimeStore
+
+
+def count_pairs(path):
+
+    with sqlite3.connect(path) as connection:
+        return connection.execute('SELECT COUNT(*) FROM pairs').fetchone()[0]
+
+
+def test_expired_pairs_are_removed(tmp_path):
+
+    path = str(tmp_path / 'pairs.sqlite')
+    store = TravelTimeStore(path, max_age=3600)
+    store.put_many({('a', 'b'): (100, 10), ('b', 'a'): (110, 11)})
+
+    # Make one of the pairs older than the maximum age
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE pairs SET fetched_at = fetched_at - 7200 WHERE origin = 'a'")
+
+    assert count_pairs(path) == 2
+
+    # Expired pairs are deleted when new pairs are stored
+    store.put_many({('c', 'd'): (120, 12)})
+    assert count_pairs(path) == 2
+    assert store.get_many(['a', 'b', 'c'], ['a', 'b', 'd']) == {('b', 'a'): (110, 11), ('c', 'd'): (120, 12)}
+
+    # And when the store is opened
+    with sqlite3.connect(path) as connection:
+        connection.execute('UPDATE pairs SET fetched_at = fetched_at - 7200')
+    TravelTimeStore(path, max_age=3600)
+    assert count_pairs(path) == 0